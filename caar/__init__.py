@@ -5,9 +5,18 @@ from caar.cleanthermostat import cycles_text_to_binary
 from caar.cleanthermostat import dict_from_file
 from caar.cleanthermostat import detect_columns
 from caar.cleanthermostat import geospatial_text_to_binary
+from caar.cleanthermostat import iter_record_batches
 from caar.cleanthermostat import pickle_from_file
 from caar.cleanthermostat import sensor_text_to_binary
 
+from caar.detectioncache import clear_detection_cache
+
+from caar.dfcache import clear_df_cache
+from caar.dfcache import df_cache_info
+from caar.dfcache import resize_df_cache
+
+from caar.metadataregistry import clear_metadata_cache
+
 from caar.history import cycles_df_from_bin
 from caar.history import cycles_df_from_text
 from caar.history import create_cycles_df
@@ -21,6 +30,7 @@ from caar.history import sensors_df_from_text
 
 from caar.histsummary import days_of_data_by_id
 from caar.histsummary import consecutive_days_of_observations
+from caar.histsummary import consecutive_days_of_observations_for_each_id
 from caar.histsummary import daily_cycle_sensor_and_geospatial_obs_counts
 from caar.histsummary import daily_data_points_by_id
 from caar.histsummary import df_select_ids
@@ -28,9 +38,14 @@ from caar.histsummary import df_select_datetime_range
 from caar.histsummary import count_of_data_points_for_each_id
 from caar.histsummary import count_of_data_points_for_select_id
 from caar.histsummary import location_id_of_sensor
+from caar.histsummary import clear_daily_counts_cache
 
+from caar.timeseries import concurrency_profile
 from caar.timeseries import cycling_and_obs_arrays
+from caar.timeseries import fleet_arrays_from_file
+from caar.timeseries import fleet_cycling_and_obs_arrays
 from caar.timeseries import on_off_status
+from caar.timeseries import on_off_matrix
 from caar.timeseries import sensor_obs_arr_by_freq
 from caar.timeseries import plot_cycles_xy
 from caar.timeseries import plot_sensor_geo_xy
@@ -1,17 +1,30 @@
 from __future__ import absolute_import, division, print_function
 
 from collections import namedtuple, OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 import csv
 import datetime as dt
+import json
+from functools import partial
 from io import open
+from itertools import islice
+import locale
+import multiprocessing
 import os.path
 import pickle
 import re
+import shutil
 import sys
 
 import numpy as np
 import pandas as pd
 
+from caar.detectioncache import _detection_key, _load_detection,          \
+    _store_detection, _json_default
+from caar.metadataregistry import _METADATA_REGISTRY
 from caar.pandas_tseries_tools import _guess_datetime_format
 
 from caar.configparser_read import SENSOR_FIELDS,                             \
@@ -32,11 +45,58 @@ Cycle = namedtuple('Cycle', ['device_id', 'cycle_mode', 'start_time'])
 Sensor = namedtuple('Sensor', ['sensor_id', 'timestamp'])
 Geospatial = namedtuple('Geospatial', ['location_id', 'timestamp'])
 
+_ENGINES = ('python', 'vectorized')
+_BINARY_FORMATS = ('pickle', 'columnar')
+
+# Columnar store: a directory with a .npy file for each column and a JSON file
+# that describes the columns
+_COLUMNAR_STORE_EXTENSION = '.columns'
+_COLUMNAR_STORE_META_FILE = 'meta.json'
+_COLUMNAR_STORE_FORMAT = 'caar-columnar'
+_COLUMNAR_STORE_VERSION = 1
+
+# Bounds of the time stamps of records to keep (see _time_range())
+_TimeRange = namedtuple('_TimeRange', ['col', 'start', 'end', 'start_str',
+                                       'end_str', 'str_len', 'dt_format',
+                                       'time_sorted'])
+
+# Time stamp formats in which the order of the strings is the order in time
+_SORTABLE_DATETIME_FORMAT = re.compile(
+    r'%Y(?:[-/ :T]?%m(?:[-/ :T]?%d(?:[-/ :T]?%H(?:[-/ :T]?%M'
+    r'(?:[-/ :T]?%S)?)?)?)?)?$')
+
+# Number of lines of text that the vectorized engine parses and converts at once
+_VECTORIZED_CHUNK_LINES = 100000
+
+# Column detection reads the first lines of the file, plus blocks of lines
+# from evenly spaced positions further on, so that its cost does not depend
+# on the size of the file
+_DETECTION_SAMPLE_LINES = 1000
+_DETECTION_STRIDES = 4
+_DETECTION_STRIDE_LINES = 250
+
+_DIGITS = re.compile(r'\d')
+
+# Time stamp formats that are converted directly from the characters of the
+# time stamps, which is much faster than using the format
+_ISO_DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+_ISO_DATETIME = re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}$')
+_ISO_DATETIME_LENGTH = 19
+_ISO_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_ISO_SEPARATOR_POSITIONS = [4, 7, 13, 16]
+_ISO_SEPARATORS = [ord(char) for char in '--::']
+_ISO_DATE_TIME_SEPARATORS = [ord(char) for char in ' T']
+# Years of time stamps that can be represented as datetime64[ns]
+_DATETIME64_NS_YEARS = (1678, 2261)
+
 
 def dict_from_file(raw_file, cycle=None, states=None,
                    sensors_file=None, postal_file=None, auto=None,
                    id_col_heading=None, cycle_col_heading=None, encoding='UTF-8',
-                   delimiter=None, quote=None, cols_to_ignore=None, meta=False):
+                   delimiter=None, quote=None, cols_to_ignore=None, meta=False,
+                   engine='python', columnar=False, detection_cache=False,
+                   workers=1, start=None, end=None, time_sorted=False,
+                   ids=None):
     """Read delimited text file and create dict of dicts. One dict within the dict has the key 'cols_meta' and contains metadata. The other has the key 'records'. The records keys are named 2-tuples containing numeric IDs and time stamps (and cycle mode if a cycle mode is chosen with the argument 'cycle=', for cycling data). The values are either single values (floats, ints or strings) or tuples of these types.
 
     See the example .csv data files at https://github.com/nickpowersys/caar.
@@ -99,6 +159,22 @@ def dict_from_file(raw_file, cycle=None, states=None,
         quote (Optional[str]): Characters surrounding data fields. Default is none, but double and single quotes surrounding data fields are automatically detected and removed if they are present in the data rows. If any other character is specified in the keyword argument, and it surrounds data in any column, it will be removed instead.
 
         meta (Optional[bool]): An alternative way to return metadata about columns, besides the detect_columns() function. To use it, meta must be True, and a dict of metadata will be returned instead of a dict of records.
+
+        engine (Optional[str]): {'python', 'vectorized'} Parsing engine. The default, 'python', parses, validates and converts one record at a time. 'vectorized' reads the file in large blocks of lines and converts the IDs, time stamps and data in each block as whole NumPy arrays, which is much faster for large files. Both engines give the same records, including for files that follow the config.ini format, whose time stamps (and sensor and geospatial observations) are left as strings.
+
+        columnar (Optional[bool]): If True, the 'records' item is a ColumnarRecords object instead of a dict. It stores the IDs, time stamps, cycle modes and data in typed NumPy arrays, which take a fraction of the memory, while still allowing access to the records like a dict. Columnar records are always parsed with the 'vectorized' engine.
+
+        detection_cache (Optional[bool or str]): If True, the detected columns, delimiter, quote and time stamp format are saved in an on-disk cache (in the CACHE_DIR of the [detection_cache] section in config.ini) and reused by later calls for files with the same header, sampled content and detection arguments, so that detection is skipped. A directory path may be given instead of True. Entries can be removed with clear_detection_cache().
+
+        workers (Optional[int]): Number of processes that parse the file. If greater than 1, the lines after the header are split into that many byte ranges, which are parsed in parallel with the 'vectorized' engine, based on the columns detected once beforehand. Default: 1.
+
+        start (Optional[str or datetime.datetime]): Earliest time stamp (or starting time of a cycle) of the records in the output. Rows with earlier time stamps are discarded before any other values in them are converted. If the detected time stamp format sorts in the same order as the time stamps (such as '%Y-%m-%d %H:%M:%S'), the time stamps are compared as strings, without conversion.
+
+        end (Optional[str or datetime.datetime]): Latest time stamp (or starting time of a cycle) of the records in the output. Rows with later time stamps are discarded in the same way as for start.
+
+        time_sorted (Optional[bool]): If True, the rows of the file are taken to be sorted by time stamp, so that reading stops at the first row after end (with workers, at the first such row in each byte range). Default: False.
+
+        ids (Optional[list or other iterable of ints or strings]): IDs of the records in the output. Rows with other IDs are discarded while the file is parsed. The IDs are matched with the ID values as they appear in the file (ints are matched by their digits). If states are also specified, only the IDs that are in the states are kept.
     Returns:
         clean_dict (dict): Dict.
    """
@@ -107,40 +183,42 @@ def dict_from_file(raw_file, cycle=None, states=None,
                    ('cycle', cycle), ('postal_file', postal_file),
                    ('auto', auto), ('delimiter', delimiter), ('quote', quote),
                    ('meta', meta), ('id_col_heading', id_col_heading),
-                   ('encoding', encoding)])
+                   ('encoding', encoding), ('engine', engine),
+                   ('columnar', columnar), ('workers', workers),
+                   ('ids', ids)])
 
     if isinstance(meta, bool):
         pass
     else:
         raise ValueError('meta argument must be either False or True.')
 
+    _validate_engine(engine)
+    _validate_workers(workers)
+
     if states:
         try:
             assert kwargs.get('sensors_file'), kwargs.get('postal_file')
         except ValueError:
             _missing_sensors_or_postal_error_message()
 
-    header_kwargs = dict([('encoding', encoding), ('delimiter', delimiter),
-                          ('id_col_heading', id_col_heading), ('quote', quote),
-                          ('auto', auto), ('cycle', cycle)])
-    header, id_index = _header_and_id_col_if_heading_or_preconfig(raw_file,
-                                                                  **header_kwargs)
-
-    skwargs = dict([('encoding', encoding), ('delimiter', delimiter),
-                    ('quote', quote), ('cycle', cycle),
-                    ('id_col', id_index), ('auto', auto),
-                    ('cols_to_ignore', cols_to_ignore),
-                    ('cycle_col_heading', cycle_col_heading)])
-
-    # If delimiter and/or quote were not specified as kwargs,
-    # they will be set by call to _analyze_all_columns()
-    cols_meta, delim, quote = _analyze_all_columns(raw_file, header,
-                                                   **skwargs)
+    detection_kwargs = dict([('encoding', encoding), ('delimiter', delimiter),
+                             ('quote', quote), ('cycle', cycle),
+                             ('id_col_heading', id_col_heading),
+                             ('auto', auto),
+                             ('cols_to_ignore', cols_to_ignore),
+                             ('cycle_col_heading', cycle_col_heading),
+                             ('detection_cache', detection_cache)])
+    header, cols_meta, delim, quote, dt_format = _detect_all_columns(
+        raw_file, **detection_kwargs)
     if meta:
         return cols_meta
     else:
+        time_range = _time_range(cols_meta, dt_format, start=start, end=end,
+                                 time_sorted=time_sorted)
         for k, v in [('cols_meta', cols_meta), ('delimiter', delim),
-                     ('quote', quote), ('header', header)]:
+                     ('quote', quote), ('header', header),
+                     ('datetime_format', dt_format),
+                     ('time_range', time_range)]:
             kwargs[k] = v
 
         records = _dict_from_lines_of_text(raw_file, **kwargs)
@@ -154,11 +232,116 @@ def dict_from_file(raw_file, cycle=None, states=None,
         return container
 
 
+def iter_record_batches(raw_file, cycle=None, states=None, sensors_file=None,
+                        postal_file=None, auto=None, id_col_heading=None,
+                        cycle_col_heading=None, encoding='UTF-8',
+                        delimiter=None, quote=None, cols_to_ignore=None,
+                        batch_size=_VECTORIZED_CHUNK_LINES,
+                        detection_cache=False):
+    """Generator that reads a delimited text file in batches and yields the records in each batch as a ColumnarRecords object (see dict_from_file()), so that files larger than the available memory can be processed.
+
+    The columns are detected once, before the first batch. The records are validated in the same way as by dict_from_file(), including the filtering on states and cycle mode. Within a batch, the records are sorted by ID (and cycle mode) and time stamp, but a record in a later batch may come before a record in an earlier one. A column detected as ints is read as floats in any batch that contains values with decimals.
+
+    Args:
+        raw_file (str): The input file.
+
+        cycle (Optional[str]): The type of cycle that will be in the output. For example, example values that may be in the data file are 'Cool' and/or 'Heat'. If no specific value is specified as an argument, all modes will be in the output.
+
+        states (Optional[str]): One or more comma-separated, two-letter state abbreviations.
+
+        sensors_file (Optional[str]): Path of metadata file for sensors. Required if there is a states argument.
+
+        postal_file (Optional[str]): Metadata file for postal codes. Required if there is a states argument.
+
+        auto (Optional[Boolean]): {'cycles', 'sensors', 'geospatial', None} If one of the data types is specified, the function will detect which columns contain IDs, time stamps and values of interest automatically. If None (default), the order and headings of columns in the delimited text file and the config.ini file should match.
+
+        id_col_heading (Optional[str]): Indicates the heading in the header for the ID column.
+
+        cycle_col_heading (Optional[str]): Indicates the heading in the header for the cycle column.
+
+        encoding (Optional[str]): Encoding of the raw data file. Default: 'UTF-8'.
+
+        delimiter (Optional[str]): Character to be used as row delimiter. Default is None, but commas, tabs, pipes and spaces are automatically detected in that priority order) if no delimiter is specified.
+
+        quote (Optional[str]): Characters surrounding data fields. Default is none, but double and single quotes surrounding data fields are automatically detected and removed if they are present in the data rows. If any other character is specified in the keyword argument, and it surrounds data in any column, it will be removed instead.
+
+        cols_to_ignore (Optional[iterable of [str] or [int]]): Column headings or 0-based column indexes that should be left out of the output.
+
+        batch_size (Optional[int]): Number of lines of the file that are read for each batch, which is the maximum number of records in a batch. Default: 100,000.
+
+        detection_cache (Optional[bool or str]): If True (or a directory path), column detection results are saved and reused. See dict_from_file().
+
+    Yields:
+        batch (ColumnarRecords): Records from the next batch of lines that contains valid records.
+    """
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError('batch_size argument must be an int of at least 1.')
+
+    if states:
+        try:
+            assert sensors_file is not None, postal_file is not None
+        except ValueError:
+            _missing_sensors_or_postal_error_message()
+
+    detection_kwargs = dict([('encoding', encoding), ('delimiter', delimiter),
+                             ('quote', quote), ('cycle', cycle),
+                             ('id_col_heading', id_col_heading),
+                             ('auto', auto),
+                             ('cols_to_ignore', cols_to_ignore),
+                             ('cycle_col_heading', cycle_col_heading),
+                             ('detection_cache', detection_cache)])
+    header, cols_meta, delim, quote, dt_format = _detect_all_columns(
+        raw_file, **detection_kwargs)
+
+    kwargs = dict([('states', states), ('sensors_file', sensors_file),
+                   ('cycle', cycle), ('postal_file', postal_file),
+                   ('auto', auto), ('delimiter', delim), ('quote', quote),
+                   ('encoding', encoding), ('cols_meta', cols_meta),
+                   ('header', header), ('datetime_format', dt_format)])
+    data_type, chunk_kwargs = _vectorized_parse_kwargs(raw_file, **kwargs)
+
+    chunks = _record_columns_from_chunks(raw_file, header, delim, cols_meta,
+                                         chunk_lines=batch_size,
+                                         **chunk_kwargs)
+    for columns in chunks:
+        yield ColumnarRecords.from_column_chunks(
+            data_type, cols_meta, [columns],
+            preconfig=chunk_kwargs['preconfig'])
+
+
+def _detect_all_columns(raw_file, encoding='UTF-8', delimiter=None,
+                        quote=None, cycle=None, id_col_heading=None,
+                        auto=None, cols_to_ignore=None,
+                        cycle_col_heading=None, detection_cache=False):
+    """Returns the header, columns meta-data, delimiter, quote and time stamp
+    format of the raw file.
+    """
+    header_kwargs = dict([('encoding', encoding), ('delimiter', delimiter),
+                          ('id_col_heading', id_col_heading), ('quote', quote),
+                          ('auto', auto), ('cycle', cycle)])
+    header, id_index = _header_and_id_col_if_heading_or_preconfig(raw_file,
+                                                                  **header_kwargs)
+
+    skwargs = dict([('encoding', encoding), ('delimiter', delimiter),
+                    ('quote', quote), ('cycle', cycle),
+                    ('id_col', id_index), ('auto', auto),
+                    ('cols_to_ignore', cols_to_ignore),
+                    ('cycle_col_heading', cycle_col_heading),
+                    ('detection_cache', detection_cache)])
+
+    # If delimiter and/or quote were not specified as kwargs,
+    # they will be set by call to _analyze_all_columns()
+    cols_meta, delim, quote, dt_format = _analyze_all_columns(raw_file,
+                                                              header,
+                                                              **skwargs)
+    return header, cols_meta, delim, quote, dt_format
+
+
 def columns_summary(raw_file, cycle=None, states=None,
                     sensors_file=None, postal_file=None, auto=None,
                     encoding='UTF-8', delimiter=None, quote=None,
                     id_col_heading=None, cycle_col_heading=None,
-                    cols_to_ignore=None):
+                    cols_to_ignore=None, detection_cache=False):
     """Returns pandas DataFrame that summarizes the columns detected in the
     raw file: the headings, the positions, and types that are consistent with
     the actual data (ints, floats, alphabetic ('alpha_only'), time, and zip
@@ -191,6 +374,9 @@ def columns_summary(raw_file, cycle=None, states=None,
         delimiter (Optional[str]): Character to be used as row delimiter. Default is None, but commas, tabs, pipes and spaces are automatically detected in that priority order) if no delimiter is specified.
 
         quote (Optional[str]): Characters surrounding data fields. Default is none, but double and single quotes surrounding data fields are automatically detected and removed if they are present in the data rows. If any other character is specified in the keyword argument, and it surrounds data in any column, it will be removed instead.
+
+        detection_cache (Optional[bool or str]): If True (or a directory path), column detection results are saved and reused. See dict_from_file().
+
     Returns:
         pandas DataFrame
     """
@@ -200,7 +386,8 @@ def columns_summary(raw_file, cycle=None, states=None,
                              encoding=encoding, delimiter=delimiter,
                              quote=quote, id_col_heading=id_col_heading,
                              cycle_col_heading=cycle_col_heading,
-                             cols_to_ignore=cols_to_ignore)
+                             cols_to_ignore=cols_to_ignore,
+                             detection_cache=detection_cache)
     df = pd.DataFrame(columns)
 
     return df
@@ -210,9 +397,11 @@ def detect_columns(raw_file, cycle=None, states=None,
                    sensors_file=None, postal_file=None, auto=None,
                    encoding='UTF-8', delimiter=None, quote=None,
                    id_col_heading=None, cycle_col_heading=None,
-                   cols_to_ignore=None):
+                   cols_to_ignore=None, detection_cache=False):
     """Returns dict with columns that will be in dict based on dict_from_file() or pickle_from_file() and corresponding keyword arguments ('auto' is required, and must be a value other than None).
 
+    The types of the columns are detected from a sample of the lines in the file (the first lines, and blocks of lines spread through the rest of it). If a column detected as 'ints' has values with decimals outside of the sample, those values are read as floats.
+
     Args:
         raw_file (str): The input file.
 
@@ -237,6 +426,9 @@ def detect_columns(raw_file, cycle=None, states=None,
         delimiter (Optional[str]): Character to be used as row delimiter. Default is None, but commas, tabs, pipes and spaces are automatically detected in that priority order) if no delimiter is specified.
 
         quote (Optional[str]): Characters surrounding data fields. Default is none, but double and single quotes surrounding data fields are automatically detected and removed if they are present in the data rows. If any other character is specified in the keyword argument, and it surrounds data in any column, it will be removed instead.
+
+        detection_cache (Optional[bool or str]): If True (or a directory path), column detection results are saved and reused. See dict_from_file().
+
     Returns:
         column_dict (dict): Dict in which keys are one of: 'id_col', 'start_time_col', 'end_time_col', 'cycle_col', (the latter three are for cycles data only), 'time_col', or the headings of other columns found in the file. The values are dicts.
     """
@@ -246,7 +438,8 @@ def detect_columns(raw_file, cycle=None, states=None,
                    ('encoding', encoding), ('delimiter', delimiter),
                    ('quote', quote), ('id_col_heading', id_col_heading),
                    ('cycle_col_heading', cycle_col_heading),
-                   ('cols_to_ignore', cols_to_ignore)])
+                   ('cols_to_ignore', cols_to_ignore),
+                   ('detection_cache', detection_cache)])
 
     col_meta = dict_from_file(raw_file, **kwargs)
 
@@ -500,7 +693,10 @@ def pickle_from_file(raw_file, picklepath=None, cycle=None, states=None,
                      sensors_file=None, postal_file=None, auto=None,
                      id_col_heading=None, cycle_col_heading=None,
                      cols_to_ignore=None, encoding='UTF-8', delimiter=None,
-                     quote=None):
+                     quote=None, engine='python', columnar=False,
+                     detection_cache=False, workers=1,
+                     binary_format='pickle', start=None, end=None,
+                     time_sorted=False, ids=None):
     """Read delimited text file and create binary pickle file containing a dict of records. The keys are named tuples containing numeric IDs (strings) and time stamps.
 
     See the example .csv data files at https://github.com/nickpowersys/caar.
@@ -564,8 +760,26 @@ def pickle_from_file(raw_file, picklepath=None, cycle=None, states=None,
 
         quote (Optional[str]): Characters surrounding data fields. Default is none, but double and single quotes surrounding data fields are automatically detected and removed if they are present in the data rows. If any other character is specified in the keyword argument, and it surrounds data in any column, it will be removed instead.
 
+        engine (Optional[str]): {'python', 'vectorized'} Parsing engine. See dict_from_file().
+
+        columnar (Optional[bool]): If True, the records are pickled as a ColumnarRecords object (see dict_from_file()), which is much smaller and faster to load.
+
+        detection_cache (Optional[bool or str]): If True (or a directory path), column detection results are saved and reused. See dict_from_file().
+
+        workers (Optional[int]): Number of processes that parse the file. See dict_from_file().
+
+        binary_format (Optional[str]): {'pickle', 'columnar'} If 'columnar', the output is a directory instead of a pickle file. It contains a NumPy .npy file for each column and a JSON file with the columns metadata. The *_df_from_bin() functions load it without unpickling any records, using memory-mapped arrays. If no picklepath is specified, the generated name ends with '.columns' instead of '.pickle'. Default: 'pickle'.
+
+        start (Optional[str or datetime.datetime]): Earliest time stamp of the records in the output. See dict_from_file().
+
+        end (Optional[str or datetime.datetime]): Latest time stamp of the records in the output. See dict_from_file().
+
+        time_sorted (Optional[bool]): If True, reading stops after end. See dict_from_file().
+
+        ids (Optional[list or other iterable of ints or strings]): IDs of the records in the output. See dict_from_file().
+
     Returns:
-        picklepath (str): Path of output file.
+        picklepath (str): Path of output file (or directory).
     """
     if states:
         try:
@@ -579,7 +793,17 @@ def pickle_from_file(raw_file, picklepath=None, cycle=None, states=None,
                    ('auto', auto), ('id_col_heading', id_col_heading),
                    ('cycle_col_heading', cycle_col_heading),
                    ('cols_to_ignore', cols_to_ignore), ('encoding', encoding),
-                   ('delimiter', delimiter), ('quote', quote), ('meta', meta)])
+                   ('delimiter', delimiter), ('quote', quote),
+                   ('engine', engine), ('columnar', columnar),
+                   ('detection_cache', detection_cache), ('workers', workers),
+                   ('start', start), ('end', end),
+                   ('time_sorted', time_sorted), ('ids', ids)])
+
+    if binary_format not in _BINARY_FORMATS:
+        raise ValueError('binary_format argument must be one of: ' +
+                         ', '.join(_BINARY_FORMATS) + '.')
+    if binary_format == 'columnar':
+        kwargs['columnar'] = True
 
     records_or_meta = dict_from_file(raw_file, **kwargs)
 
@@ -588,13 +812,19 @@ def pickle_from_file(raw_file, picklepath=None, cycle=None, states=None,
     if picklepath is None:
         picklepath = _pickle_filename(raw_file, states=states, auto=auto,
                                       encoding=encoding)
+        if binary_format == 'columnar':
+            picklepath = (os.path.splitext(picklepath)[0] +
+                          _COLUMNAR_STORE_EXTENSION)
     if '2.7' in sys.version:
         str_picklepath = unicode(picklepath)
     else:
         str_picklepath = str(picklepath)
 
-    with open(str_picklepath, 'wb') as fout:
-        pickle.dump(records_or_meta, fout, pickle.HIGHEST_PROTOCOL)
+    if binary_format == 'columnar':
+        _save_columnar_store(records_or_meta, str_picklepath)
+    else:
+        with open(str_picklepath, 'wb') as fout:
+            pickle.dump(records_or_meta, fout, pickle.HIGHEST_PROTOCOL)
 
     return str_picklepath
 
@@ -628,7 +858,12 @@ def _dict_from_lines_of_text(raw_file, **kwargs):
     or 3) geospatial data. The keys of headers_functions are
     tuples containing strings with the column headings from the raw text files.
     """
-    if kwargs.get('auto'):
+    if (kwargs.get('engine') == 'vectorized' or kwargs.get('columnar') or
+            kwargs.get('workers', 1) > 1):
+        # Columns detected automatically or from config.ini are both described
+        # by cols_meta, which is all that the vectorized engine needs
+        cleaning_function = _clean_vectorized
+    elif kwargs.get('auto'):
         # Detect columns containing ID, cool/heat mode and time automatically
         data_func_map = {'sensors': _clean_sensors_auto_detect,
                          'cycles': _clean_cycles_auto_detect,
@@ -660,9 +895,12 @@ def _clean_cycles_auto_detect(raw_file, **kwargs):
     header, delimiter, cols_meta, cycle_mode, quote, encoding = (kwargs.get(k)
                                                                  for k in args)
     clean_args = [raw_file, header, delimiter, cols_meta]
-    thermos_ids = _sensors_ids_in_states(**kwargs)
+    thermos_ids = _ids_to_keep(_sensors_ids_in_states(**kwargs),
+                               ids=kwargs.get('ids'))
     clean_kwargs = {'cycle_mode': cycle_mode, 'thermos_ids': thermos_ids,
-                    'quote': quote, 'encoding': encoding}
+                    'quote': quote, 'encoding': encoding,
+                    'datetime_format': kwargs.get('datetime_format'),
+                    'time_range': kwargs.get('time_range')}
     clean_records = _validate_cycle_records_add_to_dict_auto(*clean_args,
                                                              **clean_kwargs)
     return clean_records
@@ -671,7 +909,9 @@ def _clean_cycles_auto_detect(raw_file, **kwargs):
 def _validate_cycle_records_add_to_dict_auto(raw_file, header, delimiter,
                                              cols_meta, cycle_mode=None,
                                              thermos_ids=None,
-                                             quote=None, encoding=None):
+                                             quote=None, encoding=None,
+                                             datetime_format=None,
+                                             time_range=None):
     clean_records = {}
     id_col, start_time_col = (cols_meta[k]['position'] for k in ['id',
                                                                  'start_time'])
@@ -679,14 +919,17 @@ def _validate_cycle_records_add_to_dict_auto(raw_file, header, delimiter,
     cycle_col = (cols_meta['cycle']['position'] if cols_meta.get('cycle')
                  else None)
 
-    dt_args = [raw_file, start_time_col, encoding, delimiter, quote, header]
-    datetime_format = _guess_datetime_format_from_first_record(*dt_args)
+    if datetime_format is None:
+        dt_args = [raw_file, start_time_col, encoding, delimiter, quote,
+                   header]
+        datetime_format = _guess_datetime_format_from_first_record(*dt_args)
     data_cols = _non_index_col_types(cols_meta, dt_format=datetime_format)
 
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
 
-        for line in lines:
+        for line in _lines_in_time_range(lines, time_range, delimiter, quote,
+                                         header):
             record = _record_from_line(line, delimiter, quote, header)
             if record and _validate_cycles_auto_record(record, id_col,
                                                        ids=thermos_ids,
@@ -733,9 +976,12 @@ def _clean_sensors_auto_detect(raw_file, **kwargs):
     header, delimiter, cols_meta, quote, encoding = (kwargs.get(k)
                                                      for k in args)
     clean_args = [raw_file, header, delimiter, cols_meta]
-    thermos_ids = _sensors_ids_in_states(**kwargs)
+    thermos_ids = _ids_to_keep(_sensors_ids_in_states(**kwargs),
+                               ids=kwargs.get('ids'))
     clean_kwargs = {'thermos_ids': thermos_ids, 'quote': quote,
-                    'encoding': encoding}
+                    'encoding': encoding,
+                    'datetime_format': kwargs.get('datetime_format'),
+                    'time_range': kwargs.get('time_range')}
     clean_records = _validate_sensors_add_to_dict_auto(*clean_args,
                                                        **clean_kwargs)
     return clean_records
@@ -743,18 +989,22 @@ def _clean_sensors_auto_detect(raw_file, **kwargs):
 
 def _validate_sensors_add_to_dict_auto(raw_file, header, delimiter, cols_meta,
                                        thermos_ids=None, quote=None,
-                                       encoding=None):
+                                       encoding=None,
+                                       datetime_format=None,
+                                       time_range=None):
     clean_records = {}
     id_col, time_col = (cols_meta[k]['position'] for k in ['id', 'time'])
     id_is_int = _id_is_int(cols_meta)
 
-    dt_args = [raw_file, time_col, encoding, delimiter, quote, header]
-    datetime_format = _guess_datetime_format_from_first_record(*dt_args)
+    if datetime_format is None:
+        dt_args = [raw_file, time_col, encoding, delimiter, quote, header]
+        datetime_format = _guess_datetime_format_from_first_record(*dt_args)
     data_cols = _non_index_col_types(cols_meta, dt_format=datetime_format)
 
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        for line in lines:
+        for line in _lines_in_time_range(lines, time_range, delimiter, quote,
+                                         header):
             record = _record_from_line(line, delimiter, quote, header)
             if record and _validate_sensors_auto_record(record, id_col,
                                                         ids=thermos_ids):
@@ -777,18 +1027,14 @@ def _non_index_col_types(cols_meta, dt_format=None):
     a primitive type (int or float), function or None. The primitive type or
     function will be used to change the types of each data element  (or if
     None, leave them as strings). The list is sorted ascending in the order
-    of the positions of columns."""
-
-    if format:
-        if '2.7' in sys.version:
-            _to_datetime.func_defaults = (dt_format,)
-        else:
-            _to_datetime.__defaults__ = (dt_format,)
+    of the positions of columns. Time stamps are converted with dt_format,
+    which is bound to the conversion function for this call only, so that
+    files with different formats can be read concurrently."""
 
     data_cols = set([meta['position'] for k, meta in cols_meta.items() if
                     k not in ['id', 'time', 'cycle', 'start_time']])
-    type_map = dict([('ints', int), ('floats', float),
-                     ('time', _to_datetime),
+    type_map = dict([('ints', _int_or_float), ('floats', float),
+                     ('time', partial(_to_datetime, dt_format=dt_format)),
                      ('numeric_commas', _remove_commas_from_int)])
     data_cols_types = dict([(meta['position'], type_map[meta['type']])
                             for meta in cols_meta.values()
@@ -804,13 +1050,97 @@ def _non_index_col_types(cols_meta, dt_format=None):
 
 
 def _to_datetime(date_str, dt_format=None):
-    return pd.to_datetime(date_str, format=dt_format).to_pydatetime()
+    """Returns datetime.datetime based on a time stamp and its format. If the
+    time stamp does not match the format, its format is inferred instead.
+    """
+    if dt_format in _ISO_DATETIME_FORMATS and _ISO_DATETIME.match(date_str):
+        return dt.datetime(int(date_str[0:4]), int(date_str[5:7]),
+                           int(date_str[8:10]), int(date_str[11:13]),
+                           int(date_str[14:16]), int(date_str[17:19]))
+    if dt_format is not None:
+        try:
+            return dt.datetime.strptime(date_str, dt_format)
+        except ValueError:
+            pass
+    return pd.to_datetime(date_str).to_pydatetime()
+
+
+def _to_datetime64(col, dt_format=None):
+    """Returns datetime64[ns] array converted from an array of time stamp
+    strings. ISO time stamps (see _ISO_DATETIME_FORMATS) are converted
+    directly from their characters. If any time stamp in the array deviates
+    from that form, or there is another format, pandas converts the array
+    based on the format. If any time stamp deviates from the format, pandas
+    infers the format of each time stamp instead.
+    """
+    if dt_format in _ISO_DATETIME_FORMATS:
+        times = _iso_datetime64(col)
+        if times is not None:
+            return times
+    try:
+        return pd.to_datetime(col, format=dt_format).values
+    except (ValueError, TypeError):
+        return pd.to_datetime(col).values
+
+
+def _iso_datetime64(col):
+    """Returns datetime64[ns] array computed from the characters in an array
+    of time stamps of the form YYYY-MM-DD HH:MM:SS (or with 'T' between the
+    date and time), or None if any of the time stamps is not in that form or
+    is not a valid date and time.
+    """
+    if col.dtype.kind == 'U':
+        char_type = np.uint32
+    elif col.dtype.kind == 'S':
+        char_type = np.uint8
+    else:
+        return None
+    width = col.dtype.itemsize // np.dtype(char_type).itemsize
+    if not len(col) or width < _ISO_DATETIME_LENGTH:
+        return None
+
+    chars = np.ascontiguousarray(col).view(char_type).reshape(-1, width)
+    if width > _ISO_DATETIME_LENGTH and chars[:, _ISO_DATETIME_LENGTH:].any():
+        return None
+    if not ((chars[:, _ISO_SEPARATOR_POSITIONS] == _ISO_SEPARATORS).all() and
+            np.in1d(chars[:, 10], _ISO_DATE_TIME_SEPARATORS).all()):
+        return None
+
+    digits = chars[:, _ISO_DIGIT_POSITIONS].astype(np.int32) - ord('0')
+    if not ((digits >= 0) & (digits <= 9)).all():
+        return None
+    pairs = digits[:, 0::2] * 10 + digits[:, 1::2]
+    year = pairs[:, 0] * 100 + pairs[:, 1]
+    month, day, hour, minute, second = (pairs[:, i] for i in range(2, 7))
+    if not ((year >= _DATETIME64_NS_YEARS[0]) &
+            (year <= _DATETIME64_NS_YEARS[1]) &
+            (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) &
+            (minute < 60) & (second < 60)).all():
+        return None
+
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    # Days past the end of a month, such as February 30
+    if (days.astype('datetime64[M]') != months).any():
+        return None
+
+    seconds = (days.astype(np.int64) * 86400 + hour * 3600 + minute * 60 +
+               second)
+    return (seconds * 10 ** 9).view('datetime64[ns]')
 
 
 def _remove_commas_from_int(numeric_string):
     return int(numeric_string.replace(',', ''))
 
 
+def _int_or_float(numeric_string):
+    # Types are detected from a sample, so decimals may appear later
+    try:
+        return int(numeric_string)
+    except ValueError:
+        return float(numeric_string)
+
+
 def _validate_sensors_auto_record(record, id_col, ids=None):
     """Validate that standardized record has expected data content.
     """
@@ -821,10 +1151,13 @@ def _clean_geospatial_auto_detect(raw_file, **kwargs):
     args = ['header', 'delimiter', 'cols_meta', 'quote', 'encoding']
     header, delimiter, cols_meta, quote, encoding = (kwargs.get(k)
                                                      for k in args)
-    location_ids = _locations_in_states(**kwargs)
+    location_ids = _ids_to_keep(_locations_in_states(**kwargs),
+                                ids=kwargs.get('ids'))
     clean_args = [raw_file, header, delimiter, cols_meta]
     clean_kwargs = {'location_ids': location_ids, 'quote': quote,
-                    'encoding': encoding}
+                    'encoding': encoding,
+                    'datetime_format': kwargs.get('datetime_format'),
+                    'time_range': kwargs.get('time_range')}
     clean_records = _validate_geospatial_add_to_dict_auto(*clean_args,
                                                           **clean_kwargs)
     return clean_records
@@ -832,18 +1165,22 @@ def _clean_geospatial_auto_detect(raw_file, **kwargs):
 
 def _validate_geospatial_add_to_dict_auto(raw_file, header, delimiter, cols_meta,
                                           location_ids=None, quote=None,
-                                          encoding=None):
+                                          encoding=None,
+                                          datetime_format=None,
+                                          time_range=None):
     clean_records = {}
     id_col, time_col = (cols_meta[k]['position'] for k in ['id', 'time'])
     id_is_int = _id_is_int(cols_meta)
 
-    dt_args = [raw_file, time_col, encoding, delimiter, quote, header]
-    datetime_format = _guess_datetime_format_from_first_record(*dt_args)
+    if datetime_format is None:
+        dt_args = [raw_file, time_col, encoding, delimiter, quote, header]
+        datetime_format = _guess_datetime_format_from_first_record(*dt_args)
     data_cols = _non_index_col_types(cols_meta, dt_format=datetime_format)
 
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        for line in lines:
+        for line in _lines_in_time_range(lines, time_range, delimiter, quote,
+                                         header):
             record = _record_from_line(line, delimiter, quote, header)
             if record and _validate_geospatial_auto_record(record, id_col,
                                                            ids=location_ids):
@@ -882,58 +1219,920 @@ def _record_vals(record, col_conversions):
         return record_vals[0]
 
 
-def _analyze_all_columns(raw_file, header, encoding='UTF-8', delimiter=None,
-                         quote=None, id_col=None, cycle=None, auto=None,
-                         cols_to_ignore=None, cycle_col_heading=None):
-    """Creates NumPy array with first 1,000 lines containing numeric data."""
+def _validate_engine(engine):
+    if engine not in _ENGINES:
+        raise ValueError('engine argument must be one of: ' +
+                         ', '.join(_ENGINES) + '.')
+
+
+def _validate_workers(workers):
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError('workers argument must be an int of at least 1.')
+
+
+def _clean_vectorized(raw_file, **kwargs):
+    """Returns dict of records with the same keys and values as the other
+    cleaning functions, based on blocks of lines in which each column is
+    converted as a whole. If the 'columnar' kwarg is True, returns the records
+    as a ColumnarRecords object instead.
+    """
+    args = ['header', 'delimiter', 'cols_meta']
+    header, delimiter, cols_meta = (kwargs.get(k) for k in args)
+    data_type, chunk_kwargs = _vectorized_parse_kwargs(raw_file, **kwargs)
+
+    workers = kwargs.get('workers') or 1
+    if workers > 1:
+        chunks = _record_columns_in_parallel(raw_file, header, delimiter,
+                                             cols_meta, workers,
+                                             **chunk_kwargs)
+    else:
+        chunks = _record_columns_from_chunks(raw_file, header, delimiter,
+                                             cols_meta, **chunk_kwargs)
+    if kwargs.get('columnar'):
+        return ColumnarRecords.from_column_chunks(
+            data_type, cols_meta, chunks,
+            preconfig=chunk_kwargs['preconfig'])
+
+    clean_records = {}
+    for columns in chunks:
+        clean_records.update(_records_dict_from_columns(columns, data_type))
+    return clean_records
+
+
+def _vectorized_parse_kwargs(raw_file, **kwargs):
+    """Returns the data type and a dict of the keyword arguments for
+    _record_columns_from_chunks(), including the IDs in the states (if any).
+    """
+    args = ['header', 'delimiter', 'cols_meta', 'cycle', 'quote', 'encoding',
+            'auto']
+    header, delimiter, cols_meta, cycle_mode, quote, encoding, auto = (
+        kwargs.get(k) for k in args)
+    data_type = auto if auto else _data_type_matching_header(header)
+    if data_type == 'geospatial':
+        ids_in_states = _locations_in_states(**kwargs)
+    else:
+        ids_in_states = _sensors_ids_in_states(**kwargs)
+    ids = _ids_to_keep(ids_in_states, ids=kwargs.get('ids'))
+
+    datetime_format = kwargs.get('datetime_format')
+    if datetime_format is None:
+        time_col = _time_col_position(cols_meta)
+        dt_args = [raw_file, time_col, encoding, delimiter, quote, header]
+        datetime_format = _guess_datetime_format_from_first_record(*dt_args)
+
+    chunk_kwargs = {'ids': ids, 'cycle_mode': cycle_mode, 'quote': quote,
+                    'encoding': encoding, 'dt_format': datetime_format,
+                    'time_range': kwargs.get('time_range'),
+                    'preconfig': not auto}
+    return data_type, chunk_kwargs
+
+
+def _time_col_position(cols_meta):
+    time_key = 'start_time' if cols_meta.get('start_time') else 'time'
+    return cols_meta[time_key]['position']
+
+
+def _time_range(cols_meta, dt_format, start=None, end=None,
+                time_sorted=False):
+    """Returns _TimeRange based on the start and end arguments of
+    dict_from_file(), or None if neither one is specified. If time stamps in
+    dt_format sort in the same order as strings, and the bounds can be written
+    exactly in dt_format, start_str and end_str are the bounds as strings.
+    """
+    if start is None and end is None:
+        return None
+    start, end = (pd.Timestamp(bound).to_pydatetime() if bound is not None
+                  else None for bound in (start, end))
+    if start is not None and end is not None and start > end:
+        raise ValueError('start must not be later than end.')
+
+    start_str = end_str = None
+    if dt_format and _SORTABLE_DATETIME_FORMAT.match(dt_format):
+        start_str, end_str = (bound.strftime(dt_format) if bound is not None
+                              else None for bound in (start, end))
+        exact = all(dt.datetime.strptime(bound_str, dt_format) == bound
+                    for bound, bound_str in [(start, start_str),
+                                             (end, end_str)]
+                    if bound is not None)
+        if not exact:
+            start_str = end_str = None
+    str_len = len(start_str or end_str) if start_str or end_str else None
+    return _TimeRange(col=_time_col_position(cols_meta), start=start, end=end,
+                      start_str=start_str, end_str=end_str, str_len=str_len,
+                      dt_format=dt_format, time_sorted=time_sorted)
+
+
+def _time_range_position(time_str, time_range):
+    """Returns -1 if the time stamp (string) is before the time range, 1 if it
+    is after it, or 0 if it is within it. Time stamps with the same length as
+    the bounds in string form are compared as strings."""
+    if time_range.str_len is not None and len(time_str) == time_range.str_len:
+        time, start, end = time_str, time_range.start_str, time_range.end_str
+    else:
+        time = _to_datetime(time_str, dt_format=time_range.dt_format)
+        start, end = time_range.start, time_range.end
+    if start is not None and time < start:
+        return -1
+    elif end is not None and time > end:
+        return 1
+    return 0
+
+
+def _time_range_positions(times, time_range):
+    """Returns int8 array of the results of _time_range_position() for an
+    array of time stamp strings. The strings are only converted if any of them
+    is not in the same form as the bounds in string form."""
+    if (time_range.str_len is not None and
+            (np.char.str_len(times) == time_range.str_len).all()):
+        start, end = time_range.start_str, time_range.end_str
+    else:
+        times = _to_datetime64(times, dt_format=time_range.dt_format)
+        start, end = (np.datetime64(bound, 'ns') if bound is not None
+                      else None
+                      for bound in (time_range.start, time_range.end))
+    positions = np.zeros(len(times), dtype=np.int8)
+    if start is not None:
+        positions[times < start] = -1
+    if end is not None:
+        positions[times > end] = 1
+    return positions
+
+
+def _lines_in_time_range(lines, time_range, delimiter, quote, header):
+    """Returns the lines (an iterable) unchanged if there is no time range.
+    Otherwise, returns a generator of the lines whose time stamps are within
+    the time range (see _time_range_filtered_lines())."""
+    if time_range is None:
+        return lines
+    return _time_range_filtered_lines(lines, time_range, delimiter, quote,
+                                      header)
+
+
+def _time_range_filtered_lines(lines, time_range, delimiter, quote, header):
+    """Generator of lines whose time stamps are within the time range, so
+    that the values in the other lines are never converted. Lines without a
+    valid record are passed on, to be skipped by the caller. If the records
+    are sorted by time, no more lines are read after the first record past the
+    end of the range."""
+    for line in lines:
+        record = _record_from_line(line, delimiter, quote, header)
+        if record:
+            position = _time_range_position(record[time_range.col],
+                                            time_range)
+            if position > 0 and time_range.time_sorted:
+                break
+            elif position:
+                continue
+        yield line
+
+
+def _record_columns_from_chunks(raw_file, header, delimiter, cols_meta,
+                                ids=None, cycle_mode=None, quote=None,
+                                encoding=None, dt_format=None,
+                                time_range=None, preconfig=False,
+                                chunk_lines=_VECTORIZED_CHUNK_LINES):
+    """Generator that reads the raw file in blocks of lines and yields a dict
+    of NumPy arrays (see _columns_from_records()) for each block that contains
+    valid records.
+    """
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
+        for columns in _record_columns_from_lines(lines, header, delimiter,
+                                                  cols_meta, ids=ids,
+                                                  cycle_mode=cycle_mode,
+                                                  quote=quote,
+                                                  dt_format=dt_format,
+                                                  time_range=time_range,
+                                                  preconfig=preconfig,
+                                                  chunk_lines=chunk_lines):
+            yield columns
+
+
+def _record_columns_from_lines(lines, header, delimiter, cols_meta, ids=None,
+                               cycle_mode=None, quote=None, dt_format=None,
+                               time_range=None, preconfig=False,
+                               chunk_lines=_VECTORIZED_CHUNK_LINES):
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            break
+        records = _records_from_chunk(chunk, delimiter, quote, header)
+        columns = _columns_from_records(records, cols_meta, ids=ids,
+                                        cycle_mode=cycle_mode,
+                                        dt_format=dt_format,
+                                        time_range=time_range,
+                                        preconfig=preconfig)
+        if columns is not None:
+            yield columns
+        if (time_range is not None and time_range.time_sorted and records and
+                _time_range_position(records[-1][time_range.col],
+                                     time_range) > 0):
+            break
 
-        delimiter, quote = _determine_delimiter_and_quote(lines, delimiter,
-                                                          quote, auto=auto)
+
+def _record_columns_in_parallel(raw_file, header, delimiter, cols_meta,
+                                workers, ids=None, cycle_mode=None, quote=None,
+                                encoding=None, dt_format=None,
+                                time_range=None, preconfig=False):
+    """Returns list of dicts of NumPy arrays (see _columns_from_records()).
+    The lines after the header are split into one byte range per worker, and
+    the ranges are parsed in a pool of processes. The dicts are in the same
+    order as the lines in the file.
+    """
+    range_args = [(raw_file, start, end, header, delimiter, cols_meta, ids,
+                   cycle_mode, quote, encoding, dt_format, time_range,
+                   preconfig)
+                  for start, end in _newline_aligned_byte_ranges(raw_file,
+                                                                 workers)]
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        columns_by_range = pool.map(_record_columns_in_byte_range, range_args)
+    finally:
+        pool.close()
+        pool.join()
+
+    return [columns for range_columns in columns_by_range
+            for columns in range_columns]
+
+
+def _newline_aligned_byte_ranges(raw_file, number_of_ranges):
+    """Returns list of (start, end) byte positions that split the part of the
+    file after the header into approximately equal ranges. Each range starts
+    at the beginning of a line and ends after the last newline in it.
+    """
+    file_size = os.path.getsize(raw_file)
+    with open(raw_file, 'rb') as f:
+        _ = f.readline()
+        starts = [f.tell()]
+        range_size = (file_size - starts[0]) // number_of_ranges
+        for i in range(1, number_of_ranges):
+            position = max(starts[0] + i * range_size, starts[-1])
+            f.seek(position)
+            # The range starts after the end of the line containing position
+            _ = f.readline()
+            starts.append(f.tell())
+
+    ends = starts[1:] + [file_size]
+    return [(start, end) for start, end in zip(starts, ends) if end > start]
+
+
+def _record_columns_in_byte_range(range_args):
+    """Returns list of dicts of NumPy arrays for the lines within a byte range
+    of the raw file. Runs in a worker process of
+    _record_columns_in_parallel().
+    """
+    (raw_file, start, end, header, delimiter, cols_meta, ids, cycle_mode,
+     quote, encoding, dt_format, time_range, preconfig) = range_args
+    with open(raw_file, 'rb') as f:
+        f.seek(start)
+        lines = _decoded_lines_in_byte_range(f, end - start,
+                                             _text_encoding(encoding))
+        return list(_record_columns_from_lines(lines, header, delimiter,
+                                               cols_meta, ids=ids,
+                                               cycle_mode=cycle_mode,
+                                               quote=quote,
+                                               dt_format=dt_format,
+                                               time_range=time_range,
+                                               preconfig=preconfig))
+
+
+def _decoded_lines_in_byte_range(f, range_size, encoding):
+    bytes_read = 0
+    for line in f:
+        if bytes_read >= range_size:
+            break
+        bytes_read += len(line)
+        yield _decoded_line(line, encoding)
+
+
+def _records_from_chunk(lines, delimiter, quote, header):
+    """Returns list of records (lists of strings) parsed from a block of lines.
+    The same records are kept as with _record_from_line().
+    """
+    strip_chars = delimiter + '\n'
+    lines = [line.rstrip(strip_chars) for line in lines if _DIGITS.search(line)]
+    parsed = csv.reader(lines, delimiter=delimiter, quotechar=quote,
+                        skipinitialspace=True)
+    header_len = len(header)
+    return [record for record in parsed
+            if len(record) == header_len and all(record)]
+
+
+def _columns_from_records(records, cols_meta, ids=None, cycle_mode=None,
+                          dt_format=None, time_range=None, preconfig=False):
+    """Returns dict of NumPy arrays (see _converted_columns()) based on
+    records from _records_from_chunk(). Records whose ID, cycle mode or time
+    stamp do not match the arguments are left out before the columns are
+    converted. Returns None if no records remain.
+    """
+    if not records:
+        return None
+
+    str_cols = [np.array(col) for col in zip(*records)]
+
+    id_col = _id_col_position(cols_meta)
+    cycle_col = _cycle_col_position(cols_meta, preconfig=preconfig)
+
+    keep = None
+    if ids is not None:
+        keep = np.in1d(str_cols[id_col], list(ids))
+    if cycle_mode and cycle_col is not None:
+        mode_match = str_cols[cycle_col] == cycle_mode
+        keep = mode_match if keep is None else keep & mode_match
+    if time_range is not None:
+        in_range = _time_range_positions(str_cols[time_range.col],
+                                         time_range) == 0
+        keep = in_range if keep is None else keep & in_range
+    if keep is not None:
+        if not keep.any():
+            return None
+        str_cols = [col[keep] for col in str_cols]
+
+    return _converted_columns(str_cols, cols_meta, dt_format=dt_format,
+                              preconfig=preconfig)
+
+
+def _converted_columns(str_cols, cols_meta, dt_format=None, preconfig=False):
+    """Returns dict of NumPy arrays with the keys 'ids', 'cycle_modes' (None
+    unless there is a cycle column), 'times' (datetime64, unless preconfig is
+    True) and 'data' (list of
+    2-tuples of column position and array, in column order), based on a list
+    of arrays of strings for all of the columns in the file.
+
+    If preconfig is True (the columns follow config.ini), the values are
+    kept as they are by _clean_cycles(), _clean_sensors() and
+    _clean_geospatial(): the time stamps remain strings, as do the
+    observations of sensors and geospatial files.
+    """
+    id_vals = str_cols[_id_col_position(cols_meta)]
+    if _id_is_int(cols_meta):
+        id_vals = id_vals.astype(np.int64)
+
+    cycle_col = _cycle_col_position(cols_meta, preconfig=preconfig)
+    time_col = _time_col_position(cols_meta)
+    if preconfig:
+        times = str_cols[time_col]
+    else:
+        times = _column_as_type(str_cols[time_col], 'time',
+                                dt_format=dt_format)
+    data_cols = _non_index_col_positions(cols_meta)
+    if preconfig and not cols_meta.get('start_time'):
+        data_cols = [(col, None) for col, _ in data_cols]
+
+    columns = {'ids': id_vals,
+               'cycle_modes': (str_cols[cycle_col] if cycle_col is not None
+                               else None),
+               'times': times,
+               'data': [(col, _column_as_type(str_cols[col], col_type,
+                                              dt_format=dt_format))
+                        for col, col_type in data_cols]}
+    return columns
+
+
+def _cycle_col_position(cols_meta, preconfig=False):
+    """Returns the position of the cycle mode column, or None. Cycles files
+    that follow config.ini always have their cycle mode in the key, even if
+    no cycle mode was chosen with the argument 'cycle='."""
+    if cols_meta.get('cycle'):
+        return cols_meta['cycle']['position']
+    elif preconfig and cols_meta.get('start_time'):
+        return CYCLE_TYPE_INDEX
+    else:
+        return None
+
+
+def _non_index_col_positions(cols_meta):
+    """Returns list of 2-tuples of position and type (as in cols_meta) for
+    the data columns, sorted by position."""
+    return sorted((meta['position'], meta['type'])
+                  for k, meta in cols_meta.items()
+                  if k not in ['id', 'time', 'cycle', 'start_time'])
+
+
+def _column_as_type(col, col_type, dt_format=None):
+    """Returns NumPy array converted from array of strings, according to the
+    column type in cols_meta. Columns of other types are left as strings."""
+    if col_type == 'ints':
+        try:
+            return col.astype(np.int64)
+        except ValueError:
+            # Types are detected from a sample, so decimals may appear later
+            return col.astype(np.float64)
+    elif col_type == 'floats':
+        return col.astype(np.float64)
+    elif col_type == 'numeric_commas':
+        return np.char.replace(col, ',', '').astype(np.int64)
+    elif col_type == 'time':
+        return _to_datetime64(col, dt_format=dt_format)
+    else:
+        return col
+
+
+def _records_dict_from_columns(columns, data_type):
+    """Returns dict of records with named tuples as keys, based on the dict of
+    arrays from _columns_from_records()."""
+    keys = _record_keys(data_type, columns['ids'], columns['times'],
+                        cycle_modes=columns['cycle_modes'])
+    vals = _record_values([col for _, col in columns['data']])
+    return dict(zip(keys, vals))
+
+
+def _record_keys(data_type, ids, times, cycle_modes=None):
+    """Returns list of Cycle, Sensor or Geospatial named tuples based on arrays
+    of IDs, time stamps (datetime64, or strings) and cycle modes."""
+    id_vals = ids.tolist()
+    times = _as_pyvalues(times)
+    if data_type == 'cycles':
+        if cycle_modes is None:
+            cycle_modes = [None] * len(id_vals)
+        else:
+            cycle_modes = cycle_modes.tolist()
+        keys = [Cycle(device_id=id_val, cycle_mode=mode, start_time=time)
+                for id_val, mode, time in zip(id_vals, cycle_modes, times)]
+    elif data_type == 'sensors':
+        keys = [Sensor(sensor_id=id_val, timestamp=time)
+                for id_val, time in zip(id_vals, times)]
+    else:
+        keys = [Geospatial(location_id=id_val, timestamp=time)
+                for id_val, time in zip(id_vals, times)]
+    return keys
+
+
+def _record_values(data_arrays):
+    """Returns list of record values (single values, or tuples if there is
+    more than one data column), as in _record_vals()."""
+    data = [_as_pyvalues(col) for col in data_arrays]
+    if len(data) > 1:
+        return list(zip(*data))
+    else:
+        return data[0]
+
+
+def _as_pyvalues(arr):
+    """Returns list of Python values (datetime.datetime for datetime64)."""
+    if arr.dtype.kind == 'M':
+        return pd.DatetimeIndex(arr).to_pydatetime().tolist()
+    else:
+        return arr.tolist()
+
+
+class ColumnarRecords(Mapping):
+    """Records stored as typed NumPy arrays rather than as a dict with a named
+    tuple for each record. It is returned by dict_from_file() within the
+    'records' item when the argument columnar=True.
+
+    The arrays are sorted by ID, cycle mode (for cycles) and time stamp. Each
+    combination of these appears only once, with the last value found in the
+    file, just as with the keys of the dict of records. The records can also
+    be accessed like that dict: the keys are the same Cycle, Sensor or
+    Geospatial named tuples, and the values are the same single values or
+    tuples, but they are only created when they are requested.
+
+    Attributes:
+        data_type (str): 'cycles', 'sensors' or 'geospatial'.
+
+        cols_meta (dict): Column metadata, as returned by detect_columns().
+
+        ids (NumPy array): IDs (int64, or strings).
+
+        cycle_modes (NumPy array or None): Cycle modes (strings), if there is a cycle column.
+
+        times (NumPy array): Time stamps, or starting times of cycles (datetime64[ns], or strings if the columns follow config.ini).
+
+        data (OrderedDict): Column headings as keys and NumPy arrays as values, in column order.
+    """
+
+    def __init__(self, data_type, cols_meta, ids, times, data,
+                 cycle_modes=None, id_offsets=None):
+        self.data_type = data_type
+        self.cols_meta = cols_meta
+        self._ids = ids
+        self._times = times
+        self._cycle_modes = cycle_modes
+        self._data = data
+        # Tuple of the unique IDs and the offset of the first record of each
+        # one (followed by the number of records), created when it is needed
+        # unless it was saved with the arrays.
+        self._id_offsets = id_offsets
+        # Records removed with pop() are only taken out of the arrays the
+        # next time that the arrays are used.
+        self._removed = None
+        self._rows = None
+
+    @classmethod
+    def from_column_chunks(cls, data_type, cols_meta, chunks,
+                           preconfig=False):
+        """Returns ColumnarRecords based on an iterable of dicts of arrays
+        from _columns_from_records()."""
+        chunks = list(chunks)
+        if not chunks:
+            positions = [meta['position'] for meta in cols_meta.values()]
+            cycle_col = _cycle_col_position(cols_meta, preconfig=preconfig)
+            if cycle_col is not None:
+                positions.append(cycle_col)
+            empty_cols = [np.array([], dtype='U')] * (max(positions) + 1)
+            chunks = [_converted_columns(empty_cols, cols_meta,
+                                         preconfig=preconfig)]
+
+        ids = np.concatenate([chunk['ids'] for chunk in chunks])
+        times = np.concatenate([chunk['times'] for chunk in chunks])
+        if chunks[0]['cycle_modes'] is not None:
+            cycle_modes = np.concatenate([chunk['cycle_modes'] for chunk in chunks])
+        else:
+            cycle_modes = None
+        data_cols = [np.concatenate(cols) for cols in
+                     zip(*[[col for _, col in chunk['data']] for chunk in chunks])]
+
+        order = _sorted_unique_record_order(ids, times, cycle_modes=cycle_modes)
+        headings = [_cols_meta_heading(cols_meta, position) for position, _
+                    in chunks[0]['data']]
+        data = OrderedDict((heading, col[order]) for heading, col
+                           in zip(headings, data_cols))
+        cycle_modes = cycle_modes[order] if cycle_modes is not None else None
+        return cls(data_type, cols_meta, ids[order], times[order], data,
+                   cycle_modes=cycle_modes)
+
+    @property
+    def ids(self):
+        self._remove_popped_records()
+        return self._ids
+
+    @property
+    def times(self):
+        self._remove_popped_records()
+        return self._times
+
+    @property
+    def cycle_modes(self):
+        self._remove_popped_records()
+        return self._cycle_modes
+
+    @property
+    def data(self):
+        self._remove_popped_records()
+        return self._data
+
+    def select_ids(self, ids):
+        """Returns ColumnarRecords with only the records for the IDs given in
+        the argument (an iterable of ints or strings).
+
+        Since the records of each ID are contiguous, only the slices of the
+        arrays for those IDs are read, which matters when the arrays are
+        memory-mapped from a columnar store.
+        """
+        unique_ids, offsets = self.id_offsets()
+        id_positions = dict((id_val, i) for i, id_val
+                            in enumerate(unique_ids.tolist()))
+        positions = sorted(set(id_positions[id_val] for id_val in ids
+                               if id_val in id_positions))
+        slices = [slice(offsets[i], offsets[i + 1]) for i in positions]
+        return self._select_slices(slices)
+
+    def id_offsets(self):
+        """Returns tuple of a NumPy array of the unique IDs, in sorted order,
+        and a NumPy array of the offset of the first record for each ID,
+        followed by the number of records."""
+        ids = self.ids
+        if self._id_offsets is None:
+            unique_ids, starts = np.unique(ids, return_index=True)
+            self._id_offsets = (unique_ids,
+                                np.append(starts, len(ids)).astype(np.int64))
+        return self._id_offsets
+
+    def _select_slices(self, slices):
+        def concatenated(col):
+            if not slices:
+                return np.array(col[:0])
+            return np.concatenate([col[s] for s in slices])
+
+        cycle_modes = (concatenated(self.cycle_modes)
+                       if self.cycle_modes is not None else None)
+        data = OrderedDict((heading, concatenated(col)) for heading, col
+                           in self.data.items())
+        return ColumnarRecords(self.data_type, self.cols_meta,
+                               concatenated(self.ids),
+                               concatenated(self.times), data,
+                               cycle_modes=cycle_modes)
+
+    def _select(self, keep):
+        cycle_modes = (self.cycle_modes[keep] if self.cycle_modes is not None
+                       else None)
+        data = OrderedDict((heading, col[keep]) for heading, col
+                           in self.data.items())
+        return ColumnarRecords(self.data_type, self.cols_meta, self.ids[keep],
+                               self.times[keep], data, cycle_modes=cycle_modes)
+
+    def keys(self):
+        self._remove_popped_records()
+        return _record_keys(self.data_type, self._ids, self._times,
+                            cycle_modes=self._cycle_modes)
+
+    def values(self):
+        self._remove_popped_records()
+        return _record_values(list(self._data.values()))
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        removed = 0 if self._removed is None else int(self._removed.sum())
+        return len(self._ids) - removed
+
+    def __getitem__(self, key):
+        row = self._row_index()[key]
+        return _record_values([col[row:row + 1] for col in self._data.values()])[0]
+
+    def __delitem__(self, key):
+        row = self._row_index().pop(key)
+        if self._removed is None:
+            self._removed = np.zeros(len(self._ids), dtype=bool)
+        self._removed[row] = True
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def _row_index(self):
+        if self._rows is None:
+            self._remove_popped_records()
+            self._rows = dict((key, row) for row, key in enumerate(self.keys()))
+        return self._rows
+
+    def _remove_popped_records(self):
+        if self._removed is not None:
+            keep = ~self._removed
+            self._removed = None
+            self._rows = None
+            self._id_offsets = None
+            selected = self._select(keep)
+            self._ids, self._times = selected._ids, selected._times
+            self._cycle_modes, self._data = selected._cycle_modes, selected._data
+
+    def __getstate__(self):
+        self._remove_popped_records()
+        state = self.__dict__.copy()
+        state['_rows'] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('_id_offsets', None)
+        self.__dict__.update(state)
+
+    def __repr__(self):
+        return '<ColumnarRecords: {} {} records>'.format(len(self),
+                                                        self.data_type)
+
+
+def _cols_meta_heading(cols_meta, position):
+    for meta in cols_meta.values():
+        if meta['position'] == position:
+            return meta['heading']
+
+
+def _sorted_unique_record_order(ids, times, cycle_modes=None):
+    """Returns array of indexes that sorts records by ID, cycle mode and time,
+    and keeps only the last of any records with the same ID, cycle mode and
+    time (as with a dict in which they are the keys)."""
+    sort_keys = [times] + ([cycle_modes] if cycle_modes is not None else []) + [ids]
+    # lexsort is stable, so records with the same keys remain in file order
+    order = np.lexsort(sort_keys)
+    if len(order) > 1:
+        same_as_next = np.ones(len(order) - 1, dtype=bool)
+        for sort_key in sort_keys:
+            sorted_key = sort_key[order]
+            same_as_next &= sorted_key[1:] == sorted_key[:-1]
+        is_last = np.ones(len(order), dtype=bool)
+        is_last[:-1] = ~same_as_next
+        order = order[is_last]
+    return order
+
+
+def _save_columnar_store(container, path):
+    """Saves a dict from dict_from_file(columnar=True) as a directory
+    containing a .npy file for each array of the ColumnarRecords and a JSON
+    file with the columns metadata and the names of the array files. The
+    directory is written under a temporary name and then renamed.
+    """
+    records = container['records']
+    array_files = OrderedDict([('ids', 'ids.npy'), ('times', 'times.npy')])
+    arrays = {'ids.npy': records.ids, 'times.npy': records.times}
+    if records.cycle_modes is not None:
+        array_files['cycle_modes'] = 'cycle_modes.npy'
+        arrays['cycle_modes.npy'] = records.cycle_modes
+    data_files = []
+    for i, (heading, col) in enumerate(records.data.items()):
+        data_file = 'data_{}.npy'.format(i)
+        data_files.append([heading, data_file])
+        arrays[data_file] = col
+    array_files['data'] = data_files
+    # Index of the rows of each ID, so that the records for a few IDs can be
+    # read without reading all of the records
+    unique_ids, offsets = records.id_offsets()
+    array_files['id_offsets'] = ['id_index.npy', 'id_offsets.npy']
+    arrays['id_index.npy'] = unique_ids
+    arrays['id_offsets.npy'] = offsets
+    meta = OrderedDict([('format', _COLUMNAR_STORE_FORMAT),
+                        ('version', _COLUMNAR_STORE_VERSION),
+                        ('data_type', records.data_type),
+                        ('length', len(records)),
+                        ('cols_meta', container['cols_meta']),
+                        ('arrays', array_files)])
+
+    if os.path.exists(path) and not _is_columnar_store(path):
+        raise ValueError(path + ' exists and is not a columnar store.')
+    temp_path = path + '.tmp{}'.format(os.getpid())
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+    for array_file, arr in arrays.items():
+        np.save(os.path.join(temp_path, array_file), arr)
+    with open(os.path.join(temp_path, _COLUMNAR_STORE_META_FILE), 'w',
+              encoding='UTF-8') as fout:
+        fout.write(_unicode_str(json.dumps(meta, default=_json_default)))
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temp_path, path)
+
+
+def _load_columnar_store(path, mmap=True):
+    """Returns dict with the same items as dict_from_file(columnar=True),
+    based on a directory created by _save_columnar_store(). If mmap is True,
+    the arrays are memory-mapped, so that only the parts that are used are
+    read from disk.
+    """
+    meta = _columnar_store_meta(path)
+    if meta is None:
+        raise ValueError(path + ' is not a columnar store.')
+    mmap_mode = 'r' if mmap and meta['length'] else None
+    array_files = meta['arrays']
+
+    def load(array_file):
+        return np.load(os.path.join(path, array_file), mmap_mode=mmap_mode)
+
+    cycle_modes = (load(array_files['cycle_modes'])
+                   if array_files.get('cycle_modes') else None)
+    data = OrderedDict((heading, load(data_file)) for heading, data_file
+                       in array_files['data'])
+    # The index is small, so it is read into memory
+    id_offsets = (tuple(np.load(os.path.join(path, index_file))
+                        for index_file in array_files['id_offsets'])
+                  if array_files.get('id_offsets') else None)
+    records = ColumnarRecords(meta['data_type'], meta['cols_meta'],
+                              load(array_files['ids']),
+                              load(array_files['times']), data,
+                              cycle_modes=cycle_modes, id_offsets=id_offsets)
+    return {'cols_meta': meta['cols_meta'], 'records': records}
+
+
+def _is_columnar_store(path):
+    return _columnar_store_meta(path) is not None
+
+
+def _columnar_store_meta(path):
+    meta_path = os.path.join(str(path), _COLUMNAR_STORE_META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, encoding='UTF-8') as fin:
+        meta = json.load(fin, object_pairs_hook=OrderedDict)
+    if meta.get('format') != _COLUMNAR_STORE_FORMAT:
+        return None
+    return meta
+
+
+def _unicode_str(text):
+    if '2.7' in sys.version and isinstance(text, str):
+        return text.decode('UTF-8')
+    return text
+
+
+def _analyze_all_columns(raw_file, header, encoding='UTF-8', delimiter=None,
+                         quote=None, id_col=None, cycle=None, auto=None,
+                         cols_to_ignore=None, cycle_col_heading=None,
+                         detection_cache=False):
+    """Detects the columns based on a single, bounded sample of records
+    (see _detection_sample_lines()), which is read once and shared by each of
+    the detection steps. Returns the columns meta-data, delimiter, quote and
+    the format of the time stamps. If detection_cache is True (or a
+    directory), the results are looked up in and saved to the detection cache.
+    """
+    sample_lines = _detection_sample_lines(raw_file, encoding=encoding)
+
+    if detection_cache:
+        cache_dir = None if detection_cache is True else detection_cache
+        detection_args = [encoding, delimiter, quote, id_col, cycle, auto,
+                          cols_to_ignore, cycle_col_heading]
+        key = _detection_key(header, sample_lines, detection_args)
+        detection = _load_detection(key, cache_dir=cache_dir)
+        if detection is not None:
+            return detection
+
+    sample_records, delimiter, quote = _detection_sample(sample_lines, header,
+                                                         delimiter=delimiter,
+                                                         quote=quote,
+                                                         auto=auto)
 
     cycle_col = _detect_cycle_col(raw_file, header, cycle, delimiter,
-                                  auto=auto, encoding=encoding, quote=quote,
+                                  sample_records, auto=auto, encoding=encoding,
+                                  quote=quote,
                                   cycle_col_heading=cycle_col_heading)
 
-    sample_kwargs = {'quote': quote, 'encoding': encoding}
-    timestamp_cols = _detect_time_stamps(raw_file, header, delimiter,
-                                         **sample_kwargs)
-    data_cols = _detect_column_data_types(raw_file, header, timestamp_cols,
-                                          delimiter, cols_to_ignore,
-                                          **sample_kwargs)
-    id_other_cols = _detect_id_other_cols(raw_file, header, timestamp_cols,
-                                          data_cols, id_col=id_col,
-                                          cycle_col=cycle_col,
-                                          delimiter=delimiter,
-                                          encoding=encoding, quote=quote)
+    timestamp_cols = _detect_time_stamps(sample_records, header)
+    data_cols = _detect_column_data_types(sample_records, header,
+                                          timestamp_cols, cols_to_ignore)
+    id_other_cols = _detect_id_other_cols(sample_records, header,
+                                          timestamp_cols, data_cols,
+                                          id_col=id_col, cycle_col=cycle_col)
     cols_meta = _create_col_meta(header, id_other_cols, timestamp_cols,
                                  cols_to_ignore, cycle_col=cycle_col)
-    return cols_meta, delimiter, quote
+    datetime_format = _guess_datetime_format_from_sample(sample_records,
+                                                         cols_meta)
+    detection = cols_meta, delimiter, quote, datetime_format
 
+    if detection_cache:
+        _store_detection(key, raw_file, detection, cache_dir=cache_dir)
 
-def _select_sample_records(raw_file, header, encoding=None, delimiter=None,
-                           quote=None):
-    with open(raw_file, encoding=encoding) as lines:
-        _ = lines.readline()
-        delimiter, quote = _determine_delimiter_and_quote(lines, delimiter,
-                                                          quote)
+    return detection
 
+
+def _detection_sample(sample_lines, header, delimiter=None, quote=None,
+                      auto=None):
+    """Returns a list of the records (lists of strings) with all of the
+    expected columns in the lines from _detection_sample_lines(), along with
+    the delimiter and quote.
+    """
+    delimiter, quote = _determine_delimiter_and_quote(sample_lines, delimiter,
+                                                      quote, auto=auto)
     sample_records = []
+    for line in sample_lines:
+        record = _record_from_line(line, delimiter, quote, header)
+        if record:
+            sample_records.append(record)
 
-    with open(raw_file, encoding=encoding) as lines:
-        _ = lines.readline()
+    return sample_records, delimiter, quote
 
-        for line in lines:
-            record = _record_from_line(line, delimiter, quote, header)
-            if record:
-                sample_records.append(record)
-            else:
+
+def _detection_sample_lines(raw_file, encoding=None):
+    """Returns list containing the first _DETECTION_SAMPLE_LINES lines after
+    the header, followed by blocks of _DETECTION_STRIDE_LINES lines that start
+    at evenly spaced byte positions in the rest of the file. The file is read
+    in binary mode so that it can be positioned directly.
+    """
+    encoding = _text_encoding(encoding)
+    file_size = os.path.getsize(raw_file)
+    sample_lines = []
+    with open(raw_file, 'rb') as f:
+        _ = f.readline()
+        for line in islice(f, _DETECTION_SAMPLE_LINES):
+            sample_lines.append(_decoded_line(line, encoding))
+        end_of_sample = f.tell()
+
+        for stride in range(1, _DETECTION_STRIDES + 1):
+            position = file_size * stride // (_DETECTION_STRIDES + 1)
+            if position <= end_of_sample:
                 continue
+            f.seek(position)
+            # Skip the remainder of the line containing the position
+            _ = f.readline()
+            for line in islice(f, _DETECTION_STRIDE_LINES):
+                sample_lines.append(_decoded_line(line, encoding))
+            end_of_sample = f.tell()
+
+    return sample_lines
+
+
+def _decoded_line(line, encoding):
+    return line.decode(encoding).replace('\r\n', '\n')
+
+
+def _text_encoding(encoding):
+    """Returns the encoding that open() uses for a file opened in text mode
+    with the encoding argument, so that lines read in binary mode are decoded
+    in the same way."""
+    return encoding if encoding else locale.getpreferredencoding(False)
 
-            if len(sample_records) == 1000:
-                break
 
+def _guess_datetime_format_from_sample(sample_records, cols_meta):
+    if not sample_records:
+        return None
+    time_col = _time_col_position(cols_meta)
+    return _guess_datetime_format(sample_records[0][time_col])
+
+
+def _select_sample_records(raw_file, header, encoding=None, delimiter=None,
+                           quote=None):
+    sample_lines = _detection_sample_lines(raw_file, encoding=encoding)
+    sample_records, delimiter, quote = _detection_sample(sample_lines, header,
+                                                         delimiter=delimiter,
+                                                         quote=quote)
     sample_record_array = np.array(sample_records)
 
     return sample_record_array, delimiter, quote
@@ -966,20 +2165,11 @@ def _record_has_all_expected_columns(record, header):
         return False
 
 
-def _detect_time_stamps(raw_file, header, delimiter, cycle_col=None,
-                        quote=None, encoding=None):
+def _detect_time_stamps(sample_records, header, cycle_col=None):
     """Return column index of first and (for cycle data) second time stamp."""
     first_time_stamp_col = None
     second_time_stamp_col = None
-    with open(raw_file, encoding=encoding) as f:
-        _ = f.readline()
-
-        for line in f:
-            if _contains_digits(line):
-                record = _parse_line(line, delimiter,
-                                     quote)
-                if _record_has_all_expected_columns(record, header):
-                    break
+    record = sample_records[0] if sample_records else []
 
     for col, val in enumerate(record):
         if (any([':' in val, '/' in val, '-' in val]) and
@@ -992,17 +2182,14 @@ def _detect_time_stamps(raw_file, header, delimiter, cycle_col=None,
     return [first_time_stamp_col, second_time_stamp_col]
 
 
-def _detect_column_data_types(raw_file, header, timestamp_cols, delimiter,
-                              cols_to_ignore, quote=None, encoding='UTF-8'):
+def _detect_column_data_types(sample_records, header, timestamp_cols,
+                              cols_to_ignore):
     """Returns dict containing lists of column indexes that are not assigned
     as the ID column, cycle column, or time stamp.
     """
-    with open(raw_file, encoding=encoding) as lines:
-        _ = lines.readline()
-        columns_to_detect = _non_time_cols(header, timestamp_cols, cols_to_ignore)
-
-        grouped = _determine_types_of_non_time_cols(columns_to_detect, lines, delimiter,
-                                                    quote, header)
+    columns_to_detect = _non_time_cols(header, timestamp_cols, cols_to_ignore)
+    grouped = _determine_types_of_non_time_cols(columns_to_detect,
+                                                sample_records)
     return grouped
 
 
@@ -1038,7 +2225,7 @@ def _timestamp_columns(timestamp_cols):
     return reserved_columns
 
 
-def _determine_types_of_non_time_cols(columns, lines, delimiter, quote, header):
+def _determine_types_of_non_time_cols(columns, sample_records):
     """Returns dict with lists as values. The lists contain column indexes
     that have not been assigned to the ID column, cycle column, or time stamps.
     """
@@ -1051,8 +2238,7 @@ def _determine_types_of_non_time_cols(columns, lines, delimiter, quote, header):
     zip_plus_4_cols = []
     columns_assigned = []
 
-    for i, line in enumerate(lines):
-        record = _record_from_line(line, delimiter, quote, header)
+    for record in sample_records:
         if record:
             for col in columns:
                 if col in columns_assigned:
@@ -1129,9 +2315,8 @@ def _has_form_of_zip_plus_4_code(val):
         return False
 
 
-def _detect_id_other_cols(raw_file, header, timestamp_cols,
-                          data_cols, cycle_col=None, id_col=None,
-                          delimiter=None, quote=None, encoding=None):
+def _detect_id_other_cols(sample_records, header, timestamp_cols,
+                          data_cols, cycle_col=None, id_col=None):
     if cycle_col:
         data_cols['cycle_col'] = cycle_col
 
@@ -1144,24 +2329,16 @@ def _detect_id_other_cols(raw_file, header, timestamp_cols,
         return data_cols
 
     else:
-        sample_records = []
-
-        with open(raw_file, encoding=encoding) as lines:
-            _ = lines.readline()
-
-            for i, line in enumerate(lines):
-                record = _record_from_line(line, delimiter, quote, header)
-                if record:
-                    possible_id_col_data = _data_in_possible_id_cols(record,
-                                                                     data_cols)
-                    # possible_id_col_contains 2-tuple in which each part
-                    # contains either a list of ints (data) or None
-                    sample_records.append(possible_id_col_data)
+        possible_id_col_records = []
 
-                if i == 1000:
-                    break
+        for record in sample_records:
+            possible_id_col_data = _data_in_possible_id_cols(record,
+                                                             data_cols)
+            # possible_id_col_contains 2-tuple in which each part
+            # contains either a list of ints (data) or None
+            possible_id_col_records.append(possible_id_col_data)
 
-        sample_arr = np.array(sample_records)
+        sample_arr = np.array(possible_id_col_records)
 
         possible_id_col_indexes = [data_cols[cols] for cols in ['alphanumeric', 'ints']
                                    if data_cols.get(cols)]
@@ -1281,7 +2458,7 @@ def _detect_mixed_alpha_numeric_id_col(alphanumeric_cols, header, sample_records
     return id_col
 
 
-def _detect_cycle_col(raw_file, header, cycle_mode, delimiter,
+def _detect_cycle_col(raw_file, header, cycle_mode, delimiter, sample_records,
                       auto=None, cycle_col_heading=None, quote=None,
                       encoding=None):
 
@@ -1304,26 +2481,29 @@ def _detect_cycle_col(raw_file, header, cycle_mode, delimiter,
         cycle_col = None
 
         if cycle_mode:
-            with open(raw_file, encoding=encoding) as lines:
-                _ = lines.readline()
-                cycle_col = _cycle_col_in_records(lines, header, delimiter,
-                                                  cycle_mode, quote=quote)
+            cycle_col = _cycle_col_in_records(sample_records, cycle_mode)
             if cycle_col is None:
-                raise ValueError('No column found containing value ' + cycle_mode)
+                # The mode may only appear after the sample
+                with open(raw_file, encoding=encoding) as lines:
+                    _ = lines.readline()
+                    records = (_record_from_line(line, delimiter, quote,
+                                                 header)
+                               for line in lines)
+                    cycle_col = _cycle_col_in_records(records, cycle_mode)
+            if cycle_col is None:
+                msg = ('No column found containing value \'' + cycle_mode +
+                       '\'\n')
+                raise ValueError(msg)
 
     return cycle_col
 
 
-def _cycle_col_in_records(lines, header, delimiter, cycle, quote=None):
+def _cycle_col_in_records(records, cycle):
     cycle_col = None
-    for line in lines:
-        record = _record_from_line(line, delimiter, quote, header)
-        if cycle in record:
+    for record in records:
+        if record and cycle in record:
             cycle_col = record.index(cycle)
             break
-    if cycle_col is None:
-        msg = ('No column found containing value \'' + cycle + '\'\n')
-        raise ValueError(msg)
 
     return cycle_col
 
@@ -1707,19 +2887,19 @@ def _determine_quote(line, quote=None):
 
 def _sensors_ids_in_states(**kwargs):
     if kwargs.get('states'):
-        sensors_ids = (_sensors_states_df(**kwargs)
-                       .index
-                       .unique()
-                       .ravel()
-                       .astype(np.unicode))
+        states = kwargs.get('states').split(',')
+        auto = kwargs.get('auto') if kwargs.get('auto') else None
+        sensors_ids = np.array(sorted(_devices_in_states(kwargs.get('sensors_file'),
+                                                         kwargs.get('postal_file'),
+                                                         states, auto)),
+                               dtype=np.unicode)
     else:
         sensors_ids = None
     return sensors_ids
 
 
 def _contains_digits(line):
-    digits = re.compile('\d')
-    return bool(digits.search(line))
+    return bool(_DIGITS.search(line))
 
 
 def _missing_sensors_or_postal_error_message():
@@ -1732,7 +2912,8 @@ def _missing_sensors_or_postal_error_message():
 
 def _sensors_states_df(**kwargs):
     """Returns pandas dataframe with sensor metadata and location
-    information for sensors in specified states.
+    information for sensors in specified states. The dataframe is kept in the
+    metadata registry, so it must not be modified.
     """
     postal_file, sensors_file = (kwargs.get(k) for k
                                  in ['postal_file', 'sensors_file'])
@@ -1741,15 +2922,19 @@ def _sensors_states_df(**kwargs):
 
     auto = kwargs.get('auto') if kwargs.get('auto') else None
 
+    return _METADATA_REGISTRY.cached(
+        (sensors_file, postal_file),
+        ('sensors_states_df', tuple(sorted(states)), auto),
+        partial(_merged_sensors_states_df, sensors_file, postal_file, states,
+                auto))
+
+
+def _merged_sensors_states_df(sensors_file, postal_file, states, auto):
     zip_codes_df = _zip_codes_in_states(postal_file, states, auto)
 
     thermos_df = _sensors_df(sensors_file, auto)
 
-    header_kwargs = {'is_sensors_file': True}
-    header, _ = _header_and_id_col_if_heading_or_preconfig(sensors_file,
-                                                           **header_kwargs)
-
-    zip_heading = _label_of_col_containing_string_lower_upper_title(header, 'zip')
+    zip_heading = _sensors_zip_heading(sensors_file)
 
     sensors_states_df = pd.merge(thermos_df, zip_codes_df, how='inner',
                                  left_on=zip_heading,
@@ -1757,10 +2942,81 @@ def _sensors_states_df(**kwargs):
     return sensors_states_df
 
 
+def _sensors_zip_heading(sensors_file):
+    header_kwargs = {'is_sensors_file': True}
+    header, _ = _header_and_id_col_if_heading_or_preconfig(sensors_file,
+                                                           **header_kwargs)
+    return _label_of_col_containing_string_lower_upper_title(header, 'zip')
+
+
+def _devices_in_states(sensors_file, postal_file, states, auto):
+    """Returns set of the IDs (strings) of the devices in the sensors file
+    whose postal codes are in any of the states (a list of abbreviations).
+    """
+    state_devices = _METADATA_REGISTRY.cached(
+        (sensors_file, postal_file), ('state_devices', auto),
+        partial(_state_devices, sensors_file, postal_file, auto))
+    devices = set()
+    for state in states:
+        devices.update(state_devices.get(state, ()))
+    return devices
+
+
+def _state_devices(sensors_file, postal_file, auto):
+    """Returns dict of state abbreviations and sets of device IDs (strings),
+    based on the indexes of devices to postal codes and of postal codes to
+    states."""
+    zip_states = _zip_states(postal_file, auto)
+    state_devices = {}
+    for device, zip_code in _device_zips(sensors_file, auto).items():
+        state = zip_states.get(zip_code)
+        if state is not None:
+            state_devices.setdefault(state, set()).add(device)
+    return state_devices
+
+
+def _device_zips(sensors_file, auto):
+    """Returns dict of device IDs and postal codes (strings)."""
+    def device_zips():
+        thermos_df = _sensors_df(sensors_file, auto)
+        zip_heading = _sensors_zip_heading(sensors_file)
+        return dict(zip(thermos_df.index.astype(np.unicode),
+                        thermos_df[zip_heading]))
+
+    return _METADATA_REGISTRY.cached(sensors_file, ('device_zips', auto),
+                                     device_zips)
+
+
+def _zip_states(postal_file, auto):
+    """Returns dict of postal codes and state abbreviations."""
+    def zip_states():
+        zips_df = _postal_codes_df(postal_file, auto)
+        return dict(zip(zips_df.index, zips_df[POSTAL_TWO_LETTER_STATE]))
+
+    return _METADATA_REGISTRY.cached(postal_file, ('zip_states', auto),
+                                     zip_states)
+
+
 def _zip_codes_in_states(postal_file, states, auto):
     """Returns pandas dataframe based on postal code metadata file, for states
      specified as list.
      """
+    zips_unfiltered_df = _postal_codes_df(postal_file, auto)
+    state_filter = zips_unfiltered_df[POSTAL_TWO_LETTER_STATE].isin(states)
+    zip_codes_df = zips_unfiltered_df.loc[state_filter]
+    return zip_codes_df
+
+
+def _postal_codes_df(postal_file, auto):
+    """Returns pandas dataframe based on postal code metadata file, indexed by
+    postal code. It is read once and kept in the metadata registry, so it must
+    not be modified."""
+    return _METADATA_REGISTRY.cached(postal_file, ('postal_codes_df', auto),
+                                     partial(_read_postal_codes_df,
+                                             postal_file, auto))
+
+
+def _read_postal_codes_df(postal_file, auto):
     header, _ = _header_and_id_col_if_heading_or_preconfig(postal_file,
                                                            is_postal_file=True)
     if auto:
@@ -1782,13 +3038,20 @@ def _zip_codes_in_states(postal_file, states, auto):
     zips_default_index_df[zip_col_label] = zips_default_index_df[zip_col_label]\
         .str.pad(5, side='left', fillchar='0')
     zips_unfiltered_df = zips_default_index_df.set_index([zip_col_label])
-    state_filter = zips_unfiltered_df[POSTAL_TWO_LETTER_STATE].isin(states)
-    zip_codes_df = zips_unfiltered_df.loc[state_filter]
-    return zip_codes_df
+    return zips_unfiltered_df
 
 
 def _sensors_df(sensors_file, auto, encoding='UTF-8', delimiter=None):
-    """Returns pandas dataframe of sensor metadata from raw file."""
+    """Returns pandas dataframe of sensor metadata from raw file. It is read
+    once and kept in the metadata registry, so it must not be modified."""
+    return _METADATA_REGISTRY.cached(sensors_file,
+                                     ('sensors_df', auto, encoding, delimiter),
+                                     partial(_read_sensors_df, sensors_file,
+                                             auto, encoding=encoding,
+                                             delimiter=delimiter))
+
+
+def _read_sensors_df(sensors_file, auto, encoding='UTF-8', delimiter=None):
     kwargs = {'encoding': encoding, 'is_sensors_file': True}
     header, _ = _header_and_id_col_if_heading_or_preconfig(sensors_file,
                                                            **kwargs)
@@ -1856,6 +3119,20 @@ def _locations_in_states(**kwargs):
     return location_ids_in_states
 
 
+def _ids_to_keep(ids_in_states, ids=None):
+    """Returns set of the IDs (strings, as in the raw file) of the records to
+    keep, based on the IDs in the states (if any) and the ids argument of
+    dict_from_file() (if any), or None if records with any ID are kept. A set
+    is used so that checking the ID of each row takes constant time.
+    """
+    ids_to_keep = set(ids_in_states) if ids_in_states is not None else None
+    if ids is not None:
+        id_strs = set(u'{}'.format(id_val) for id_val in ids)
+        ids_to_keep = (id_strs if ids_to_keep is None
+                       else ids_to_keep & id_strs)
+    return ids_to_keep
+
+
 # Fixed (static) file format handling
 
 def _data_type_matching_header(header):
@@ -1887,11 +3164,13 @@ def _clean_cycles(raw_file, **kwargs):
     id_col = _id_col_position(cols_meta)
     id_is_int = _id_is_int(cols_meta)
     data_cols = _non_index_col_types(cols_meta)
-    if states:
-        thermos_ids = _sensors_ids_in_states(**kwargs)
+    if states or kwargs.get('ids') is not None:
+        thermos_ids = _ids_to_keep(_sensors_ids_in_states(**kwargs),
+                                   ids=kwargs.get('ids'))
         with open(raw_file, encoding=kwargs.get('encoding')) as lines:
             _ = lines.readline()
-            for line in lines:
+            for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                             delimiter, quote, header):
                 record = _record_from_line(line, delimiter, quote, header)
                 if record and all(_validate_cycles_record(record, ids=thermos_ids,
                                   cycle=cycle)):
@@ -1923,9 +3202,11 @@ def _clean_sensors(raw_file, **kwargs):
     id_col = _id_col_position(cols_meta)
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        if states:
-            thermos_ids = _sensors_states_df(**kwargs).index.ravel()
-            for line in lines:
+        if states or kwargs.get('ids') is not None:
+            thermos_ids = _ids_to_keep(_sensors_ids_in_states(**kwargs),
+                                       ids=kwargs.get('ids'))
+            for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                             delimiter, quote, header):
                 record = _record_from_line(line, delimiter, quote, header)
                 if record and all(_validate_sensors_record(record,
                                                            ids=thermos_ids)):
@@ -1953,7 +3234,8 @@ def _clean_sensors_all_states(raw_file, **kwargs):
     id_is_int = _id_is_int(cols_meta)
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        for line in lines:
+        for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                         delimiter, quote, header):
             record = _record_from_line(line, delimiter, quote, header)
             if record:
                 # Sensor named tuple declaration is global, in order to ensure that
@@ -1988,7 +3270,8 @@ def _clean_cycles_all_states(raw_file, **kwargs):
     data_cols = _non_index_col_types(cols_meta)
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        for line in lines:
+        for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                         delimiter, quote, header):
             record = _record_from_line(line, delimiter, quote, header)
             if record and all(_validate_cycles_record(record, cycle=cycle)):
                 # Cycle named tuple declaration is global, in order to ensure that
@@ -2025,11 +3308,13 @@ def _clean_geospatial(raw_file, **kwargs):
                                                              for k in args)
     id_is_int = _id_is_int(cols_meta)
     id_col = _id_col_position(cols_meta)
-    if states:
-        location_ids = _locations_in_states(**kwargs)
+    if states or kwargs.get('ids') is not None:
+        location_ids = _ids_to_keep(_locations_in_states(**kwargs),
+                                    ids=kwargs.get('ids'))
         with open(raw_file, encoding=encoding) as lines:
             _ = lines.readline()
-            for line in lines:
+            for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                             delimiter, quote, header):
                 record = _record_from_line(line, delimiter, quote, header)
                 if record and all(_validate_geospatial_record(record,
                                                               ids=location_ids)):
@@ -2055,7 +3340,8 @@ def _clean_geospatial_all_states(raw_file, **kwargs):
     id_col = _id_col_position(cols_meta)
     with open(raw_file, encoding=encoding) as lines:
         _ = lines.readline()
-        for line in lines:
+        for line in _lines_in_time_range(lines, kwargs.get('time_range'),
+                                         delimiter, quote, header):
             record = _record_from_line(line, delimiter, quote, header)
             if record:
                 # Geospatial named tuple declared globally to enable pickling.
@@ -17,6 +17,19 @@ parser.read(os.path.join(path, 'config.ini'))
 THERMOSTATS_FILE = parser.get('raw_data_files', 'THERMOSTATS_FILE')
 POSTAL_FILE = parser.get('raw_data_files', 'POSTAL_FILE')
 
+# Column detection results saved by dict_from_file(detection_cache=True)
+if parser.get('detection_cache', 'CACHE_DIR') == '':
+    DETECTION_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.caar',
+                                       'detection_cache')
+else:
+    DETECTION_CACHE_DIR = parser.get('detection_cache', 'CACHE_DIR')
+# Int: number of results kept before the least recently used are removed
+DETECTION_CACHE_MAX_ENTRIES = int(parser.get('detection_cache', 'MAX_ENTRIES'))
+
+# Int: bytes of DataFrames kept by *_df_from_bin(cache=True) before the least
+# recently used are removed
+DF_CACHE_MAX_BYTES = int(parser.get('df_cache', 'MAX_BYTES'))
+
 # File headers (strings: headings for each column in the raw text files)
 CYCLE_FIELD1 = parser.get('file_headers', 'CYCLE_FIELD1')
 CYCLE_FIELD2 = parser.get('file_headers', 'CYCLE_FIELD2')
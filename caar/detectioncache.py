@@ -0,0 +1,174 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+
+import numpy as np
+
+from caar.configparser_read import DETECTION_CACHE_DIR,                      \
+    DETECTION_CACHE_MAX_ENTRIES
+
+from future import standard_library
+standard_library.install_aliases()
+
+
+_ENTRY_EXTENSION = '.json'
+# Part of every key, so that entries saved by earlier detection logic are not
+# reused. Increase it whenever the detection results can change.
+_DETECTION_CACHE_VERSION = 1
+
+
+def clear_detection_cache(raw_file=None, cache_dir=None):
+    """Removes column detection results that were saved by dict_from_file(), pickle_from_file(), detect_columns() or columns_summary() with the keyword argument detection_cache.
+
+    Entries are keyed by the header and a sample of the content of a file, so
+    an entry is not reused once the sampled content changes. Clearing the
+    cache is needed if a file changes only outside of the sample, or to
+    reclaim space.
+
+    Args:
+        raw_file (Optional[str]): If specified, only the results for this file are removed. Otherwise, all results are removed.
+
+        cache_dir (Optional[str]): Directory of the cache. Default is the CACHE_DIR in the [detection_cache] section of config.ini.
+
+    Returns:
+        removed (int): Number of results removed.
+    """
+    cache_dir = _cache_dir(cache_dir)
+    raw_file_path = os.path.abspath(str(raw_file)) if raw_file else None
+    removed = 0
+    for entry_path in _entry_paths(cache_dir):
+        if raw_file_path is not None:
+            entry = _read_entry(entry_path)
+            if entry is None or entry.get('raw_file') != raw_file_path:
+                continue
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+        removed += 1
+
+    return removed
+
+
+def _detection_key(header, sample_lines, detection_args):
+    """Returns hex digest based on the version of the cache, the header, the
+    lines that are sampled for detection, and the arguments that affect
+    detection.
+    """
+    key_hash = hashlib.sha1()
+    key_hash.update(json.dumps([_DETECTION_CACHE_VERSION, list(header),
+                                detection_args],
+                               default=_json_default).encode('utf-8'))
+    for line in sample_lines:
+        key_hash.update(line.encode('utf-8'))
+    return key_hash.hexdigest()
+
+
+def _load_detection(key, cache_dir=None):
+    """Returns tuple of columns meta-data, delimiter, quote and time stamp
+    format if there is an entry for the key. Otherwise, returns None.
+    """
+    entry_path = _entry_path(key, cache_dir)
+    entry = _read_entry(entry_path)
+    if entry is None:
+        return None
+    # Record the use of the entry, which determines the order of eviction
+    try:
+        os.utime(entry_path, None)
+    except OSError:
+        pass
+    return (entry['cols_meta'], entry['delimiter'], entry['quote'],
+            entry['datetime_format'])
+
+
+def _store_detection(key, raw_file, detection, cache_dir=None,
+                     max_entries=DETECTION_CACHE_MAX_ENTRIES):
+    """Saves the result of _analyze_all_columns() under the key. The entry is
+    written to a temporary file first and then renamed, so that concurrent
+    readers never see a partial entry. Least recently used entries are
+    removed once there are more than max_entries.
+    """
+    cache_dir = _cache_dir(cache_dir)
+    cols_meta, delimiter, quote, datetime_format = detection
+    entry = OrderedDict([('raw_file', os.path.abspath(str(raw_file))),
+                         ('cols_meta', cols_meta), ('delimiter', delimiter),
+                         ('quote', quote),
+                         ('datetime_format', datetime_format)])
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fout:
+            json.dump(entry, fout, default=_json_default)
+        _replace(temp_path, _entry_path(key, cache_dir))
+    except (IOError, OSError):
+        # The cache only saves time, so detection results are still returned
+        return
+
+    _evict_least_recently_used(cache_dir, max_entries)
+
+
+def _evict_least_recently_used(cache_dir, max_entries):
+    entry_paths = _entry_paths(cache_dir)
+    if len(entry_paths) <= max_entries:
+        return
+
+    entries_by_use = []
+    for entry_path in entry_paths:
+        try:
+            entries_by_use.append((os.path.getmtime(entry_path), entry_path))
+        except OSError:
+            continue
+    entries_by_use.sort()
+    for _, entry_path in entries_by_use[:len(entries_by_use) - max_entries]:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+
+
+def _cache_dir(cache_dir=None):
+    return str(cache_dir) if cache_dir else DETECTION_CACHE_DIR
+
+
+def _entry_path(key, cache_dir=None):
+    return os.path.join(_cache_dir(cache_dir), key + _ENTRY_EXTENSION)
+
+
+def _entry_paths(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return []
+    return [os.path.join(cache_dir, filename)
+            for filename in os.listdir(cache_dir)
+            if filename.endswith(_ENTRY_EXTENSION)]
+
+
+def _read_entry(entry_path):
+    try:
+        with open(entry_path) as fin:
+            return json.load(fin)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # Python 2.7
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(repr(obj) + ' is not JSON serializable')
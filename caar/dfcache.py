@@ -0,0 +1,161 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import namedtuple, OrderedDict
+import os
+import os.path
+import threading
+
+import numpy as np
+
+from caar.configparser_read import DF_CACHE_MAX_BYTES
+
+from future import standard_library
+standard_library.install_aliases()
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'entries', 'nbytes',
+                                     'max_bytes'])
+
+
+class DataFrameCache(object):
+    """Keeps DataFrames loaded from binary files (pickle files or columnar stores) in memory, so that loading the same file again returns the DataFrame that was already created.
+
+    DataFrames are stored under the path, modification time and size of the file, and a key for the arguments that they were loaded with (such as IDs), so that a DataFrame is loaded again once the file changes. The least recently used DataFrames are removed once their total memory usage is greater than max_bytes.
+
+    The arrays of stored DataFrames are made read-only. Each request returns a new DataFrame object (a shallow copy) that shares those arrays, or a copy that can be modified.
+    """
+
+    def __init__(self, max_bytes=DF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def cached(self, path, key, loader, copy=False):
+        """Returns the DataFrame returned by loader() (called without arguments) for the file at path and the key. loader() is only called if there is no DataFrame yet for the file in its current state.
+
+        Args:
+            path (str): Pickle file or columnar store directory.
+
+            key (hashable): Identifies the DataFrame among the DataFrames for the same file.
+
+            loader (function): Returns the DataFrame.
+
+            copy (Optional[bool]): If True, a copy of the DataFrame that can be modified is returned. Otherwise, the DataFrame shares its read-only arrays with the cached DataFrame. Default: False.
+
+        Returns:
+            df (pandas DataFrame): DataFrame.
+        """
+        entry_key = (os.path.abspath(str(path)), _path_stamp(path), key)
+        with self._lock:
+            entry = self._entries.pop(entry_key, None)
+            if entry is not None:
+                # Move the entry to the end, as the most recently used
+                self._entries[entry_key] = entry
+                self._hits += 1
+            else:
+                self._misses += 1
+        if entry is None:
+            df = loader()
+            nbytes = int(df.memory_usage(index=True, deep=True).sum())
+            if nbytes > self.max_bytes:
+                return df
+            _set_read_only(df)
+            with self._lock:
+                if entry_key not in self._entries:
+                    self._entries[entry_key] = (df, nbytes)
+                    self._nbytes += nbytes
+                    self._evict_least_recently_used()
+        else:
+            df = entry[0]
+        return df.copy(deep=copy)
+
+    def info(self):
+        """Returns CacheInfo with the numbers of hits and misses, and the number and memory usage (in bytes) of the DataFrames kept."""
+        with self._lock:
+            return CacheInfo(hits=self._hits, misses=self._misses,
+                             entries=len(self._entries), nbytes=self._nbytes,
+                             max_bytes=self.max_bytes)
+
+    def clear(self):
+        """Removes all DataFrames, resets the numbers of hits and misses, and returns the number of DataFrames removed."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._nbytes = 0
+            self._hits = 0
+            self._misses = 0
+        return removed
+
+    def resize(self, max_bytes):
+        """Sets max_bytes and removes the least recently used DataFrames beyond it."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict_least_recently_used()
+
+    def _evict_least_recently_used(self):
+        while self._entries and self._nbytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
+
+
+def df_cache_info():
+    """Returns the numbers of hits and misses of the DataFrames kept in memory by the *_df_from_bin() functions with the keyword argument cache=True, which can be used to choose the memory budget (see resize_df_cache()).
+
+    Returns:
+        info (CacheInfo): Named tuple with hits, misses, entries (number of DataFrames kept), nbytes (memory usage of the DataFrames kept) and max_bytes (memory budget).
+    """
+    return _DF_CACHE.info()
+
+
+def clear_df_cache():
+    """Removes the DataFrames kept in memory by the *_df_from_bin() functions with the keyword argument cache=True, and resets the numbers of hits and misses.
+
+    DataFrames are loaded again automatically once their file changes, so clearing is only needed to reclaim memory.
+
+    Returns:
+        removed (int): Number of DataFrames removed.
+    """
+    return _DF_CACHE.clear()
+
+
+def resize_df_cache(max_bytes):
+    """Sets the memory budget of the DataFrames kept in memory by the *_df_from_bin() functions with the keyword argument cache=True. The least recently used DataFrames are removed until their memory usage is within the budget. The default is MAX_BYTES in the [df_cache] section of config.ini.
+
+    Args:
+        max_bytes (int): Memory budget, in bytes.
+    """
+    _DF_CACHE.resize(max_bytes)
+
+
+def _path_stamp(path):
+    """Returns tuple of the latest modification time and total size of the
+    file, or of the files in the directory (for a columnar store)."""
+    path = str(path)
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, filename))
+                 for filename in sorted(os.listdir(path))]
+    else:
+        stats = [os.stat(path)]
+    return (max(stat.st_mtime for stat in stats) if stats else 0,
+            sum(stat.st_size for stat in stats))
+
+
+def _set_read_only(df):
+    """Makes the arrays of the DataFrame read-only, so that the values of a
+    cached DataFrame cannot be modified through the DataFrames returned."""
+    # The block manager was renamed from _data to _mgr in pandas 1.1
+    manager = getattr(df, '_mgr', None)
+    if manager is None:
+        manager = df._data
+    for block in manager.blocks:
+        # Datetime blocks hold an ndarray within a DatetimeArray in pandas 1.0+
+        values = getattr(block.values, '_ndarray', block.values)
+        if isinstance(values, np.ndarray):
+            values.flags.writeable = False
+
+
+# Cache shared by the *_df_from_bin() functions
+_DF_CACHE = DataFrameCache()
@@ -3,10 +3,16 @@ from __future__ import absolute_import, division, print_function
 import pickle
 import random
 from collections import namedtuple
+from functools import partial
+from operator import itemgetter
 
+import numpy as np
 import pandas as pd
 
-from caar.cleanthermostat import _sort_meta_in_col_order, dict_from_file
+from caar.cleanthermostat import _sort_meta_in_col_order, dict_from_file,    \
+    ColumnarRecords, _is_columnar_store, _load_columnar_store
+from caar.dfcache import _DF_CACHE
+from caar.histsummary import _offset_index
 
 from future import standard_library
 standard_library.install_aliases()
@@ -22,7 +28,7 @@ def create_sensors_df(dict_or_pickle_file, sensor_ids=None):
     sensor observations.
 
     Args:
-        dict_or_pickle_file (dict or str): The object must have been created with dict_from_file() or pickle_from_file() function.
+        dict_or_pickle_file (dict or str): The object must have been created with dict_from_file() or pickle_from_file() function. If it is a columnar store from pickle_from_file(binary_format='columnar'), only the records for the requested IDs are read from disk.
 
         sensor_ids (Optional[list or other iterable of ints or strings]): Sensor IDs. If no argument is specified, all IDs from the first arg will be in the DataFrame.
 
@@ -31,18 +37,17 @@ def create_sensors_df(dict_or_pickle_file, sensor_ids=None):
         ID(s) and timestamps.
     """
     fields = list(Sensor._fields)
-    multi_ids, vals, meta = _records_as_lists_of_tuples(dict_or_pickle_file,
-                                                        fields, ids=sensor_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    sensors_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    sensors_df = _multi_index_df(dict_or_pickle_file, fields, ['id', 'time'],
+                                 ids=sensor_ids)
     return sensors_df
 
 
 def sensors_df_from_text(raw_file, states=None, sensors_file=None,
                          postal_file=None, auto='sensors', id_col_heading=None,
                          encoding='UTF-8', delimiter=None, quote=None,
-                         cols_to_ignore=None, meta=False, sensor_ids=None):
+                         cols_to_ignore=None, meta=False, sensor_ids=None,
+                         engine='python', workers=1, start=None, end=None,
+                         time_sorted=False):
 
     sensors = dict_from_file(raw_file, states=states,
                              sensors_file=sensors_file,
@@ -50,30 +55,35 @@ def sensors_df_from_text(raw_file, states=None, sensors_file=None,
                              id_col_heading=id_col_heading,
                              encoding=encoding, delimiter=delimiter,
                              quote=quote, cols_to_ignore=cols_to_ignore,
-                             meta=meta)
+                             meta=meta, engine=engine,
+                             columnar=(engine == 'vectorized' or workers > 1),
+                             workers=workers, start=start, end=end,
+                             time_sorted=time_sorted, ids=sensor_ids)
 
     return create_sensors_df(sensors, sensor_ids=sensor_ids)
 
 
-def sensors_df_from_bin(pickle_file, sensor_ids=None):
+def sensors_df_from_bin(pickle_file, sensor_ids=None, cache=False, copy=False):
     """Returns pandas DataFrame containing sensor ID, timestamps and
         sensor observations.
 
         Args:
-            pickle_file (str): The pickle file must have been created with pickle_from_file() function.
+            pickle_file (str): The pickle file (or columnar store directory) must have been created with pickle_from_file() function.
 
             sensor_ids (Optional[list or other iterable of ints or strings]): Sensor IDs. If no argument is specified, all IDs from the first arg will be in the DataFrame.
 
+            cache (Optional[bool]): If True, the DataFrame is kept in memory (see the **dfcache** module), so that calling the function again with the same file (if it has not changed) and IDs does not load it again. The values of the DataFrame returned are read-only, unless copy is True. Default: False.
+
+            copy (Optional[bool]): If True (and cache is True), a copy of the DataFrame kept in memory that can be modified is returned. Default: False.
+
         Returns:
             sensors_df (pandas DataFrame): DataFrame has MultiIndex based on the
             ID(s) and timestamps.
         """
     fields = list(Sensor._fields)
-    multi_ids, vals, meta = _records_as_lists_of_tuples(pickle_file,
-                                                        fields, ids=sensor_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    sensors_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    sensors_df = _multi_index_df_from_bin(pickle_file, fields, ['id', 'time'],
+                                          ids=sensor_ids, cache=cache,
+                                          copy=copy)
     return sensors_df
 
 
@@ -82,26 +92,24 @@ def create_cycles_df(dict_or_pickle_file, device_ids=None):
     timestamps as multi-part indexes, and cycle ending times as values.
 
     Args:
-        dict_or_pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function.
+        dict_or_pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function. If it is a columnar store from pickle_from_file(binary_format='columnar'), only the records for the requested IDs are read from disk.
 
         device_ids (Optional[list or other iterable of ints or strings]): Sensor IDs. If no  argument is specified, all IDs from the first arg will be in the DataFrame.
 
     Returns:
         cycles_df (pandas DataFrame): DataFrame has MultiIndex based on the ID(s) and timestamps.
     """
-    multi_ids, vals, meta = _records_as_lists_of_tuples(dict_or_pickle_file,
-                                                        list(Cycle._fields),
-                                                        ids=device_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'cycle', 'start_time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    cycles_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    cycles_df = _multi_index_df(dict_or_pickle_file, list(Cycle._fields),
+                                ['id', 'cycle', 'start_time'], ids=device_ids)
     return cycles_df
 
 
 def cycles_df_from_text(raw_file, cycle=None, states=None, postal_file=None,
                         auto='cycles', id_col_heading=None, cycle_col_heading=None,
                         encoding='UTF-8', delimiter=None, quote=None,
-                        cols_to_ignore=None, meta=False, device_ids=None):
+                        cols_to_ignore=None, meta=False, device_ids=None,
+                        engine='python', workers=1, start=None, end=None,
+                        time_sorted=False):
 
     cycles = dict_from_file(raw_file, cycle=cycle, states=states,
                             postal_file=postal_file, auto=auto,
@@ -109,29 +117,34 @@ def cycles_df_from_text(raw_file, cycle=None, states=None, postal_file=None,
                             cycle_col_heading=cycle_col_heading,
                             encoding=encoding, delimiter=delimiter,
                             quote=quote, cols_to_ignore=cols_to_ignore,
-                            meta=meta)
+                            meta=meta, engine=engine,
+                            columnar=(engine == 'vectorized' or workers > 1),
+                            workers=workers, start=start, end=end,
+                            time_sorted=time_sorted, ids=device_ids)
 
     return create_cycles_df(cycles, device_ids=device_ids)
 
 
-def cycles_df_from_bin(pickle_file, device_ids=None):
+def cycles_df_from_bin(pickle_file, device_ids=None, cache=False, copy=False):
     """Returns pandas DataFrame containing sensor ids and cycle beginning
         timestamps as multi-part indexes, and cycle ending times as values.
 
         Args:
-            pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function.
+            pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function. A columnar store directory from pickle_from_file(binary_format='columnar') is loaded with memory-mapped arrays.
 
             device_ids (Optional[list or other iterable of ints or strings]): Sensor IDs. If no  argument is specified, all IDs from the first arg will be in the DataFrame.
 
+            cache (Optional[bool]): If True, the DataFrame is kept in memory. See sensors_df_from_bin(). Default: False.
+
+            copy (Optional[bool]): If True (and cache is True), a copy that can be modified is returned. Default: False.
+
         Returns:
             cycles_df (pandas DataFrame): DataFrame has MultiIndex based on the ID(s) and timestamps.
         """
-    multi_ids, vals, meta = _records_as_lists_of_tuples(pickle_file,
-                                                        list(Cycle._fields),
-                                                        ids=device_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'cycle', 'start_time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    cycles_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    cycles_df = _multi_index_df_from_bin(pickle_file, list(Cycle._fields),
+                                         ['id', 'cycle', 'start_time'],
+                                         ids=device_ids, cache=cache,
+                                         copy=copy)
     return cycles_df
 
 
@@ -140,7 +153,7 @@ def create_geospatial_df(dict_or_pickle_file, location_ids=None):
     stamps as multi-part indexes and outdoor temperatures as values.
 
     Args:
-        dict_or_pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function.
+        dict_or_pickle_file (dict or str): Must have been created with dict_from_file() or pickle_from_file() function. If it is a columnar store from pickle_from_file(binary_format='columnar'), only the records for the requested IDs are read from disk.
 
         location_ids (Optional[list or other iterable of ints or strings]): Location IDs. If no argument is specified, all IDs from the first arg will be in the DataFrame.
 
@@ -148,12 +161,8 @@ def create_geospatial_df(dict_or_pickle_file, location_ids=None):
         geospatial_df (pandas DataFrame): DataFrame has MultiIndex based on the ID(s) and timestamps.
     """
     fields = list(Geospatial._fields)
-    multi_ids, vals, meta = _records_as_lists_of_tuples(dict_or_pickle_file,
-                                                        fields,
-                                                        ids=location_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    geospatial_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    geospatial_df = _multi_index_df(dict_or_pickle_file, fields, ['id', 'time'],
+                                    ids=location_ids)
     return geospatial_df
 
 
@@ -161,50 +170,96 @@ def geospatial_df_from_text(raw_file, states=None, sensors_file=None,
                             postal_file=None, auto='geospatial',
                             id_col_heading=None, encoding='UTF-8',
                             delimiter=None, quote=None, cols_to_ignore=None,
-                            meta=False, location_ids=None):
+                            meta=False, location_ids=None, engine='python',
+                            workers=1, start=None, end=None,
+                            time_sorted=False):
 
     geos = dict_from_file(raw_file, states=states, sensors_file=sensors_file,
                           postal_file=postal_file, auto=auto,
                           id_col_heading=id_col_heading,
                           encoding=encoding, delimiter=delimiter, quote=quote,
-                          cols_to_ignore=cols_to_ignore, meta=meta)
+                          cols_to_ignore=cols_to_ignore, meta=meta,
+                          engine=engine,
+                          columnar=(engine == 'vectorized' or workers > 1),
+                          workers=workers, start=start, end=end,
+                          time_sorted=time_sorted, ids=location_ids)
 
-    return create_geospatial_df(geos, locations_ids=location_ids)
+    return create_geospatial_df(geos, location_ids=location_ids)
 
 
-def geospatial_df_from_bin(pickle_file, location_ids=None):
+def geospatial_df_from_bin(pickle_file, location_ids=None, cache=False,
+                           copy=False):
     """Returns pandas DataFrame containing records with location IDs and time
     stamps as multi-part indexes and outdoor temperatures as values.
 
     Args:
-        pickle_file (str): Must have been created with pickle_from_file() function.
+        pickle_file (str): Must have been created with pickle_from_file() function. It may be a pickle file or a columnar store directory.
 
         location_ids (Optional[list or other iterable of ints or strings]): Location IDs. If no argument is specified, all IDs from the first arg will be in the DataFrame.
 
+        cache (Optional[bool]): If True, the DataFrame is kept in memory. See sensors_df_from_bin(). Default: False.
+
+        copy (Optional[bool]): If True (and cache is True), a copy that can be modified is returned. Default: False.
+
     Returns:
         geospatial_df (pandas DataFrame): DataFrame has MultiIndex based on the ID(s) and timestamps.
     """
     fields = list(Geospatial._fields)
-    multi_ids, vals, meta = _records_as_lists_of_tuples(pickle_file, fields,
-                                                        ids=location_ids)
-    id_labels = [meta[col]['heading'] for col in ['id', 'time']]
-    data_labels = _data_labels_from_meta(meta, id_labels)
-    geospatial_df = _create_multi_index_df(id_labels, multi_ids, data_labels, vals)
+    geospatial_df = _multi_index_df_from_bin(pickle_file, fields,
+                                             ['id', 'time'], ids=location_ids,
+                                             cache=cache, copy=copy)
     return geospatial_df
 
 
-def _records_as_lists_of_tuples(dict_or_pickle_file, fields,
-                                ids=None):
-    """Returns tuple containing
-    1) a list of named tuples containing sensor (or outdoor location) ids
-    and timestamps and
-    2) a list of either indoor (or outdoor) temperatures, or the ending time
-    of a cycle, based on input of a pickle file containing a dict.
+def _multi_index_df_from_bin(pickle_file, fields, id_cols, ids=None,
+                             cache=False, copy=False):
+    """Returns MultiIndex DataFrame based on a pickle file or columnar store,
+    which is kept in the shared DataFrameCache if cache is True, under the
+    fields and IDs."""
+    if not cache:
+        return _multi_index_df(pickle_file, fields, id_cols, ids=ids)
+    ids = None if ids is None else list(ids)
+    key = (tuple(fields), None if ids is None else frozenset(ids))
+    return _DF_CACHE.cached(pickle_file, key,
+                            partial(_multi_index_df, pickle_file, fields,
+                                    id_cols, ids=ids),
+                            copy=copy)
+
+
+def _multi_index_df(dict_or_pickle_file, fields, id_cols, ids=None):
+    """Returns MultiIndex DataFrame based on a dict or pickle file. The records
+    may be either a dict or a ColumnarRecords object. The id_cols are the keys
+    in the columns metadata for the index columns.
     """
+    records, meta = _records_and_meta(dict_or_pickle_file)
+    id_labels = [meta[col]['heading'] for col in id_cols]
+    data_labels = _data_labels_from_meta(meta, id_labels)
+    if isinstance(records, ColumnarRecords):
+        if ids is not None:
+            records = records.select_ids(ids)
+        df = _create_multi_index_df_from_columns(id_labels, records,
+                                                 data_labels)
+    else:
+        index_arrays, vals, _ = _records_as_arrays({'records': records,
+                                                    'cols_meta': meta},
+                                                   fields, ids=ids)
+        df = _create_multi_index_df(id_labels, index_arrays, data_labels,
+                                    vals)
+    # Index the rows of each ID once, for slicing by ID and time
+    _offset_index(df)
+    return df
+
+
+def _records_and_meta(dict_or_pickle_file):
     records = {}
+    meta = None
     if isinstance(dict_or_pickle_file, dict):
         records = dict_or_pickle_file['records']
         meta = dict_or_pickle_file['cols_meta']
+    elif _is_columnar_store(dict_or_pickle_file):
+        container = _load_columnar_store(str(dict_or_pickle_file))
+        records = container['records']
+        meta = container['cols_meta']
     else:
         try:
             with open(dict_or_pickle_file, 'rb') as cp:
@@ -213,13 +268,27 @@ def _records_as_lists_of_tuples(dict_or_pickle_file, fields,
                 meta = container['cols_meta']
         except ValueError:
             print('The first argument must be a pickle file or dict.')
+    return records, meta
+
+
+def _records_as_arrays(dict_or_pickle_file, fields, ids=None):
+    """Returns tuple containing
+    1) a list with an array for each of the fields of the keys of the records
+    (sensor or outdoor location ids, cycle modes if applicable, and
+    timestamps),
+    2) a list of either indoor (or outdoor) temperatures, or the ending time
+    of a cycle, based on input of a pickle file containing a dict, and
+    3) the columns metadata.
+    """
+    records, meta = _records_and_meta(dict_or_pickle_file)
     if ids is not None:
-        for record_key in list(records.keys()):
-            # Discard record if it is not among the desired ids.
-            if getattr(record_key, fields[0]) not in ids:
-                records.pop(record_key, None)
-    multi_ids, vals = _multi_ids_and_data_vals(records, fields)
-    return multi_ids, vals, meta
+        # Keep only the records for the desired ids.
+        ids = set(ids)
+        records = dict((record_key, record) for record_key, record
+                       in records.items()
+                       if getattr(record_key, fields[0]) in ids)
+    index_arrays, vals = _index_arrays_and_data_vals(records, fields)
+    return index_arrays, vals, meta
 
 
 def _data_labels_from_meta(meta, id_labels):
@@ -230,17 +299,9 @@ def _data_labels_from_meta(meta, id_labels):
 
 
 def random_record(dict_or_pickle_file, value_only=False):
-    """Returns a randomly chosen key-value pair from a dict or pickle file."""
-    records = {}
-    if isinstance(dict_or_pickle_file, dict):
-        records = dict_or_pickle_file['records']
-    else:
-        try:
-            with open(dict_or_pickle_file, 'rb') as cp:
-                container = pickle.load(cp)
-                records = container['records']
-        except ValueError:
-            print('The first argument must be a pickle file or dict.')
+    """Returns a randomly chosen key-value pair from a dict, pickle file or
+    columnar store."""
+    records, _ = _records_and_meta(dict_or_pickle_file)
 
     copied_keys = list(records.keys())
     random_record_key = _random_record_key(copied_keys)
@@ -259,29 +320,88 @@ def _random_record_key(keys):
         return random_record_key
 
 
-def _multi_ids_and_data_vals(records, fields):
+def _index_arrays_and_data_vals(records, fields):
     """Returns tuple containing
-    1) a list of named tuples containing ids and timestamps (and cycle modes
-    if applicable) and
+    1) a list with an array for each of the fields of the keys of the records
+    (ids, cycle modes if applicable, and timestamps) and
     2) a list of either temperatures or cycle ending times, based on items
-    (records) in a dict.
+    (records) in a dict. The keys are read into one sequence per field,
+    rather than creating a tuple for each record. The timestamps are kept as
+    they are in the keys, as a DatetimeIndex if they are datetimes (as with
+    MultiIndex.from_tuples()), or otherwise as an Index (e.g. of strings).
     """
-    multi_ids = []
-    vals = []
-    for k, v in records.items():
-        ids = tuple(getattr(k, f) for f in fields)
-        multi_ids.append(ids)
-        vals.append(v)
-    return multi_ids, vals
-
-
-def _create_multi_index_df(multiindex_names, multi_ids, column_names, values):
-    """Returns MultiIndex pandas dataframe in which the index columns are for
-    an id and timestamp and the value is for a temperature or a timestamp
-    indicating the end of a cycle.
+    if not records:
+        return [np.array([]) for _ in fields], []
+    keys = list(records.keys())
+    key_fields = [list(map(itemgetter(i), keys)) for i in range(len(fields))]
+    index_arrays = [np.asarray(values) for values in key_fields[:-1]]
+    index_arrays.append(pd.Index(_object_array(key_fields[-1])))
+    return index_arrays, list(records.values())
+
+
+def _object_array(values):
+    try:
+        return np.fromiter(values, dtype=object, count=len(values))
+    except (TypeError, ValueError):
+        # NumPy < 1.23 does not create object arrays with fromiter()
+        return np.array(values, dtype=object)
+
+
+def _create_multi_index_df(multiindex_names, index_arrays, column_names,
+                           values):
+    """Returns MultiIndex pandas DataFrame in which the index columns are for
+    an id (and a cycle mode) and timestamp, based on an array for each index
+    column. The codes of each index column are found once, and the records
+    are only sorted (with a single lexsort of the codes) if they are not
+    already sorted by the index columns.
     """
-    multiindex_columns = tuple(multiindex_names)
-    multicols = pd.MultiIndex.from_tuples(multi_ids, names=multiindex_columns)
-    df = pd.DataFrame(values, index=multicols, columns=column_names)
-    df.sort_index(inplace=True, sort_remaining=True)
+    codes, levels = [], []
+    for index_array in index_arrays:
+        level_codes, level = pd.factorize(index_array, sort=True)
+        codes.append(level_codes)
+        levels.append(level)
+    df = pd.DataFrame(values, columns=column_names)
+    if not _is_sorted_by_codes(codes):
+        order = np.lexsort(codes[::-1])
+        codes = [level_codes[order] for level_codes in codes]
+        df = df.take(order)
+    df.index = _multi_index_from_codes(levels, codes, multiindex_names)
     return df
+
+
+def _is_sorted_by_codes(codes):
+    """Returns True if the rows are sorted by the codes of the first index
+    column, then by the codes of the next one, and so on."""
+    ordered = np.zeros(max(len(codes[0]) - 1, 0), dtype=bool)
+    tied = np.ones(len(ordered), dtype=bool)
+    for level_codes in codes:
+        steps = np.diff(level_codes)
+        ordered |= tied & (steps > 0)
+        tied &= steps == 0
+    return bool((ordered | tied).all())
+
+
+def _multi_index_from_codes(levels, codes, names):
+    kwargs = {'levels': levels, 'names': tuple(names),
+              'verify_integrity': False}
+    try:
+        return pd.MultiIndex(codes=codes, **kwargs)
+    except TypeError:
+        # MultiIndex.labels was renamed MultiIndex.codes in pandas 0.24
+        return pd.MultiIndex(labels=codes, **kwargs)
+
+
+def _create_multi_index_df_from_columns(multiindex_names, records,
+                                        column_names):
+    """Returns MultiIndex pandas DataFrame based on the arrays in a
+    ColumnarRecords object, without creating a tuple for each record.
+    """
+    index_arrays = [records.ids, pd.Index(records.times)]
+    if records.data_type == 'cycles':
+        cycle_modes = records.cycle_modes
+        if cycle_modes is None:
+            cycle_modes = np.array([None] * len(records.ids))
+        index_arrays.insert(1, cycle_modes)
+    # The records are already sorted unless some index values are missing
+    return _create_multi_index_df(multiindex_names, index_arrays, column_names,
+                                  records.data)
@@ -1,14 +1,35 @@
 from __future__ import absolute_import, division, print_function
+from collections import namedtuple
 import datetime as dt
+from functools import partial
+import threading
+import weakref
 import numpy as np
 import pandas as pd
 
 from caar.configparser_read import SENSOR_DEVICE_ID, SENSOR_LOCATION_ID
+from caar.metadataregistry import _METADATA_REGISTRY
 
 from future import standard_library
 standard_library.install_aliases()
 
 
+_NS_PER_DAY = 24 * 60 * 60 * 10 ** 9
+
+# Counts of the records (records) and of the non-null values of each column
+# (counts) of each ID (rows) on each day (columns) from first_day (days since
+# the epoch). See _daily_counts().
+_DailyCounts = namedtuple('_DailyCounts', ['ids', 'first_day', 'records',
+                                           'counts'])
+
+# Row offsets of each ID (ids and id_offsets) and of each group of rows with
+# the same index values besides the time stamps (group_offsets) in a
+# DataFrame sorted by its index, and the time stamps as int64 nanoseconds
+# (times). See _offset_index().
+_OffsetIndex = namedtuple('_OffsetIndex', ['ids', 'id_offsets',
+                                           'group_offsets', 'times'])
+
+
 def days_of_data_by_id(df):
     """Returns pandas DataFrame with ID as index and the number of calendar
     days of data as values.
@@ -20,14 +41,9 @@ def days_of_data_by_id(df):
         days_data_df (pandas DataFrame): DataFrame with count
         ('Days') for each ID.
     """
-    time_level = _get_time_level_of_df_multiindex(df)
-
-    days_data_df = (df.groupby([df.index.get_level_values(level=0),
-                                pd.TimeGrouper('D', level=time_level)])
-                    .count()
-                    .groupby(level=0)
-                    .count())
-    days_data_df.columns = ['Days']
+    daily = _daily_counts(df)
+    days_data_df = pd.DataFrame({'Days': (daily.records > 0).sum(axis=1)},
+                                index=daily.ids)
     return days_data_df
 
 
@@ -97,6 +113,134 @@ def consecutive_days_of_observations(sensor_id, devices_file, cycles_df,
     return streaks_df
 
 
+def consecutive_days_of_observations_for_each_id(devices_file, cycles_df,
+                                                 sensors_df,
+                                                 geospatial_df=None,
+                                                 include_first_and_last_days=False,
+                                                 ids=None):
+    """Returns a pandas DataFrame with a row for each date range in which there are observations on consecutive days, for all devices at once. The result for each device is the same as from consecutive_days_of_observations(), but the days with observations are found once for all devices in each DataFrame, rather than by slicing the DataFrames for each device.
+
+    Args:
+        devices_file(str): Path of devices file. Is only needed if there is a geospatial DataFrame.
+
+        cycles_df (pandas DataFrame): DataFrame as created by **history** module.
+
+        sensors_df (pandas DataFrame): DataFrame as created by **history** module.
+
+        geospatial_df (Optional[pandas DataFrame]): DataFrame as created by **history** module.
+
+        include_first_and_last_days (Optional[bool]): If False (default), the first and last days with observations of each device are left out, since they may be partial days, and devices with less than 3 days with observations are left out.
+
+        ids (Optional[list of ints or strs]): Device IDs. By default, all of the IDs in both the cycles and sensors DataFrames.
+
+    Returns:
+        consecutive_days_df (pandas DataFrame): DataFrame with 'ID', 'First day', 'Last day', and count ('Consecutive days') for each set of consecutive days, sorted by ID and first day.
+    """
+    cycles_ids, sensors_ids = (df.index.get_level_values(0).unique()
+                               for df in (cycles_df, sensors_df))
+    if ids is None:
+        ids = cycles_ids.intersection(sensors_ids).sort_values()
+    ids = pd.Index(ids)
+    # Days with observations of each device, as int64 keys of row and day
+    # (counted from the first day in the DataFrames)
+    rows_and_days = [_id_rows_and_days(df, ids)
+                     for df in (cycles_df, sensors_df)]
+    first_day, n_days = _day_span([days for _, days in rows_and_days])
+    keys = None
+    for rows, days in rows_and_days:
+        df_keys = _row_day_keys(rows, days, first_day, n_days)
+        keys = df_keys if keys is None else np.intersect1d(keys, df_keys,
+                                                           assume_unique=True)
+    if geospatial_df is not None:
+        keys = _keys_with_location_obs(keys, ids, devices_file, geospatial_df,
+                                       first_day, n_days)
+
+    rows, days = keys // n_days, keys % n_days + first_day
+    if not include_first_and_last_days:
+        rows, days = _without_first_and_last_days(rows, days)
+    # Run-length encoding: a streak starts at each change of row or gap
+    new_streak = np.ones(len(rows), dtype=bool)
+    new_streak[1:] = (rows[1:] != rows[:-1]) | (days[1:] != days[:-1] + 1)
+    streak_starts = np.flatnonzero(new_streak)
+    streak_lengths = np.diff(np.r_[streak_starts, len(days)])
+    first_days = days[streak_starts]
+    last_days = first_days + streak_lengths - 1
+    first_days_dt, last_days_dt = ([dt.date(d.year, d.month, d.day)
+                                    for d in pd.to_datetime(streak_days,
+                                                            unit='D')]
+                                   for streak_days in (first_days, last_days))
+    streaks_df = pd.DataFrame({'ID': np.asarray(ids)[rows[streak_starts]],
+                               'First day': first_days_dt,
+                               'Last day': last_days_dt,
+                               'Consecutive days': streak_lengths.astype(np.int64)},
+                              columns=['ID', 'First day', 'Last day',
+                                       'Consecutive days'])
+    return streaks_df
+
+
+def _id_rows_and_days(df, ids):
+    """Returns int64 arrays of the position of the ID of each record in ids
+    (or -1), and of the day of each record (days since the epoch)."""
+    rows = ids.get_indexer(df.index.get_level_values(0))
+    times = pd.DatetimeIndex(_get_time_index(df))
+    days = times.asi8 // _NS_PER_DAY
+    return rows.astype(np.int64), days
+
+
+def _day_span(days_arrays):
+    """Returns the first day and the number of days from it to the last day
+    in the arrays of days (at least 1, so that keys can be divided by it)."""
+    days_arrays = [days for days in days_arrays if len(days)]
+    if not days_arrays:
+        return 0, 1
+    first_day = min(days.min() for days in days_arrays)
+    last_day = max(days.max() for days in days_arrays)
+    return first_day, last_day - first_day + 1
+
+
+def _row_day_keys(rows, days, first_day, n_days):
+    """Returns sorted, unique int64 keys of the rows (positions of IDs) and
+    days, counted from first_day. Records with a row of -1, or a day outside
+    of the n_days from first_day, are left out."""
+    keep = (rows >= 0) & (days >= first_day) & (days < first_day + n_days)
+    return np.unique(rows[keep] * n_days + (days[keep] - first_day))
+
+
+def _keys_with_location_obs(keys, ids, devices_file, geospatial_df,
+                            first_day, n_days):
+    """Returns the keys (see consecutive_days_of_observations_for_each_id())
+    of the days on which there are also observations for the location of the
+    device. Devices that are not in the devices file are left out."""
+    device_locations = _METADATA_REGISTRY.cached(
+        devices_file, 'device_locations',
+        partial(_device_locations, devices_file))
+    location_ids = pd.Index(pd.unique(np.array(list(device_locations.values()))))
+    location_rows, days = _id_rows_and_days(geospatial_df, location_ids)
+    location_keys = _row_day_keys(location_rows, days, first_day, n_days)
+    row_locations = location_ids.get_indexer(
+        [device_locations.get(id) for id in ids])
+    key_locations = row_locations[keys // n_days]
+    key_location_keys = key_locations * n_days + keys % n_days
+    observed = ((key_locations >= 0) &
+                np.in1d(key_location_keys, location_keys))
+    return keys[observed]
+
+
+def _without_first_and_last_days(rows, days):
+    """Returns the rows and days (sorted by row and day) without the first
+    and last day of each row, and without rows with less than 3 days."""
+    new_row = np.ones(len(rows), dtype=bool)
+    new_row[1:] = rows[1:] != rows[:-1]
+    row_starts = np.flatnonzero(new_row)
+    row_ends = np.r_[row_starts[1:], len(rows)]
+    keep = np.ones(len(rows), dtype=bool)
+    keep[row_starts] = False
+    keep[row_ends - 1] = False
+    short_rows = (row_ends - row_starts) < 3
+    keep[np.repeat(short_rows, row_ends - row_starts)] = False
+    return rows[keep], days[keep]
+
+
 def daily_cycle_sensor_and_geospatial_obs_counts(sensor_id, devices_file, cycles_df, sensors_df,
                                                  geospatial_df=None):
     """Returns a pandas DataFrame with the count of observations of each type
@@ -119,16 +263,13 @@ def daily_cycle_sensor_and_geospatial_obs_counts(sensor_id, devices_file, cycles
         daily_obs_df (pandas DataFrame): DataFrame with index of the date, and
         values of 'Cycles_obs', 'Sensors_obs', and 'Geospatial_obs'.
     """
-    cycles = _slice_by_single_index(cycles_df, id_index=sensor_id)
-    sensor = _slice_by_single_index(sensors_df, id_index=sensor_id)
     # Get df's with number of observation by day
-    dfs = [daily_data_points_by_id(df) for df in [cycles, sensor]]
+    dfs = [daily_data_points_by_id(df, devid=sensor_id)
+           for df in [cycles_df, sensors_df]]
     geospatial_data = True if isinstance(geospatial_df, pd.DataFrame) else False
     if geospatial_data:
         location_id = location_id_of_sensor(sensor_id, devices_file)
-        geospatial_records = _slice_by_single_index(geospatial_df,
-                                                    id_index=location_id)
-        dfs.append(daily_data_points_by_id(geospatial_records))
+        dfs.append(daily_data_points_by_id(geospatial_df, devid=location_id))
     # Get df's with number of observation by day, for each of 3 types of data
     if geospatial_data:
         cycles, sensor, geospatial = (df.set_index(df.index.droplevel())
@@ -159,17 +300,114 @@ def daily_data_points_by_id(df, devid=None):
         daily_obs_df (pandas DataFrame): DataFrame indexed by date, and
         with counts of observations as values.
     """
-    # 1) Groups the DataFrame by the primary ID and by time.
-    # 2) Gives count of records within groups.
+    daily = _daily_counts(df)
     if devid is not None:
-        df = _slice_by_single_index(df, id_index=devid)
+        row = daily.ids.get_loc(devid)
+        days = np.flatnonzero(daily.records[row])
+        rows = np.full(len(days), row, dtype=np.int64)
+    else:
+        rows, days = np.nonzero(daily.records)
     time_level = _get_time_level_of_df_multiindex(df)
-    daily_df = (df.groupby([df.index.get_level_values(level=0),
-                            pd.TimeGrouper('D', level=time_level)])
-                .count())
+    index = pd.MultiIndex.from_arrays(
+        [daily.ids[rows],
+         pd.to_datetime(days + daily.first_day, unit='D')],
+        names=[df.index.names[0], df.index.names[time_level]])
+    daily_df = pd.DataFrame(daily.counts[rows, days].astype(np.int64),
+                            index=index, columns=df.columns)
     return daily_df
 
 
+def clear_daily_counts_cache():
+    """Removes the daily counts of observations that are kept in memory for DataFrames after they are summarized by day, with functions such as daily_data_points_by_id() or days_of_data_by_id().
+
+    The daily counts of a DataFrame are removed automatically once the DataFrame is deleted, or counted again if its index or columns are replaced. Clearing is needed if values in a DataFrame are modified in place.
+
+    Returns:
+        removed (int): Number of DataFrames whose daily counts were removed.
+    """
+    return _DATAFRAME_REGISTRY.clear('daily_counts')
+
+
+class _DataFrameRegistry(object):
+    """Keeps results derived from DataFrames, such as daily counts, until the
+    DataFrame is deleted (through a weak reference), or its index or columns
+    are replaced."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, df, key, builder):
+        """Returns the result of builder(df) under the key, which is only
+        called if there is no result yet for the DataFrame."""
+        with self._lock:
+            entry = self._entries.get(id(df))
+        if (entry is not None and entry[0]() is df and entry[1] is df.index
+                and entry[2] is df.columns):
+            results = entry[3]
+        else:
+            df_ref = weakref.ref(df, partial(self._remove, id(df)))
+            results = {}
+            with self._lock:
+                self._entries[id(df)] = (df_ref, df.index, df.columns, results)
+        if key not in results:
+            results[key] = builder(df)
+        return results[key]
+
+    def clear(self, key=None):
+        """Removes the results under the key (or all results if it is None),
+        and returns the number of DataFrames whose results were removed."""
+        removed = 0
+        with self._lock:
+            for entry_key, entry in list(self._entries.items()):
+                if key is None:
+                    del self._entries[entry_key]
+                    removed += 1
+                elif entry[3].pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+    def _remove(self, entry_key, df_ref):
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] is df_ref:
+                del self._entries[entry_key]
+
+
+def _daily_counts(df):
+    """Returns _DailyCounts of the DataFrame, which are counted once and kept
+    until the DataFrame is deleted, or its index or columns are replaced."""
+    return _DATAFRAME_REGISTRY.cached(df, 'daily_counts',
+                                      _counted_by_id_and_day)
+
+
+def _counted_by_id_and_day(df):
+    """Returns _DailyCounts with the number of records and non-null values of
+    each column, by ID and day. Each record is assigned to a bin of its ID
+    and day (from integer codes for both), and the bins are counted with
+    numpy.bincount(), once for the records and once for each column. The
+    counts are kept as int32, since they are kept in memory along with the
+    DataFrame, and a count for one ID and day cannot exceed that type.
+    """
+    rows, ids = pd.factorize(df.index.get_level_values(0), sort=True)
+    days = pd.DatetimeIndex(_get_time_index(df)).asi8 // _NS_PER_DAY
+    first_day = days.min() if len(days) else 0
+    n_days = days.max() - first_day + 1 if len(days) else 0
+    bins = rows * n_days + (days - first_day)
+    size = len(ids) * n_days
+    records = np.bincount(bins, minlength=size).astype(np.int32).reshape(
+        len(ids), n_days)
+    counts = np.empty((len(ids), n_days, len(df.columns)), dtype=np.int32)
+    for col in range(len(df.columns)):
+        observed = df.iloc[:, col].notnull().values
+        counts[:, :, col] = np.bincount(bins[observed],
+                                        minlength=size).reshape(len(ids),
+                                                                n_days)
+    ids = pd.Index(ids, name=df.index.names[0])
+    return _DailyCounts(ids=ids, first_day=first_day, records=records,
+                        counts=counts)
+
+
 def df_select_ids(df, id_or_ids):
     """Returns pandas DataFrame that is restricted to a particular ID or IDs
     (device ID, or location ID in the case of geospatial data).
@@ -250,6 +488,12 @@ def _slice_by_one_index_in_triple_index(df, id_index=None, middle_index=None,
         raise ValueError('More than one index slice has been chosen. '
                          'This is not yet supported by this function.')
 
+    if not middle_index:
+        sliced_by_offsets = _offset_sliced(df, id_index=id_index or None,
+                                           time_index=time_index or None)
+        if sliced_by_offsets is not None:
+            return sliced_by_offsets
+
     idx = pd.IndexSlice
     if id_index:
         idx_arg = _slice_by_id_in_triple_index(id_index)
@@ -353,6 +597,11 @@ def _slice_by_one_index_in_double_index(df, id_index=None, time_index=None):
         raise ValueError('More than one index slice has been chosen. '
                          'This is not yet supported by this function.')
 
+    sliced_by_offsets = _offset_sliced(df, id_index=id_index or None,
+                                       time_index=time_index or None)
+    if sliced_by_offsets is not None:
+        return sliced_by_offsets
+
     if id_index:
         idx_arg = _slice_by_id_in_double_index(id_index)
 
@@ -369,6 +618,89 @@ def _slice_by_one_index_in_double_index(df, id_index=None, time_index=None):
     return sliced_by_one
 
 
+def _offset_index(df):
+    """Returns _OffsetIndex of the DataFrame, which is built once and kept
+    until the DataFrame is deleted, or its index is replaced. Returns None if
+    the DataFrame is not sorted by a MultiIndex ending with time stamps."""
+    return _DATAFRAME_REGISTRY.cached(df, 'offset_index', _indexed_by_offsets)
+
+
+def _indexed_by_offsets(df):
+    index = df.index
+    if (not isinstance(index, pd.MultiIndex) or not len(index) or
+            index.levels[-1].dtype.kind != 'M' or
+            not index.is_monotonic_increasing):
+        return None
+    codes = _index_codes(index)
+    new_id = np.ones(len(index), dtype=bool)
+    new_id[1:] = codes[0][1:] != codes[0][:-1]
+    new_group = new_id.copy()
+    for level_codes in codes[1:-1]:
+        new_group[1:] |= level_codes[1:] != level_codes[:-1]
+    id_starts = np.flatnonzero(new_id)
+    return _OffsetIndex(ids=index.get_level_values(0)[id_starts],
+                        id_offsets=np.append(id_starts, len(index)),
+                        group_offsets=np.append(np.flatnonzero(new_group),
+                                                len(index)),
+                        times=pd.DatetimeIndex(
+                            index.get_level_values(-1)).asi8)
+
+
+def _index_codes(index):
+    # MultiIndex.labels was renamed MultiIndex.codes in pandas 0.24
+    codes = getattr(index, 'codes', None)
+    if codes is None:
+        codes = index.labels
+    return [np.asarray(level_codes) for level_codes in codes]
+
+
+def _offset_sliced(df, id_index=None, time_index=None):
+    """Returns the rows of the DataFrame with the ID or range of IDs (see
+    _slice_by_id_in_double_index()), within the time range, based on binary
+    searches of its _OffsetIndex. The rows are a slice of the DataFrame,
+    unless the time range is applied to more than one group of rows, without
+    sorting. Returns None if there is no _OffsetIndex, or the time range is
+    not given by datetimes (strings are left to pandas).
+    """
+    if time_index is not None and not all(
+            bound is None or isinstance(bound, (dt.date, np.datetime64))
+            for bound in time_index):
+        return None
+    offsets = _offset_index(df)
+    if offsets is None:
+        return None
+
+    first, last = 0, len(df)
+    if id_index is not None:
+        if isinstance(id_index, tuple) or isinstance(id_index, list):
+            min_id, max_id = id_index[0], id_index[1]
+            lo = offsets.ids.searchsorted(min_id, side='left')
+            hi = offsets.ids.searchsorted(max_id + 1, side='right')
+        else:
+            lo = offsets.ids.get_loc(id_index)
+            hi = lo + 1
+        first, last = offsets.id_offsets[lo], offsets.id_offsets[hi]
+    if time_index is None or time_index == (None, None):
+        return df.iloc[first:last]
+
+    min_time, max_time = time_index[0], time_index[1]
+    min_ns = (pd.Timestamp(min_time).value if min_time is not None
+              else np.iinfo(np.int64).min)
+    max_ns = (pd.Timestamp(max_time).value if max_time is not None
+              else np.iinfo(np.int64).max)
+    times = offsets.times[first:last]
+    groups_within = (np.searchsorted(offsets.group_offsets, last, side='left') -
+                     np.searchsorted(offsets.group_offsets, first,
+                                     side='right'))
+    if groups_within <= 0:
+        # The rows are within one group, in which time stamps are sorted
+        lo, hi = (np.searchsorted(times, min_ns, side='left'),
+                  np.searchsorted(times, max_ns, side='right'))
+        return df.iloc[first + lo:first + hi]
+    within = (times >= min_ns) & (times <= max_ns)
+    return df.iloc[first + np.flatnonzero(within)]
+
+
 def _sort_by_timestamps(df):
     time_label = _get_time_label_of_data(df)
     df.sort_values(time_label, inplace=True)
@@ -402,6 +734,9 @@ def count_of_data_points_for_select_id(df, id):
     Returns:
         data_points (int): Number of observations for the given ID in the DataFrame.
     """
+    sliced_by_offsets = _offset_sliced(df, id_index=id)
+    if sliced_by_offsets is not None:
+        return sliced_by_offsets.count()
     idx = pd.IndexSlice
     return df.loc[idx[id, :], :].count()
 
@@ -417,12 +752,20 @@ def location_id_of_sensor(sensor_id, devices_file):
     Returns:
         location_id (int): Location ID.
     """
+    # The devices file is only read again if it is modified
+    device_locations = _METADATA_REGISTRY.cached(
+        devices_file, 'device_locations',
+        partial(_device_locations, devices_file))
+    return device_locations[sensor_id]
+
+
+def _device_locations(devices_file):
+    """Returns dict of device IDs and location IDs from the devices file."""
     device_df = pd.read_csv(devices_file,
                             usecols=[str(SENSOR_DEVICE_ID),
                                      str(SENSOR_LOCATION_ID)],
                             index_col=0)
-    idx = pd.IndexSlice
-    return device_df.loc[idx[sensor_id, SENSOR_LOCATION_ID]]
+    return device_df[SENSOR_LOCATION_ID].to_dict()
 
 
 def _get_id_index_column_label(df):
@@ -489,6 +832,10 @@ def _get_column_of_data_label(df, label):
 
 
 def _sliced_by_id_or_ids_and_time_index(df, id_or_ids, start, end):
+    sliced_by_offsets = _offset_sliced(df, id_index=id_or_ids or None,
+                                       time_index=(start, end))
+    if sliced_by_offsets is not None:
+        return sliced_by_offsets
     if id_or_ids:
         sliced_by_id = _slice_by_single_index(df, id_index=id_or_ids)
     else:
@@ -502,14 +849,12 @@ def squared_avg_daily_data_points_per_id(df):
     LocationId) and by day. The value column has the count of data points
     per day.
     """
-    time_index_level = _get_time_level_of_df_multiindex(df)
-    grp_daily_by_id = df.groupby([df.index.get_level_values(level=0),
-                                  pd.TimeGrouper('D', level=time_index_level)])
-    return (grp_daily_by_id
-            .count()
-            .groupby(level=0)
-            .mean()
-            .applymap(np.square))
+    daily = _daily_counts(df)
+    days_with_records = (daily.records > 0).sum(axis=1)
+    avg_daily_counts = (daily.counts.sum(axis=1, dtype=np.int64) /
+                        days_with_records[:, None])
+    return pd.DataFrame(np.square(avg_daily_counts), index=daily.ids,
+                        columns=df.columns)
 
 
 def counts_by_primary_id_squared(df):
@@ -639,3 +984,7 @@ def count_observations_in_intervals_for_sensor_id(df, sensor_id, interval='D'):
                            .resample(interval)
                            .count())
     return count_temps_per_day
+
+
+# Registry of the daily counts and offset indexes of DataFrames
+_DATAFRAME_REGISTRY = _DataFrameRegistry()
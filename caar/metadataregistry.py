@@ -0,0 +1,82 @@
+from __future__ import absolute_import, division, print_function
+
+import os.path
+import threading
+
+from future import standard_library
+standard_library.install_aliases()
+
+
+class MetadataRegistry(object):
+    """Keeps the contents of metadata files (the sensors or devices file and the postal codes file), and the indexes derived from them, so that each file is only read once.
+
+    Each result is stored under a key, along with the modification time and size of the files that it was derived from. A result is loaded again once any of those files changes.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, paths, key, loader):
+        """Returns the result of loader() (called without arguments) for the files in paths and the key, which is only called if there is no result yet or any of the files has changed since.
+
+        Args:
+            paths (str or tuple of str): File(s) that the result is derived from.
+
+            key (hashable): Identifies the result among the results for the same files.
+
+            loader (function): Returns the result. It should not have side effects, since it may be called more than once if threads request the same result at the same time.
+
+        Returns:
+            result: Return value of loader().
+        """
+        paths = tuple(paths) if isinstance(paths, (tuple, list)) else (paths,)
+        abs_paths = tuple(os.path.abspath(str(path)) for path in paths)
+        stamps = tuple(_file_stamp(path) for path in abs_paths)
+        entry_key = (abs_paths, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+        if entry is not None and entry[0] == stamps:
+            return entry[1]
+
+        result = loader()
+        with self._lock:
+            self._entries[entry_key] = (stamps, result)
+        return result
+
+    def clear(self, metadata_file=None):
+        """Removes the results derived from metadata_file, or all results if it is None. Returns the number of results removed."""
+        with self._lock:
+            if metadata_file is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            path = os.path.abspath(str(metadata_file))
+            entry_keys = [entry_key for entry_key in self._entries
+                          if path in entry_key[0]]
+            for entry_key in entry_keys:
+                del self._entries[entry_key]
+            return len(entry_keys)
+
+
+def clear_metadata_cache(metadata_file=None):
+    """Removes the contents of metadata files (sensors, devices or postal code files) that are kept in memory after they are read by functions such as dict_from_file() with a states argument, or location_id_of_sensor().
+
+    The contents of a file are read again automatically once the file is modified, so clearing is only needed to reclaim memory.
+
+    Args:
+        metadata_file (Optional[str]): If specified, only the contents derived from this file are removed. Otherwise, all contents are removed.
+
+    Returns:
+        removed (int): Number of results removed.
+    """
+    return _METADATA_REGISTRY.clear(metadata_file)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+# Registry shared by all of the functions that read metadata files
+_METADATA_REGISTRY = MetadataRegistry()
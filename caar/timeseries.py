@@ -1,7 +1,15 @@
 from __future__ import absolute_import, division, print_function
+from collections import OrderedDict
 import datetime as dt
+from io import open
+import json
+import multiprocessing
 import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from caar.cleanthermostat import _unicode_str, _validate_workers,            \
+    _device_zips, _sensors_df, _zip_states
+from caar.detectioncache import _json_default
 from caar.histsummary import location_id_of_sensor, _get_time_column_of_data,  \
     _get_time_level_of_df_multiindex, _sliced_by_id_or_ids_and_time_index,     \
     _get_column_of_data_label, _get_time_index
@@ -10,9 +18,30 @@ from future import standard_library
 standard_library.install_aliases()
 
 
+# Number of elements of the arrays of changes in status at the bounds of
+# cycles that are counted at once (see _status_within_slices_by_row())
+_STATUS_BLOCK_SIZE = 2 ** 22
+
+_RESAMPLE_MODES = ('round', 'fraction', 'seconds')
+
+_AGG_MODES = ('mean', 'last', 'min', 'max', 'time_weighted', 'count')
+
+_GROUP_BY_MODES = ('state', 'zip')
+
+# Sidecar index of the array file written by fleet_cycling_and_obs_arrays()
+_FLEET_INDEX_EXTENSION = '.index.json'
+_FLEET_INDEX_FORMAT = 'caar-fleet'
+_FLEET_INDEX_VERSION = 1
+
+# Number of tasks per worker process, so that the workers remain busy when
+# some devices take longer than others
+_FLEET_TASKS_PER_WORKER = 4
+
+
 def cycling_and_obs_arrays(cycles_df=None, cycling_id=None, sensors_df=None,
                            sensor_id=None, geospatial_df=None, start=None,
-                           end=None, sensors_file=None, freq='1min'):
+                           end=None, sensors_file=None, freq='1min',
+                           as_datetime64=False):
     """Returns 2-tuple containing two NumPy arrays: the first is a time series at the specified frequency, and the second is an array of vectors at the specified frequency ('freq'), such that all data corresponds to the time stamps in the first array. The first column contains ON/OFF status of the cycling device. The remaining column or columns contain sensor and/or geospatial data. For cycle data, ON status is given by 1's (as floats), and OFF status is given by 0's. For sensor or geospatial data, intervals without actual observations are filled with numpy.nan.
 
     Args:
@@ -34,6 +63,8 @@ def cycling_and_obs_arrays(cycles_df=None, cycling_id=None, sensors_df=None,
 
         sensors_file (Optional[str]): File path. Is only needed if the sensor has associated geospatial data. The sensors file should contain a location ID with a foreign key column in the geospatial data.
 
+        as_datetime64 (Optional[bool]): If True, the datetimes are a numpy.datetime64 array instead of an array of Python datetimes. See on_off_status(). Default: False.
+
     Returns:
         times, cycles_and_obs (2-tuple of NumPy arrays): The tuple contains
         a NumPy array of datetimes, and a NumPy array of cycle status (ON/OFF) and sensor and/or geospatial data, with a vector for each datetime. While cycle data points are always always 1 or 0, sensor and geospatial data are numpy.nan in intervals for which there are no recorded observations.
@@ -45,7 +76,23 @@ def cycling_and_obs_arrays(cycles_df=None, cycling_id=None, sensors_df=None,
     else:
         raise ValueError('A DataFrame besides cycles DataFrame was expected, but '
                          'has not been not specified in the arguments.')
-    times, on_off = on_off_status(cycles_df, id=cycling_id, start=start, end=end, freq=freq)
+    if geospatial_df is not None:
+        location_id = location_id_of_sensor(sensor_id, sensors_file)
+    else:
+        location_id = None
+
+    return _cycling_and_obs_columns(cycles_df, cycling_id, sensors_df,
+                                    sensor_id, geospatial_df, location_id,
+                                    start, end, freq,
+                                    as_datetime64=as_datetime64)
+
+
+def _cycling_and_obs_columns(cycles_df, cycling_id, sensors_df, sensor_id,
+                             geospatial_df, location_id, start, end, freq,
+                             as_datetime64=False):
+    times, on_off = on_off_status(cycles_df, id=cycling_id, start=start,
+                                  end=end, freq=freq,
+                                  as_datetime64=as_datetime64)
 
     stackables = [on_off]
 
@@ -58,7 +105,6 @@ def cycling_and_obs_arrays(cycles_df=None, cycling_id=None, sensors_df=None,
         stackables.append(sensor_obs)
 
     if geospatial_df is not None:
-        location_id = location_id_of_sensor(sensor_id, sensors_file)
         outside_index, outside_obs = sensor_obs_arr_by_freq(geospatial_df,
                                                             id=location_id,
                                                             **kwargs)
@@ -69,6 +115,163 @@ def cycling_and_obs_arrays(cycles_df=None, cycling_id=None, sensors_df=None,
     return times, cycles_and_obs
 
 
+def fleet_cycling_and_obs_arrays(out_file, cycles_df, sensors_df=None,
+                                 ids=None, geospatial_df=None, start=None,
+                                 end=None, sensors_file=None, freq='1min',
+                                 workers=1, as_datetime64=False):
+    """Computes the same arrays as cycling_and_obs_arrays() for many devices, and writes them into a single NumPy (.npy) file with a 3D array of devices x times x channels. The device order, time axis and channels are recorded in a sidecar index file (out_file + '.index.json'). The file can be opened again as a memory-mapped array with fleet_arrays_from_file().
+
+    Each device ID is used both as the cycling device ID and as the sensor ID, and the location IDs of the sensors are looked up once, before the arrays are computed.
+
+    Args:
+        out_file (str): Path of the output .npy file. It is overwritten if it exists.
+
+        cycles_df (pandas DataFrame): Cycles DataFrame from **history** module.
+
+        sensors_df (Optional[pandas DataFrame]): Sensors DataFrame from **history** module.
+
+        ids (Optional[list of ints or strings]): Device IDs, in the order of the devices in the output. By default, the IDs in the cycles DataFrame (and the sensors DataFrame, if any), in sorted order.
+
+        geospatial_df (Optional[pandas DataFrame]): Geospatial DataFrame from **history** module. If there is a geospatial DataFrame, the sensors_file is needed.
+
+        start (Optional[datetime.datetime]): First time to include in output. Default is the latest first time stamp in the sensors and geospatial DataFrames.
+
+        end (Optional[datetime.datetime]): Last time to include in output. Default is the earliest last time stamp in the sensors and geospatial DataFrames.
+
+        sensors_file (Optional[str]): File path. Is only needed if there is a geospatial DataFrame. See cycling_and_obs_arrays().
+
+        freq (str): Frequency, expressed in forms such as '1min', '30s', '1min30s', etc.
+
+        workers (Optional[int]): Number of processes that compute the arrays. If greater than 1, the devices are divided into groups that are computed in parallel, each process writing its devices directly into the memory-mapped output file. Default: 1.
+
+        as_datetime64 (Optional[bool]): If True, the datetimes are a numpy.datetime64 array. See on_off_status(). Default: False.
+
+    Returns:
+        times, ids, cycles_and_obs (3-tuple of NumPy arrays): 1D array of datetimes, 1D array of device IDs, and read-only memory-mapped 3D array (numpy.float64) with the cycle status and observations of each device at each time, in the same channels (columns) as cycling_and_obs_arrays().
+    """
+    _validate_workers(workers)
+    dfs = [df for df in [sensors_df, geospatial_df] if df is not None]
+    if not dfs:
+        raise ValueError('A DataFrame besides cycles DataFrame was expected, but '
+                         'has not been not specified in the arguments.')
+    start, end = _common_start_end_across_dfs(dfs, start=start, end=end)
+    start = _latest_starting_timestamp_in_dfs(dfs) if start is None else start
+    end = _earliest_ending_timestamp_in_dfs(dfs) if end is None else end
+    ids = _fleet_ids(cycles_df, sensors_df, ids)
+    if geospatial_df is not None:
+        location_ids = [location_id_of_sensor(id, sensors_file) for id in ids]
+    else:
+        location_ids = [None] * len(ids)
+    channels = ['on_off']
+    for df in dfs:
+        channels.extend(df.columns[_non_string_df_col_indexes(df)])
+    dt_index = pd.DatetimeIndex(start=start, end=end, freq=freq)
+
+    cycles_and_obs = np.lib.format.open_memmap(str(out_file), mode='w+',
+                                               dtype=np.float64,
+                                               shape=(len(ids), len(dt_index),
+                                                      len(channels)))
+    del cycles_and_obs
+    dfs_args = (cycles_df, sensors_df, geospatial_df, start, end, freq)
+    if workers > 1:
+        tasks = _fleet_tasks(out_file, ids, location_ids, dfs_args,
+                             workers * _FLEET_TASKS_PER_WORKER)
+        pool = multiprocessing.Pool(processes=workers)
+        try:
+            pool.map(_write_fleet_rows, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _write_fleet_rows((out_file, 0, ids, location_ids) + dfs_args)
+
+    index = OrderedDict([('format', _FLEET_INDEX_FORMAT),
+                         ('version', _FLEET_INDEX_VERSION),
+                         ('ids', list(ids)), ('location_ids', location_ids),
+                         ('channels', list(channels)),
+                         ('start', pd.Timestamp(start).isoformat()),
+                         ('freq', freq), ('length', len(dt_index))])
+    with open(str(out_file) + _FLEET_INDEX_EXTENSION, 'w',
+              encoding='UTF-8') as fout:
+        fout.write(_unicode_str(json.dumps(index, default=_json_default)))
+
+    return fleet_arrays_from_file(out_file, as_datetime64=as_datetime64)
+
+
+def fleet_arrays_from_file(out_file, as_datetime64=False):
+    """Returns the arrays written by fleet_cycling_and_obs_arrays(), with the array of devices x times x channels memory-mapped, so that it is not read into memory.
+
+    Args:
+        out_file (str): Path of the .npy file written by fleet_cycling_and_obs_arrays().
+
+        as_datetime64 (Optional[bool]): If True, the datetimes are a numpy.datetime64 array. See on_off_status(). Default: False.
+
+    Returns:
+        times, ids, cycles_and_obs (3-tuple of NumPy arrays): See fleet_cycling_and_obs_arrays().
+    """
+    with open(str(out_file) + _FLEET_INDEX_EXTENSION, encoding='UTF-8') as fin:
+        index = json.load(fin)
+    if index.get('format') != _FLEET_INDEX_FORMAT:
+        raise ValueError(str(out_file) + ' does not have a fleet index.')
+    dt_index = pd.DatetimeIndex(start=pd.Timestamp(index['start']),
+                                periods=index['length'], freq=index['freq'])
+    cycles_and_obs = np.load(str(out_file), mmap_mode='r')
+    return (_time_axis(dt_index, as_datetime64), np.array(index['ids']),
+            cycles_and_obs)
+
+
+def _fleet_ids(cycles_df, sensors_df, ids=None):
+    if ids is not None:
+        return list(ids)
+    fleet_ids = cycles_df.index.get_level_values(0).unique()
+    if sensors_df is not None:
+        fleet_ids = fleet_ids.intersection(
+            sensors_df.index.get_level_values(0).unique())
+    return list(fleet_ids.sort_values())
+
+
+def _fleet_tasks(out_file, ids, location_ids, dfs_args, number_of_tasks):
+    """Returns list of the arguments of _write_fleet_rows() for groups of
+    consecutive devices, with the DataFrames limited to the devices of each
+    group, so that only those rows are sent to the worker processes.
+    """
+    cycles_df, sensors_df, geospatial_df, start, end, freq = dfs_args
+    tasks = []
+    bounds = np.linspace(0, len(ids), min(number_of_tasks, len(ids)) + 1)
+    bounds = bounds.astype(np.int64)
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        task_ids = ids[first:last]
+        task_location_ids = location_ids[first:last]
+        tasks.append((out_file, first, task_ids, task_location_ids,
+                      _rows_of_ids(cycles_df, task_ids),
+                      _rows_of_ids(sensors_df, task_ids),
+                      _rows_of_ids(geospatial_df, task_location_ids),
+                      start, end, freq))
+    return tasks
+
+
+def _rows_of_ids(df, ids):
+    if df is None:
+        return None
+    return df[df.index.get_level_values(0).isin(ids)]
+
+
+def _write_fleet_rows(task):
+    """Computes the arrays of the devices in the task and writes them into
+    consecutive rows of the memory-mapped output file, starting at row first.
+    """
+    (out_file, first, ids, location_ids, cycles_df, sensors_df, geospatial_df,
+     start, end, freq) = task
+    cycles_and_obs = np.load(str(out_file), mmap_mode='r+')
+    for row, (id, location_id) in enumerate(zip(ids, location_ids)):
+        _, device_arr = _cycling_and_obs_columns(cycles_df, id, sensors_df, id,
+                                                 geospatial_df, location_id,
+                                                 start, end, freq)
+        cycles_and_obs[first + row] = device_arr
+    cycles_and_obs.flush()
+    del cycles_and_obs
+
+
 def _common_start_end_across_dfs(dfs, start=None, end=None):
     common_start = _latest_starting_timestamp_in_dfs(dfs)
     if start and start < common_start:
@@ -103,7 +306,8 @@ def _earliest_ending_timestamp_in_dfs(dfs):
     return earliest
 
 
-def on_off_status(df, id=None, start=None, end=None, freq='1min'):
+def on_off_status(df, id=None, start=None, end=None, freq='1min',
+                  resample='round', as_datetime64=False):
     """Returns a tuple of two NumPy arrays: a 1D NumPy array with datetimes, and a NumPy array with corresponding ON/OFF status as 1 or 0 (numpy.int8) for each interval at the frequency specified.
 
     Args:
@@ -117,30 +321,386 @@ def on_off_status(df, id=None, start=None, end=None, freq='1min'):
 
         freq (str): Frequency in a pandas-recognized format. Default value is '1min'.
 
+        resample (Optional[str]): {'round', 'fraction', 'seconds'} With 'round' (default), the starting and ending times of cycles are rounded to the frequency, and each interval is ON (1) or OFF (0). With 'fraction' or 'seconds', the status is the exact fraction of each interval, or the number of seconds, during which the device was ON, based on the actual starting and ending times of the cycles (numpy.float64). Each interval then starts at its datetime and lasts for the frequency, and cycles that started before start are included, so that coarse frequencies such as '15min' remain accurate.
+
+        as_datetime64 (Optional[bool]): If True, the datetimes are returned as a numpy.datetime64 array (8 bytes per interval), instead of an object array of Python datetimes. The start and step of the intervals are then times[0] and numpy.diff(times[:2]). Default: False.
+
     Returns:
-        A 2-tuple (tuple): 1D NumPy array with Python datetimes and 1D NumPy array of ON/OFF status as ints (numpy.int8).
+        A 2-tuple (tuple): 1D NumPy array with Python datetimes (or numpy.datetime64) and 1D NumPy array of ON/OFF status as ints (numpy.int8), or fractions or seconds of ON time (numpy.float64).
     """
+    _validate_resample(resample)
     dt_index = pd.DatetimeIndex(start=start, end=end, freq=freq)
-    pydatetime_index = dt_index.to_pydatetime()
-    dt_intervals = np.array(pydatetime_index)
+    dt_intervals = _time_axis(dt_index, as_datetime64)
+    if resample != 'round':
+        ids = pd.Index([id]) if id else None
+        on_time = _on_time_by_row(df, ids, start, len(dt_index), freq,
+                                  resample)
+        return dt_intervals, on_time[0]
     status = np.zeros(len(dt_index), dtype=np.int8)
     kwargs = {'id_or_ids': id, 'start': start, 'end': end, 'freq': freq}
     # Start and end times of ON cycles
     starts = _df_select_time_index_values(df, **kwargs)
     ends = _df_select_time_data_values(df, **kwargs)
     assert len(starts) == len(ends)
-    dt_delta = _timedelta_from_string(freq)
-    for cycle in range(len(starts)):
-        start_on, end_on = (_int_index_based_on_freq(time, pd.Timestamp(start), dt_delta)
-                            for time in (starts[cycle], ends[cycle]))
-        status[start_on:end_on + 1] = 1
+    dt_delta = _freq_timedelta(freq)
+    start_on, end_on = (_int_indexes_based_on_freq(times, pd.Timestamp(start),
+                                                   dt_delta)
+                        for times in (starts, ends))
+    status = _status_within_slices(start_on, end_on + 1, len(status))
     return dt_intervals, status
 
 
-def _int_index_based_on_freq(time_index, zero_index, freq):
-    delta = time_index - zero_index
-    int_index = int(delta/freq)
-    return int_index
+def _int_indexes_based_on_freq(time_index, zero_index, freq):
+    """Returns int64 array of the number of intervals of length freq between
+    zero_index and each time stamp in a DatetimeIndex, truncated toward zero.
+    As with dividing pandas Timedeltas, the deltas in nanoseconds are divided
+    as floats.
+    """
+    deltas = pd.DatetimeIndex(time_index).asi8 - pd.Timestamp(zero_index).value
+    return np.trunc(deltas.astype(np.float64) /
+                    float(freq.value)).astype(np.int64)
+
+
+def on_off_matrix(df, ids=None, start=None, end=None, freq='1min',
+                  packed=False, resample='round', as_datetime64=False):
+    """Returns a tuple of three NumPy arrays: a 1D array with datetimes, a 1D array with device IDs, and a 2D array with the ON/OFF status of each device (row) in each interval (column). Each row is the same as the status returned by on_off_status() for the device, but all of the devices are computed at once from the sorted cycles, without slicing the DataFrame for each device.
+
+    Args:
+        df (pandas DataFrame): The DataFrame should contain cycles data, and should have been created by the **history** module.
+
+        ids (Optional[list of ints or strings]): Device IDs, in the order of the rows. By default, all of the IDs in the DataFrame, in sorted order. Devices without cycles in the time range have rows of 0's.
+
+        start (Optional[datetime.datetime]): Starting datetime. Default is the earliest starting time of a cycle.
+
+        end (Optional[datetime.datetime]): Ending datetime. Default is the latest starting time of a cycle.
+
+        freq (str): Frequency in a pandas-recognized format. Default value is '1min'.
+
+        packed (Optional[bool]): If True, the status of 8 consecutive intervals is packed into each byte of the rows (see numpy.packbits()), so that the matrix (numpy.uint8) takes one eighth of the memory. Only for resample='round'. Default: False.
+
+        resample (Optional[str]): {'round', 'fraction', 'seconds'} See on_off_status(). Default: 'round'.
+
+        as_datetime64 (Optional[bool]): If True, the datetimes are a numpy.datetime64 array. See on_off_status(). Default: False.
+
+    Returns:
+        A 3-tuple (tuple): 1D NumPy array with Python datetimes (or numpy.datetime64), 1D NumPy array of device IDs, and 2D NumPy array of ON/OFF status as ints (numpy.int8), as packed bits (numpy.uint8) if packed is True, or as fractions or seconds of ON time (numpy.float64).
+    """
+    _validate_resample(resample)
+    if packed and resample != 'round':
+        raise ValueError('packed is only supported with resample=\'round\'.')
+    all_ids = df.index.get_level_values(0)
+    ids = pd.Index(all_ids.unique().sort_values() if ids is None else ids)
+    rows, times, ends = _cycle_rows_and_times(df, ids)
+    start = times.min() if start is None else start
+    end = times.max() if end is None else end
+    dt_index = pd.DatetimeIndex(start=start, end=end, freq=freq)
+    dt_intervals = _time_axis(dt_index, as_datetime64)
+    if resample != 'round':
+        on_time = _on_time_by_row(df, ids, start, len(dt_index), freq,
+                                  resample)
+        return dt_intervals, np.asarray(ids), on_time
+
+    # Cycles of the devices that start within the time range, as in the
+    # slices of the DataFrame taken by on_off_status()
+    keep = ((rows >= 0) & (times >= pd.Timestamp(start)) &
+            (times <= pd.Timestamp(end)))
+    dt_delta = _freq_timedelta(freq)
+    start_on, end_on = (_int_indexes_based_on_freq(cycle_times[keep].round(freq),
+                                                   pd.Timestamp(start),
+                                                   dt_delta)
+                        for cycle_times in (times, ends))
+    status = _status_within_slices_by_row(rows[keep], start_on, end_on + 1,
+                                          len(ids), len(dt_index))
+    if packed:
+        status = np.packbits(status, axis=1)
+    return dt_intervals, np.asarray(ids), status
+
+
+def _time_axis(dt_index, as_datetime64=False):
+    """Returns the datetimes of a DatetimeIndex as a datetime64[ns] array, or
+    as an object array of Python datetimes."""
+    if as_datetime64:
+        return np.asarray(pd.DatetimeIndex(dt_index).values)
+    return np.array(pd.DatetimeIndex(dt_index).to_pydatetime())
+
+
+def _validate_resample(resample):
+    if resample not in _RESAMPLE_MODES:
+        raise ValueError('resample argument must be one of: ' +
+                         ', '.join(_RESAMPLE_MODES) + '.')
+
+
+def _cycle_rows_and_times(df, ids=None):
+    """Returns tuple of the position of the ID of each cycle in ids (or -1 if
+    it is not there, or 0 for all cycles if ids is None), and DatetimeIndexes
+    of the starting and ending times of the cycles."""
+    if ids is None:
+        rows = np.zeros(len(df), dtype=np.int64)
+    else:
+        rows = ids.get_indexer(df.index.get_level_values(0))
+    times = pd.DatetimeIndex(_df_time_index(df))
+    time_column = _get_time_column_of_data(df)
+    ends = pd.DatetimeIndex(np.array(df.iloc[:, time_column]))
+    return rows, times, ends
+
+
+def _on_time_by_row(df, ids, start, n_intervals, freq, resample):
+    """Returns float64 array with a row for each of the ids (or a single row
+    for all cycles if ids is None) and a column for each interval of length
+    freq after start. The values are the fractions (if resample is
+    'fraction') or seconds of each interval in which the device was ON.
+    """
+    rows, times, ends = _cycle_rows_and_times(df, ids)
+    n_rows = 1 if ids is None else len(ids)
+    interval = _freq_timedelta(freq).value
+    origin = pd.Timestamp(start).value
+    span = n_intervals * interval
+    # Nanoseconds since start, limited to the intervals
+    on_starts, on_ends = (np.clip(cycle_times.asi8 - origin, 0, span)
+                          for cycle_times in (times, ends))
+    overlap = (rows >= 0) & (on_ends > on_starts)
+    rows, on_starts, on_ends = _merged_on_periods(rows[overlap],
+                                                  on_starts[overlap],
+                                                  on_ends[overlap])
+
+    # Total ON time before each interval boundary k * interval, which grows
+    # by one for each nanosecond from the start of a period to its end.
+    # Rates and offsets change at the first boundary after each start or end.
+    width = n_intervals + 2
+    rates = np.zeros(n_rows * width, dtype=np.int64)
+    offsets = np.zeros(n_rows * width, dtype=np.int64)
+    start_positions = rows * width + on_starts // interval + 1
+    end_positions = rows * width + on_ends // interval + 1
+    np.add.at(rates, start_positions, 1)
+    np.add.at(rates, end_positions, -1)
+    np.add.at(offsets, start_positions, -on_starts)
+    np.add.at(offsets, end_positions, on_ends)
+    boundaries = np.arange(n_intervals + 1, dtype=np.int64) * interval
+    on_time_before = (np.cumsum(rates.reshape(n_rows, width), axis=1)[:, :-1] *
+                      boundaries +
+                      np.cumsum(offsets.reshape(n_rows, width), axis=1)[:, :-1])
+    on_time = np.diff(on_time_before, axis=1)
+    if resample == 'fraction':
+        return on_time / float(interval)
+    return on_time / 1e9
+
+
+def _merged_on_periods(rows, on_starts, on_ends):
+    """Returns tuple of the rows, starts and ends of the periods in which the
+    device of each row was ON, sorted by row and start, with overlapping
+    cycles of the same row merged into one period, so that ON time is only
+    counted once."""
+    order = np.lexsort((on_starts, rows))
+    rows, on_starts, on_ends = rows[order], on_starts[order], on_ends[order]
+    if not len(rows):
+        return rows, on_starts, on_ends
+    latest_ends = pd.Series(on_ends).groupby(rows).cummax().values
+    new_period = np.ones(len(rows), dtype=bool)
+    new_period[1:] = ((rows[1:] != rows[:-1]) |
+                      (on_starts[1:] > latest_ends[:-1]))
+    period_starts = np.flatnonzero(new_period)
+    period_ends = np.maximum.reduceat(on_ends, period_starts)
+    return rows[period_starts], on_starts[period_starts], period_ends
+
+
+def _status_within_slices(slice_starts, slice_stops, length):
+    """Returns int8 array of the given length, with 1 within each slice
+    [start:stop] and 0 elsewhere, which is the same as assigning 1 to each
+    slice in turn. See _status_within_slices_by_row().
+    """
+    rows = np.zeros(len(slice_starts), dtype=np.int64)
+    return _status_within_slices_by_row(rows, slice_starts, slice_stops, 1,
+                                        length)[0]
+
+
+def _status_within_slices_by_row(rows, slice_starts, slice_stops, n_rows,
+                                 length):
+    """Returns int8 array with n_rows rows of the given length, with 1 within
+    each slice [start:stop] of the row given in rows, and 0 elsewhere. The
+    bounds are adjusted as for Python slices (negative bounds count from the
+    end). Instead of assigning each slice, 1 is added where a slice starts and
+    subtracted where it stops, so that the cumulative sum along each row is
+    positive within the slices. The changes are counted for a block of rows
+    at a time, to limit the memory used.
+    """
+    bounds = []
+    for slice_bounds in (slice_starts, slice_stops):
+        slice_bounds = np.where(slice_bounds < 0, slice_bounds + length,
+                                slice_bounds)
+        bounds.append(np.clip(slice_bounds, 0, length))
+    slice_starts, slice_stops = bounds
+    nonempty = slice_stops > slice_starts
+    order = np.argsort(rows[nonempty], kind='mergesort')
+    rows, slice_starts, slice_stops = (arr[nonempty][order] for arr
+                                       in (rows, slice_starts, slice_stops))
+
+    status = np.zeros((n_rows, length), dtype=np.int8)
+    width = length + 1
+    block_rows = max(1, _STATUS_BLOCK_SIZE // width)
+    for first_row in range(0, n_rows, block_rows):
+        last_row = min(first_row + block_rows, n_rows)
+        lo, hi = np.searchsorted(rows, [first_row, last_row])
+        offsets = (rows[lo:hi] - first_row) * width
+        size = (last_row - first_row) * width
+        changes = (np.bincount(offsets + slice_starts[lo:hi], minlength=size) -
+                   np.bincount(offsets + slice_stops[lo:hi], minlength=size))
+        changes = changes.reshape(last_row - first_row, width)[:, :length]
+        status[first_row:last_row] = np.cumsum(changes, axis=1) > 0
+    return status
+
+
+def concurrency_profile(df, start=None, end=None, freq='1min', ids=None,
+                        average=False, weight=None, group_by=None,
+                        devices_file=None, postal_file=None,
+                        as_datetime64=False):
+    """Returns the number of devices that are ON at each datetime at the frequency specified (the concurrency profile of the fleet), optionally weighted by a column of the devices file such as 'AcKilowatts' (the load of the fleet), and optionally for each state or postal code.
+
+    The starting and ending times of all of the cycles are sorted once as events that add or subtract the weight of a device, so that the profile is the cumulative sum of the events, without computing the status of each device (see on_off_matrix()). Overlapping cycles of the same device are only counted once.
+
+    Args:
+        df (pandas DataFrame): The DataFrame should contain cycles data, and should have been created by the **history** module.
+
+        start (Optional[datetime.datetime]): Starting datetime. Default is the earliest starting time of a cycle.
+
+        end (Optional[datetime.datetime]): Ending datetime. Default is the latest starting time of a cycle.
+
+        freq (str): Frequency in a pandas-recognized format. Default value is '1min'.
+
+        ids (Optional[list of ints or strings]): Device IDs. By default, all of the IDs in the DataFrame.
+
+        average (Optional[bool]): If False (default), the values are the number (or total weight) of the devices that are ON at each datetime. If True, the values are the averages over each interval, which starts at its datetime and lasts for the frequency (numpy.float64). With a weight in kilowatts, the average times the length of the interval in hours is the energy used in the interval, in kilowatt-hours.
+
+        weight (Optional[str]): Label of a numeric column in the devices file, such as 'AcKilowatts', by which each device is weighted. Devices that are not in the devices file or have no value are not counted. By default, each device counts as 1.
+
+        group_by (Optional[str]): {'state', 'zip'} If specified, there is a profile for each state (based on the postal codes file) or postal code of the devices, and devices whose state or postal code is not known are not counted.
+
+        devices_file (Optional[str]): Devices (thermostats) file. Required if weight or group_by is specified.
+
+        postal_file (Optional[str]): Postal codes file. Required if group_by is 'state'.
+
+        as_datetime64 (Optional[bool]): If True, the datetimes are a numpy.datetime64 array. See on_off_status(). Default: False.
+
+    Returns:
+        A 2-tuple (tuple) or 3-tuple (tuple): 1D NumPy array with Python datetimes (or numpy.datetime64), and 1D NumPy array of the number of devices ON (numpy.int64), or of weights or averages (numpy.float64). If group_by is specified, a 1D NumPy array of states or postal codes (strings) is the second element, and the profiles are a 2D NumPy array with a row for each of them.
+    """
+    if group_by is not None and group_by not in _GROUP_BY_MODES:
+        raise ValueError('group_by argument must be one of: ' +
+                         ', '.join(_GROUP_BY_MODES) + '.')
+    if (weight is not None or group_by is not None) and devices_file is None:
+        raise ValueError('devices_file is required if weight or group_by is '
+                         'specified.')
+    if group_by == 'state' and postal_file is None:
+        raise ValueError('postal_file is required if group_by is \'state\'.')
+
+    all_ids = df.index.get_level_values(0)
+    ids = pd.Index(all_ids.unique().sort_values() if ids is None else ids)
+    rows, times, ends = _cycle_rows_and_times(df, ids)
+    start = times.min() if start is None else start
+    end = times.max() if end is None else end
+    dt_index = pd.DatetimeIndex(start=start, end=end, freq=freq)
+    dt_intervals = _time_axis(dt_index, as_datetime64)
+
+    device_weights, device_groups, groups = _device_weights_and_groups(
+        ids, weight, group_by, devices_file, postal_file)
+    counted = (rows >= 0) & (ends.asi8 > times.asi8)
+    counted[counted] = (np.isfinite(device_weights[rows[counted]]) &
+                        (device_groups[rows[counted]] >= 0))
+    rows, on_starts, on_ends = _merged_on_periods(rows[counted],
+                                                  times.asi8[counted],
+                                                  ends.asi8[counted])
+
+    weights = device_weights[rows]
+    if weight is None:
+        weights = weights.astype(np.int64)
+    interval = _freq_timedelta(freq).value
+    bounds = dt_index.asi8
+    if average:
+        bounds = np.append(bounds, bounds[-1] + interval)
+    profiles = _concurrency_by_group(device_groups[rows], on_starts, on_ends,
+                                     weights, len(groups), bounds, average)
+    if average:
+        profiles = np.diff(profiles, axis=1) / (interval / 1e9)
+    if group_by is None:
+        return dt_intervals, profiles[0]
+    return dt_intervals, groups, profiles
+
+
+def _device_weights_and_groups(ids, weight, group_by, devices_file,
+                               postal_file):
+    """Returns tuple of float64 array of the weight of each of the ids (NaN if
+    it is not known), int64 array of the position of the group of each of the
+    ids (or -1 if it is not known), and array of the groups, sorted. Without
+    weight or group_by, the weights are 1 and there is a single group.
+    """
+    device_ids = [_unicode_str(str(device_id)) for device_id in ids]
+    if weight is None:
+        device_weights = np.ones(len(ids), dtype=np.float64)
+    else:
+        weights = pd.to_numeric(_sensors_df(devices_file, None)[weight],
+                                errors='coerce')
+        device_weights = weights.reindex(device_ids).values.astype(np.float64)
+    if group_by is None:
+        return device_weights, np.zeros(len(ids), dtype=np.int64), \
+            np.array([None])
+
+    device_zips = _device_zips(devices_file, None)
+    keys = [device_zips.get(device_id) for device_id in device_ids]
+    if group_by == 'state':
+        zip_states = _zip_states(postal_file, None)
+        keys = [zip_states.get(key) for key in keys]
+    groups = np.array(sorted(set(key for key in keys if key is not None)),
+                      dtype=np.unicode)
+    device_groups = pd.Index(groups).get_indexer(keys)
+    return device_weights, device_groups.astype(np.int64), groups
+
+
+def _concurrency_by_group(groups, on_starts, on_ends, weights, n_groups,
+                          bounds, average):
+    """Returns array with a row for each group and a column for each of the
+    bounds (nanoseconds), of the total weight of the periods [start, end) of
+    the group that include each bound, or if average is True, of the
+    cumulative ON time (in seconds, times weight) before each bound.
+
+    The starts and ends are sorted by group and time as events that add or
+    subtract a weight, so that the cumulative sum of the weights is the level
+    after each event. The level at each bound is the level after the last
+    event at or before it.
+    """
+    event_groups = np.concatenate((groups, groups))
+    event_times = np.concatenate((on_starts, on_ends))
+    event_weights = np.concatenate((weights, -weights))
+    order = np.lexsort((event_times, event_groups))
+    event_groups, event_times, event_weights = (
+        arr[order] for arr in (event_groups, event_times, event_weights))
+    levels = np.cumsum(event_weights)
+    group_bounds = np.searchsorted(event_groups, np.arange(n_groups + 1))
+
+    dtype = np.float64 if average else event_weights.dtype
+    profiles = np.zeros((n_groups, len(bounds)), dtype=dtype)
+    for group in range(n_groups):
+        lo, hi = group_bounds[group], group_bounds[group + 1]
+        if lo == hi:
+            continue
+        # Each group starts from a level of 0
+        group_levels = levels[lo:hi] - (levels[lo - 1] if lo else 0)
+        group_times = event_times[lo:hi]
+        last_events = np.searchsorted(group_times, bounds, side='right') - 1
+        before_first = last_events < 0
+        last_events[before_first] = 0
+        if not average:
+            profiles[group] = np.where(before_first, 0,
+                                       group_levels[last_events])
+            continue
+        # ON time (times weight) before each event, in seconds
+        seconds = (group_times - group_times[0]) / 1e9
+        on_time = np.zeros(hi - lo, dtype=np.float64)
+        on_time[1:] = np.cumsum(group_levels[:-1] * np.diff(seconds))
+        on_time_at_bounds = (on_time[last_events] +
+                             group_levels[last_events] *
+                             ((bounds - group_times[0]) / 1e9 -
+                              seconds[last_events]))
+        profiles[group] = np.where(before_first, 0.0, on_time_at_bounds)
+    return profiles
 
 
 def _df_select_time_index_values(df, id_or_ids=None, start=None, end=None, freq=None):
@@ -168,7 +728,8 @@ def _df_time_index(df):
 
 
 def sensor_obs_arr_by_freq(df, id=None, start=None, end=None, cols=None,
-                           freq='1min', actuals_only=False):
+                           freq='1min', actuals_only=False, agg=None,
+                           as_datetime64=False):
     """Returns tuple of NumPy arrays containing 1) indexes including timestamps ('times') and 2) sensor observations at the specified frequency. If *actuals_only* is True, only the observed temperatures will be returned in an array. Otherwise, by default, intervals without observations are filled with zeros.
 
     Args:
@@ -186,10 +747,21 @@ def sensor_obs_arr_by_freq(df, id=None, start=None, end=None, cols=None,
 
         actuals_only (Boolean): If True, return only actual observations. If False, return array with zeros for intervals without observations.
 
+        agg (Optional[str]): {'mean', 'last', 'min', 'max', 'time_weighted', 'count'} By default, the time stamps of observations are rounded to the frequency, which requires that there is no more than one observation per interval. If agg is specified, each interval starts at its time stamp and lasts for the frequency, and the observations within it are aggregated: the mean, last, minimum or maximum value, the number of observations ('count'), or the mean weighted by the time that each value was held until the next observation ('time_weighted'), with the last observation before the interval (if any) held from the start of the interval. Missing (NaN) observations are ignored. Intervals without observations are numpy.nan (or 0 for 'count').
+
+        as_datetime64 (Optional[bool]): If True, the time stamps are a numpy.datetime64 array instead of a pandas DatetimeIndex. Default: False.
+
     Returns:
         temps_arr (structured NumPy array with two columns): 1) 'times' (datetime64[m]) and 2) 'temps' (numpy.float16).
     """
-    index, data = _round_and_reindex_df_as_arr(df, id, start, end, freq, cols)
+    if agg is None:
+        index, data = _round_and_reindex_df_as_arr(df, id, start, end, freq,
+                                                   cols)
+    else:
+        index, data = _aggregated_by_interval_as_arr(df, id, start, end, freq,
+                                                     cols, agg)
+    if as_datetime64:
+        index = _time_axis(index, as_datetime64=True)
 
     if actuals_only:
         masked_times = np.ma.MaskedArray(index, np.NaN)
@@ -212,6 +784,101 @@ def _round_and_reindex_df_as_arr(df, id, start, end, freq, cols):
     return index_as_arr, data_as_arr
 
 
+def _aggregated_by_interval_as_arr(df, id, start, end, freq, cols, agg):
+    """Returns tuple of a DatetimeIndex with the intervals from start to end
+    and a 2D array with the aggregated observations of each data column
+    (columns) in each interval (rows).
+    """
+    if agg not in _AGG_MODES:
+        raise ValueError('agg argument must be one of: ' +
+                         ', '.join(_AGG_MODES) + '.')
+    intervals = pd.DatetimeIndex(start=start, end=end, freq=freq)
+    sliced_df = _sliced_by_id_or_ids_and_time_index(df, id, None, None)
+    data_cols = _non_string_data_cols(sliced_df, cols)
+    data_cols = np.ravel(data_cols).tolist()
+    times = pd.DatetimeIndex(_get_time_index(sliced_df)).asi8
+    values = np.asarray(sliced_df.iloc[:, data_cols].values,
+                        dtype=np.float64).reshape(len(times), -1)
+    order = np.argsort(times, kind='mergesort')
+    times, values = times[order], values[order]
+
+    bounds = np.append(intervals.asi8,
+                       intervals.asi8[-1] + _freq_timedelta(freq).value)
+    # The last observation before the intervals is only needed for
+    # time-weighted means
+    first = max(np.searchsorted(times, bounds[0]) - 1, 0)
+    last = np.searchsorted(times, bounds[-1])
+    times, values = times[first:last], values[first:last]
+    data = np.empty((len(intervals), values.shape[1]))
+    for col in range(values.shape[1]):
+        observed = ~np.isnan(values[:, col])
+        data[:, col] = _aggregated_by_interval(times[observed],
+                                               values[observed, col], bounds,
+                                               agg)
+    return intervals, data
+
+
+def _aggregated_by_interval(times, values, bounds, agg):
+    """Returns float64 array with the aggregate of the values observed at
+    times (sorted int64 nanoseconds) in each interval between consecutive
+    bounds. Observations are assigned to intervals with a sorted search of the
+    bounds, so that the observations in each interval are contiguous and can
+    be reduced at once.
+    """
+    n_intervals = len(bounds) - 1
+    if agg == 'time_weighted':
+        return _time_weighted_by_interval(times, values, bounds)
+    intervals = np.searchsorted(bounds, times, side='right') - 1
+    within = (intervals >= 0) & (intervals < n_intervals)
+    intervals, values = intervals[within], values[within]
+    counts = np.bincount(intervals, minlength=n_intervals)
+    if agg == 'count':
+        return counts.astype(np.float64)
+    aggregated = np.full(n_intervals, np.nan)
+    if not len(values):
+        return aggregated
+    observed = counts > 0
+    if agg == 'mean':
+        sums = np.bincount(intervals, weights=values, minlength=n_intervals)
+        aggregated[observed] = sums[observed] / counts[observed]
+        return aggregated
+    firsts = np.flatnonzero(np.r_[True, intervals[1:] != intervals[:-1]])
+    if agg == 'last':
+        lasts = np.r_[firsts[1:], len(values)] - 1
+        aggregated[intervals[firsts]] = values[lasts]
+    elif agg == 'min':
+        aggregated[intervals[firsts]] = np.minimum.reduceat(values, firsts)
+    elif agg == 'max':
+        aggregated[intervals[firsts]] = np.maximum.reduceat(values, firsts)
+    return aggregated
+
+
+def _time_weighted_by_interval(times, values, bounds):
+    """Returns float64 array with the mean of the values in each interval
+    between consecutive bounds, weighted by the time each value was held
+    until the next observation. The integral of the values and the time
+    covered by observations are computed at each bound, so that each interval
+    is the difference between two bounds.
+    """
+    if not len(values):
+        return np.full(len(bounds) - 1, np.nan)
+    # Integral of the held values up to each observation
+    held = np.diff(times).astype(np.float64)
+    integrals = np.r_[0., np.cumsum(values[:-1] * held)]
+    latest = np.searchsorted(times, bounds, side='right') - 1
+    observed = latest >= 0
+    latest = np.maximum(latest, 0)
+    since_latest = np.where(observed, bounds - times[latest], 0)
+    integral_at_bounds = np.where(
+        observed, integrals[latest] + values[latest] * since_latest, 0.)
+    covered_at_bounds = np.maximum(bounds - times[0], 0).astype(np.float64)
+    covered = np.diff(covered_at_bounds)
+    aggregated = np.full(len(bounds) - 1, np.nan)
+    nonzero = covered > 0
+    aggregated[nonzero] = np.diff(integral_at_bounds)[nonzero] / covered[nonzero]
+    return aggregated
+
+
 def _numeric_non_time_data_as_np(df, id, start, end, cols):
     """Return only the numeric data columns without the index of a pandas
     DataFrame. Filter on id and on start and end, if any of these are not
@@ -293,6 +960,12 @@ def _timedelta_from_string(delta):
     return pd.Timedelta(dt.timedelta(minutes=mins, seconds=secs))
 
 
+def _freq_timedelta(freq):
+    """Returns pandas Timedelta with the length of a fixed frequency in a
+    pandas-recognized format, such as '1min', '30s', '1min30s' or '1H'."""
+    return pd.Timedelta(to_offset(freq))
+
+
 def _get_non_time_multi_index_levels_as_arrays(df):
     for i in range(len(df.index._levels)):
         index_val = df.index._levels[i][0]
@@ -300,26 +973,32 @@ def _get_non_time_multi_index_levels_as_arrays(df):
             yield df.index.get_level_values(i)
 
 
-def plot_cycles_xy(cycles_and_obs):
+def plot_cycles_xy(cycles_and_obs, as_datetime64=False):
     """Returns 2-tuple for the purpose of x-y plots. The first element of the tuple is an array of datetimes. The second element is an array of cycling states (1's and 0's for ON/OFF). The argument must be a return value from the function cycling_and_obs_arrays().
 
     Args:
         cycles_and_obs(tuple of NumPy arrays): The tuple should be from cycling_and_obs_arrays().
 
+        as_datetime64 (Optional[bool]): If True, the timestamps are converted to a numpy.datetime64 array, if they are not already. Default: False.
+
     Returns:
         times_x, onoff_y (tuple of NumPy arrays): The first tuple (which can be plotted on the x-axis) holds timestamps (datetime64).
     """
     times_x = cycles_and_obs[0]
+    if as_datetime64:
+        times_x = _time_axis(times_x, as_datetime64=True)
     onoff_y = cycles_and_obs[1]
     return times_x, onoff_y
 
 
-def plot_sensor_geo_xy(cycles_and_obs):
+def plot_sensor_geo_xy(cycles_and_obs, as_datetime64=False):
     """Returns x and y time series where x holds timestamps and y is a series of either sensor observations, geospatial data observations, or both, depending on the argument. The single argument must be the return value (a 2-tuple) from the function cycling_and_obs_arrays().
 
     Args:
         cycles_and_obs(tuple of NumPy arrays): The tuple should be from cycling_and_obs_arrays().
 
+        as_datetime64 (Optional[bool]): If True, the datetimes are converted to a numpy.datetime64 array, if they are not already. Default: False.
+
     Returns:
         x, y (tuple of NumPy arrays): The first tuple (which can be plotted on the x-axis) holds datetimes. The second has corresponding data from sensors or from geospatial data sources. Only non-null observations are returned.
     """
@@ -329,4 +1008,6 @@ def plot_sensor_geo_xy(cycles_and_obs):
     masked_times = np.ma.MaskedArray(times,
                                      mask=np.ma.getmask(masked_obs))
     x, y = masked_times.compressed(), masked_obs.compressed()
+    if as_datetime64:
+        x = _time_axis(x, as_datetime64=True)
     return x, y
@@ -1,7 +1,11 @@
 from __future__ import absolute_import, division, print_function
 
 import datetime as dt
+from multiprocessing.pool import ThreadPool
+import os
 import os.path
+import pickle
+import re
 
 import numpy as np
 import pandas as pd
@@ -10,6 +14,7 @@ import pytest
 from future import standard_library
 
 from caar import cleanthermostat as ct
+from caar import detectioncache
 from caar import history as hi
 from caar import histsummary as hs
 from caar import timeseries as ts
@@ -20,6 +25,9 @@ from caar.configparser_read import TEST_CYCLES_FILE, CYCLES_PICKLE_FILE_OUT,   \
     TEST_SENSOR_OBS_FILE, TEST_GEOSPATIAL_OBS_FILE, ALL_STATES_CYCLES_PICKLED_OUT,        \
     ALL_STATES_SENSOR_OBS_PICKLED_OUT, ALL_STATES_GEOSPATIAL_OBS_PICKLED_OUT, SENSOR_ID1, \
     LOCATION_ID1
+from caar.detectioncache import clear_detection_cache
+from caar.dfcache import clear_df_cache, df_cache_info
+from caar.metadataregistry import clear_metadata_cache
 
 standard_library.install_aliases()
 
@@ -101,6 +109,226 @@ def test_select_clean_auto(data_file, states, sensors, postal, cycle, auto):
 
 
 
+@pytest.mark.parametrize("time_stamps, dt_format",
+                         [(['2011-06-17 22:17:34', '2012-02-29 00:00:59'],
+                           '%Y-%m-%d %H:%M:%S'),
+                          (['2011-06-17T22:17:34', '2011-12-31T23:59:59'],
+                           '%Y-%m-%dT%H:%M:%S'),
+                          (['2011-06-17 22:17:34', '2011-6-17 22:17:35'],
+                           '%Y-%m-%d %H:%M:%S'),
+                          (['2011-06-17 22:17:34', '2011-06-17 22:17:34.5'],
+                           '%Y-%m-%d %H:%M:%S'),
+                          (['06/17/2011 22:17', '12/31/2011 23:59'],
+                           '%m/%d/%Y %H:%M')])
+def test_time_stamp_conversion(time_stamps, dt_format):
+    expected = pd.to_datetime(time_stamps).values
+    times = ct._to_datetime64(np.array(time_stamps), dt_format=dt_format)
+    assert times.dtype == np.dtype('datetime64[ns]')
+    assert (times == expected).all()
+    record_times = [ct._to_datetime(time_stamp, dt_format=dt_format)
+                    for time_stamp in time_stamps]
+    assert record_times == list(pd.to_datetime(time_stamps).to_pydatetime())
+
+
+@pytest.mark.parametrize("tempdir, data_file, cycle, auto",
+                         [(tmpdir(), TEST_CYCLES_FILE, CYCLE_TYPE_COOL, 'cycles'),
+                          (tmpdir(), TEST_SENSOR_OBS_FILE, None, 'sensors')])
+def test_concurrent_ingestion_of_time_stamp_formats(tempdir, data_file, cycle,
+                                                    auto):
+    us_format_file = str(tempdir.join('us_format_' + os.path.basename(data_file)))
+    with open(data_file) as fin, open(us_format_file, 'w') as fout:
+        fout.write(fin.readline())
+        for line in fin:
+            fout.write(re.sub(r'(\d{4})-(\d{2})-(\d{2}) ', r'\2/\3/\1 ', line))
+    data_files = [data_file, us_format_file] * 4
+
+    def records(raw_file):
+        return ct.dict_from_file(raw_file, cycle=cycle, auto=auto)['records']
+
+    pool = ThreadPool(len(data_files))
+    try:
+        concurrent_records = pool.map(records, data_files)
+    finally:
+        pool.close()
+        pool.join()
+    expected_records = records(data_file)
+    for file_records in concurrent_records:
+        assert file_records == expected_records
+
+
+@pytest.mark.parametrize("tempdir, data_file, df_from_text_func, kwargs",
+                         [(tmpdir(), TEST_CYCLES_FILE, hi.cycles_df_from_text,
+                           {'cycle': CYCLE_TYPE_COOL}),
+                          (tmpdir(), TEST_SENSOR_OBS_FILE,
+                           hi.sensors_df_from_text, {}),
+                          (tmpdir(), TEST_GEOSPATIAL_OBS_FILE,
+                           hi.geospatial_df_from_text, {})])
+def test_time_range_pushdown(tempdir, data_file, df_from_text_func, kwargs):
+    start, end = dt.datetime(2011, 8, 6), dt.datetime(2011, 8, 8, 12)
+    us_format_file = str(tempdir.join('us_format_' + os.path.basename(data_file)))
+    with open(data_file) as fin, open(us_format_file, 'w') as fout:
+        fout.write(fin.readline())
+        for line in fin:
+            fout.write(re.sub(r'(\d{4})-(\d{2})-(\d{2}) ', r'\2/\3/\1 ', line))
+
+    for engine in ['python', 'vectorized']:
+        df = df_from_text_func(data_file, engine=engine, **kwargs)
+        times = df.index.get_level_values(-1)
+        expected_df = df[(times >= start) & (times <= end)]
+        assert 0 < len(expected_df) < len(df)
+        for raw_file in [data_file, us_format_file]:
+            range_df = df_from_text_func(raw_file, engine=engine, start=start,
+                                         end=str(end), **kwargs)
+            pd.util.testing.assert_frame_equal(range_df, expected_df)
+
+
+@pytest.mark.parametrize("data_file, cycle, auto, df_creation_func, id_type, ids",
+                         [(TEST_CYCLES_FILE, CYCLE_TYPE_COOL, 'cycles',
+                           hi.create_cycles_df, 'device_ids', [SENSOR_ID1]),
+                          (TEST_CYCLES_FILE, CYCLE_TYPE_COOL, None,
+                           hi.create_cycles_df, 'device_ids', [SENSOR_ID1]),
+                          (TEST_SENSOR_OBS_FILE, None, 'sensors',
+                           hi.create_sensors_df, 'sensor_ids', [SENSOR_ID1]),
+                          (TEST_GEOSPATIAL_OBS_FILE, None, None,
+                           hi.create_geospatial_df, 'location_ids',
+                           [LOCATION_ID1])])
+def test_id_pushdown(data_file, cycle, auto, df_creation_func, id_type, ids):
+    for engine in ['python', 'vectorized']:
+        clean_dict = ct.dict_from_file(data_file, cycle=cycle, auto=auto,
+                                       engine=engine)
+        ids_dict = ct.dict_from_file(data_file, cycle=cycle, auto=auto,
+                                     engine=engine, ids=ids)
+        expected_df = df_creation_func(clean_dict, **{id_type: ids})
+        assert 0 < len(ids_dict['records']) <= len(clean_dict['records'])
+        pd.util.testing.assert_frame_equal(df_creation_func(ids_dict),
+                                           expected_df)
+
+
+@pytest.mark.parametrize("data_file",
+                         [TEST_CYCLES_FILE, TEST_SENSOR_OBS_FILE,
+                          TEST_GEOSPATIAL_OBS_FILE])
+def test_detection_sample_is_bounded(data_file):
+    sample_lines = ct._detection_sample_lines(data_file)
+    max_lines = (ct._DETECTION_SAMPLE_LINES +
+                 ct._DETECTION_STRIDES * ct._DETECTION_STRIDE_LINES)
+    assert 0 < len(sample_lines) <= max_lines
+    with open(data_file) as lines:
+        all_lines = set(lines)
+    assert all(line in all_lines for line in sample_lines)
+
+
+@pytest.mark.parametrize("kwargs",
+                         [{},
+                          {'auto': 'cycles', 'cycle': 'Heat'},
+                          {'auto': 'cycles', 'cycle': CYCLE_TYPE_COOL}])
+def test_sampled_int_columns_widened_to_floats(kwargs):
+    # BTUs has decimals only in lines outside of the detection sample
+    cols_meta = ct.dict_from_file(TEST_CYCLES_FILE, meta=True, **kwargs)
+    assert cols_meta['BTUs']['type'] == 'ints'
+    btus = [position for position, _
+            in ct._non_index_col_positions(cols_meta)].index(
+                cols_meta['BTUs']['position'])
+    records = {}
+    for engine in ['python', 'vectorized']:
+        records[engine] = ct.dict_from_file(TEST_CYCLES_FILE, engine=engine,
+                                            **kwargs)['records']
+        assert len(records[engine]) > 0
+        assert all(isinstance(vals[btus], (int, float))
+                   for vals in records[engine].values())
+    assert records['vectorized'] == records['python']
+
+
+@pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto",
+                          [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
+                            TEST_POSTAL_FILE, CYCLE_TYPE_COOL, 'cycles'),
+                           (TEST_CYCLES_FILE, None, None, None, CYCLE_TYPE_COOL,
+                           'cycles'),
+                           (TEST_SENSOR_OBS_FILE, STATE, TEST_SENSORS_FILE,
+                            TEST_POSTAL_FILE, None, 'sensors'),
+                           (TEST_SENSOR_OBS_FILE, None, None, None, None,
+                           'sensors'),
+                           (TEST_GEOSPATIAL_OBS_FILE, STATE, TEST_SENSORS_FILE,
+                            TEST_POSTAL_FILE, None, 'geospatial'),
+                           (TEST_GEOSPATIAL_OBS_FILE, None, None, None,
+                            None, 'geospatial'),
+                           (TEST_CYCLES_FILE, None, None, None, CYCLE_TYPE_COOL,
+                            None),
+                           (TEST_CYCLES_FILE, None, None, None, None, None),
+                           (TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
+                            TEST_POSTAL_FILE, None, None),
+                           (TEST_SENSOR_OBS_FILE, None, None, None, None, None),
+                           (TEST_GEOSPATIAL_OBS_FILE, STATE, TEST_SENSORS_FILE,
+                            TEST_POSTAL_FILE, None, None)])
+def test_vectorized_engine_matches_python(data_file, states, sensors, postal,
+                                          cycle, auto):
+    kwargs = {'cycle': cycle, 'states': states, 'sensors_file': sensors,
+              'postal_file': postal, 'auto': auto}
+    python_dict = ct.dict_from_file(data_file, **kwargs)
+    vectorized_dict = ct.dict_from_file(data_file, engine='vectorized', **kwargs)
+    assert len(vectorized_dict['records']) > 0
+    assert vectorized_dict['records'] == python_dict['records']
+    assert vectorized_dict['cols_meta'] == python_dict['cols_meta']
+
+
+@pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto, batch_size",
+                         [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
+                           TEST_POSTAL_FILE, CYCLE_TYPE_COOL, 'cycles', 1000),
+                          (TEST_SENSOR_OBS_FILE, None, None, None, None,
+                           'sensors', 200),
+                          (TEST_GEOSPATIAL_OBS_FILE, STATE, TEST_SENSORS_FILE,
+                           TEST_POSTAL_FILE, None, 'geospatial', 100)])
+def test_iter_record_batches(data_file, states, sensors, postal, cycle, auto,
+                             batch_size):
+    kwargs = {'cycle': cycle, 'states': states, 'sensors_file': sensors,
+              'postal_file': postal, 'auto': auto}
+    clean_dict = ct.dict_from_file(data_file, **kwargs)
+    batched_records = {}
+    for batch in ct.iter_record_batches(data_file, batch_size=batch_size,
+                                        **kwargs):
+        assert isinstance(batch, ct.ColumnarRecords)
+        assert 0 < len(batch) <= batch_size
+        batched_records.update(batch.items())
+    assert batched_records == clean_dict['records']
+
+
+@pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto, workers",
+                         [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
+                           TEST_POSTAL_FILE, CYCLE_TYPE_COOL, 'cycles', 2),
+                          (TEST_CYCLES_FILE, None, None, None, CYCLE_TYPE_COOL,
+                           'cycles', 3),
+                          (TEST_SENSOR_OBS_FILE, None, None, None, None,
+                           'sensors', 2),
+                          (TEST_GEOSPATIAL_OBS_FILE, None, None, None,
+                           None, 'geospatial', 4)])
+def test_workers_match_single_process(data_file, states, sensors, postal,
+                                      cycle, auto, workers):
+    kwargs = {'cycle': cycle, 'states': states, 'sensors_file': sensors,
+              'postal_file': postal, 'auto': auto}
+    byte_ranges = ct._newline_aligned_byte_ranges(data_file, workers)
+    assert byte_ranges[-1][1] == os.path.getsize(data_file)
+    assert all(end == start for (_, end), (start, _)
+               in zip(byte_ranges[:-1], byte_ranges[1:]))
+    clean_dict = ct.dict_from_file(data_file, **kwargs)
+    parallel_dict = ct.dict_from_file(data_file, workers=workers, **kwargs)
+    assert parallel_dict['records'] == clean_dict['records']
+
+
+@pytest.mark.parametrize("tempdir, workers",
+                         [(tmpdir(), 1),
+                          (tmpdir(), 2)])
+def test_workers_decode_strictly(tempdir, workers):
+    with open(TEST_CYCLES_FILE, 'rb') as fin:
+        lines = fin.readlines()
+    # A line after the first lines that are sampled for detection
+    lines[1500] = lines[1500].replace(b'Cool', b'C\xffol')
+    invalid_file = str(tempdir.join('invalid_cycles.csv'))
+    with open(invalid_file, 'wb') as fout:
+        fout.writelines(lines)
+    with pytest.raises(UnicodeDecodeError):
+        ct.dict_from_file(invalid_file, cycle=CYCLE_TYPE_COOL, auto='cycles',
+                          encoding='UTF-8', workers=workers)
+
+
 @pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto",
                          [(TEST_CYCLES_FILE, None, None, None, CYCLE_TYPE_COOL,
                            'cycles'),
@@ -116,6 +344,28 @@ def test_col_meta_auto(data_file, states, sensors, postal, cycle, auto):
     assert len(col_meta) > 0
 
 
+@pytest.mark.parametrize("tempdir, data_file, cycle, auto",
+                         [(tmpdir(), TEST_CYCLES_FILE, CYCLE_TYPE_COOL, 'cycles'),
+                          (tmpdir(), TEST_SENSOR_OBS_FILE, None, 'sensors'),
+                          (tmpdir(), TEST_GEOSPATIAL_OBS_FILE, None, 'geospatial')])
+def test_detection_cache(tempdir, data_file, cycle, auto, monkeypatch):
+    cache_dir = str(tempdir.join('detection_cache'))
+    col_meta = ct.detect_columns(data_file, cycle=cycle, auto=auto)
+    for _ in range(2):
+        cached_meta = ct.detect_columns(data_file, cycle=cycle, auto=auto,
+                                        detection_cache=cache_dir)
+        assert cached_meta == col_meta
+    assert len(os.listdir(cache_dir)) == 1
+    # Entries saved by another version of the detection logic are not reused
+    monkeypatch.setattr(detectioncache, '_DETECTION_CACHE_VERSION',
+                        detectioncache._DETECTION_CACHE_VERSION + 1)
+    ct.detect_columns(data_file, cycle=cycle, auto=auto,
+                      detection_cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert clear_detection_cache(data_file, cache_dir=cache_dir) == 2
+    assert len(os.listdir(cache_dir)) == 0
+
+
 
 @pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto",
                          [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
@@ -210,6 +460,80 @@ def test_df_creation_after_dict(data_file, states, sensors, postal, cycle, auto,
     assert isinstance(df, pd.DataFrame)
 
 
+@pytest.mark.parametrize("data_file, states, sensors, postal, cycle, auto, df_creation_func, id_type, ids",
+                         [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
+                           TEST_POSTAL_FILE, CYCLE_TYPE_COOL, 'cycles', hi.create_cycles_df,
+                           'device_ids', [SENSOR_ID1]),
+                          (TEST_CYCLES_FILE, None, None, None, CYCLE_TYPE_COOL,
+                           'cycles', hi.create_cycles_df, None, None),
+                          (TEST_SENSOR_OBS_FILE, None, None, None, None,
+                           'sensors', hi.create_sensors_df, 'sensor_ids', [SENSOR_ID1]),
+                          (TEST_GEOSPATIAL_OBS_FILE, None, None, None,
+                           None, 'geospatial', hi.create_geospatial_df, None, None)])
+def test_df_creation_after_columnar_dict(data_file, states, sensors, postal, cycle, auto, df_creation_func, id_type, ids):
+    kwargs = {'cycle': cycle, 'states': states, 'sensors_file': sensors,
+              'postal_file': postal, 'auto': auto}
+    clean_dict = ct.dict_from_file(data_file, **kwargs)
+    columnar_dict = ct.dict_from_file(data_file, columnar=True, **kwargs)
+    assert isinstance(columnar_dict['records'], ct.ColumnarRecords)
+    assert dict(columnar_dict['records'].items()) == clean_dict['records']
+
+    df_kwargs = {}
+    if id_type is not None:
+        df_kwargs[id_type] = ids
+    df = df_creation_func(clean_dict, **df_kwargs)
+    columnar_df = df_creation_func(columnar_dict, **df_kwargs)
+    pd.util.testing.assert_frame_equal(columnar_df, df)
+
+
+@pytest.mark.parametrize("tempdir, data_file, cycle, auto, df_creation_func, id_type, ids",
+                         [(tmpdir(), TEST_CYCLES_FILE, CYCLE_TYPE_COOL, 'cycles',
+                           hi.cycles_df_from_bin, 'device_ids', [SENSOR_ID1]),
+                          (tmpdir(), TEST_SENSOR_OBS_FILE, None, 'sensors',
+                           hi.sensors_df_from_bin, None, None),
+                          (tmpdir(), TEST_GEOSPATIAL_OBS_FILE, None,
+                           'geospatial', hi.geospatial_df_from_bin,
+                           'location_ids', [LOCATION_ID1])])
+def test_columnar_store_df_from_bin(tempdir, data_file, cycle, auto, df_creation_func, id_type, ids):
+    kwargs = {'cycle': cycle, 'auto': auto}
+    pickle_path = ct.pickle_from_file(data_file,
+                                      picklepath=tempdir.join('records.pickle'),
+                                      **kwargs)
+    store_path = ct.pickle_from_file(data_file,
+                                     picklepath=tempdir.join('records.columns'),
+                                     binary_format='columnar', **kwargs)
+    assert os.path.isdir(store_path)
+
+    df_kwargs = {}
+    if id_type is not None:
+        df_kwargs[id_type] = ids
+    df = df_creation_func(pickle_path, **df_kwargs)
+    store_df = df_creation_func(store_path, **df_kwargs)
+    pd.util.testing.assert_frame_equal(store_df, df)
+
+
+@pytest.mark.parametrize("tempdir, data_file, cycle, auto, df_creation_func, id_type",
+                         [(tmpdir(), TEST_CYCLES_FILE, CYCLE_TYPE_COOL, 'cycles',
+                           hi.create_cycles_df, 'device_ids'),
+                          (tmpdir(), TEST_SENSOR_OBS_FILE, None, 'sensors',
+                           hi.create_sensors_df, 'sensor_ids'),
+                          (tmpdir(), TEST_GEOSPATIAL_OBS_FILE, None,
+                           'geospatial', hi.create_geospatial_df,
+                           'location_ids')])
+def test_columnar_store_id_pushdown(tempdir, data_file, cycle, auto, df_creation_func, id_type):
+    kwargs = {'cycle': cycle, 'auto': auto}
+    clean_dict = ct.dict_from_file(data_file, **kwargs)
+    store_path = ct.pickle_from_file(data_file,
+                                     picklepath=tempdir.join('records.columns'),
+                                     binary_format='columnar', **kwargs)
+    assert os.path.isfile(os.path.join(store_path, 'id_offsets.npy'))
+    all_ids = df_creation_func(clean_dict).index.get_level_values(0).unique()
+    for ids in [list(all_ids[:2]), list(all_ids[-1:])]:
+        df = df_creation_func(clean_dict, **{id_type: ids})
+        store_df = df_creation_func(store_path, **{id_type: ids})
+        pd.util.testing.assert_frame_equal(store_df, df)
+    assert len(df_creation_func(store_path, **{id_type: ['no such id']})) == 0
+
 
 @pytest.mark.parametrize("data_file, states, sensors, postal, cycle, df_creation_func, id_type, ids",
                          [(TEST_CYCLES_FILE, STATE, TEST_SENSORS_FILE,
@@ -256,6 +580,146 @@ def test_on_off_status_by_interval(df_fixture, id, start, end, freq):
     assert len(on_off) == len(dt_intervals)
 
 
+@pytest.mark.parametrize("df_fixture, id, start, end, freq",
+                         [(cycle_df_fixture(), SENSOR_ID1, dt.datetime(2012, 6, 18, 21, 0, 0),
+                           dt.datetime(2012, 6, 19, 23, 0, 0), '1min30s'),
+                          (cycle_df_fixture(), SENSOR_ID1, dt.datetime(2012, 6, 18, 21, 0, 20),
+                           dt.datetime(2012, 6, 19, 23, 0, 0), 'min')])
+def test_on_off_status_matches_slice_assignment(df_fixture, id, start, end, freq):
+    _, on_off = ts.on_off_status(df_fixture, id, start, end, freq=freq)
+    kwargs = {'id_or_ids': id, 'start': start, 'end': end, 'freq': freq}
+    starts = ts._df_select_time_index_values(df_fixture, **kwargs)
+    ends = ts._df_select_time_data_values(df_fixture, **kwargs)
+    dt_delta = ts._timedelta_from_string(freq)
+    expected = np.zeros(len(on_off), dtype=np.int8)
+    for start_on, end_on in zip(starts, ends):
+        start_index, end_index = (int((time - pd.Timestamp(start)) / dt_delta)
+                                  for time in (start_on, end_on))
+        expected[start_index:end_index + 1] = 1
+    assert on_off.any()
+    assert on_off.dtype == np.int8
+    assert (on_off == expected).all()
+
+
+@pytest.mark.parametrize("df_fixture, ids, start, end, freq",
+                         [(cycle_df_fixture(), [SENSOR_ID1, -1], dt.datetime(2012, 6, 1, 0, 0, 20),
+                           dt.datetime(2012, 6, 19, 23, 0, 0), '1min30s'),
+                          (cycle_df_fixture(), [SENSOR_ID1, -1], dt.datetime(2012, 6, 18, 21, 0, 0),
+                           dt.datetime(2012, 6, 19, 23, 0, 0), '5min')])
+def test_on_off_matrix(df_fixture, ids, start, end, freq):
+    dt_intervals, matrix_ids, matrix = ts.on_off_matrix(df_fixture, ids=ids,
+                                                        start=start, end=end,
+                                                        freq=freq)
+    expected_intervals, expected_on_off = ts.on_off_status(df_fixture, ids[0],
+                                                           start, end,
+                                                           freq=freq)
+    assert list(matrix_ids) == ids
+    assert matrix.shape == (len(ids), len(expected_intervals))
+    assert (dt_intervals == expected_intervals).all()
+    assert (matrix[0] == expected_on_off).all()
+    assert not matrix[1].any()
+    _, _, packed = ts.on_off_matrix(df_fixture, ids=ids, start=start, end=end,
+                                    freq=freq, packed=True)
+    assert (np.unpackbits(packed, axis=1)[:, :matrix.shape[1]] == matrix).all()
+
+
+@pytest.mark.parametrize("starts, ends, freq, resample, expected",
+                         [(['2012-01-01 00:00:30', '2012-01-01 00:01:00',
+                            '2012-01-01 00:05:00', '2011-12-31 23:59:00'],
+                           ['2012-01-01 00:02:30', '2012-01-01 00:01:30',
+                            '2012-01-01 00:05:10', '2012-01-01 00:00:10'],
+                           '1min', 'seconds', [40, 60, 30, 0, 0, 10, 0]),
+                          (['2012-01-01 00:00:30', '2012-01-01 00:05:00'],
+                           ['2012-01-01 00:02:30', '2012-01-01 00:05:10'],
+                           '3min', 'fraction', [120 / 180., 10 / 180., 0])])
+def test_on_off_status_exact_on_time(starts, ends, freq, resample, expected):
+    index = pd.MultiIndex.from_arrays([[SENSOR_ID1] * len(starts),
+                                       [CYCLE_TYPE_COOL] * len(starts),
+                                       pd.to_datetime(starts)],
+                                      names=['id', 'mode', 'start_time'])
+    df = pd.DataFrame({'end_time': pd.to_datetime(ends),
+                       'BTUs': [1] * len(starts)}, index=index,
+                      columns=['end_time', 'BTUs'])
+    start, end = dt.datetime(2012, 1, 1), dt.datetime(2012, 1, 1, 0, 6)
+    _, on_time = ts.on_off_status(df, SENSOR_ID1, start, end, freq=freq,
+                                  resample=resample)
+    assert np.allclose(on_time, expected)
+    _, _, matrix = ts.on_off_matrix(df, ids=[SENSOR_ID1], start=start,
+                                    end=end, freq=freq, resample=resample)
+    assert np.allclose(matrix[0], expected)
+
+
+@pytest.mark.parametrize("kwargs, groups, expected",
+                         [({}, None, [0, 1, 2, 1, 0, 0]),
+                          ({'average': True}, None, [0.5, 1, 1.5, 1, 0, 0]),
+                          ({'weight': 'AcKilowatts',
+                            'devices_file': TEST_SENSORS_FILE}, None,
+                           [0, 3.6, 6.6, 3, 0, 0]),
+                          ({'group_by': 'zip',
+                            'devices_file': TEST_SENSORS_FILE},
+                           ['38772', '76034'],
+                           [[0, 1, 1, 0, 0, 0], [0, 0, 1, 1, 0, 0]]),
+                          ({'group_by': 'state',
+                            'devices_file': TEST_SENSORS_FILE,
+                            'postal_file': TEST_POSTAL_FILE},
+                           [STATE], [[0, 1, 1, 0, 0, 0]])])
+def test_concurrency_profile(kwargs, groups, expected):
+    # The cycles of the first device overlap, and are only counted once
+    index = pd.MultiIndex.from_arrays([SENSOR_IDS[:1] * 2 + SENSOR_IDS[1:2],
+                                       [CYCLE_TYPE_COOL] * 3,
+                                       pd.to_datetime(['2012-01-01 00:00:30',
+                                                       '2012-01-01 00:01:00',
+                                                       '2012-01-01 00:02:00'])],
+                                      names=['id', 'mode', 'start_time'])
+    df = pd.DataFrame({'end_time': pd.to_datetime(['2012-01-01 00:02:30',
+                                                   '2012-01-01 00:01:30',
+                                                   '2012-01-01 00:04:00']),
+                       'BTUs': [1] * 3}, index=index,
+                      columns=['end_time', 'BTUs'])
+    profile = ts.concurrency_profile(df, dt.datetime(2012, 1, 1),
+                                     dt.datetime(2012, 1, 1, 0, 5), **kwargs)
+    if groups is not None:
+        assert list(profile[1]) == groups
+    assert len(profile[0]) == 6
+    assert np.allclose(profile[-1], expected)
+
+
+@pytest.mark.parametrize("func, df, kwargs",
+                         [(ts.on_off_status, cycle_df_fixture(),
+                           {'id': SENSOR_ID1}),
+                          (ts.on_off_matrix, cycle_df_fixture(), {}),
+                          (ts.on_off_matrix, cycle_df_fixture(),
+                           {'packed': True}),
+                          (ts.on_off_status, cycle_df_fixture(),
+                           {'id': SENSOR_ID1, 'resample': 'fraction'}),
+                          (ts.on_off_matrix, cycle_df_fixture(),
+                           {'resample': 'seconds'}),
+                          (ts.sensor_obs_arr_by_freq, sensor_df_fixture(),
+                           {'id': SENSOR_ID1, 'agg': 'time_weighted'}),
+                          (ts.concurrency_profile, cycle_df_fixture(),
+                           {'average': True})])
+def test_pandas_frequency_strings(func, df, kwargs):
+    start = dt.datetime(2011, 8, 4, 21, 0, 0)
+    end = dt.datetime(2011, 8, 5, 23, 0, 0)
+    by_hours, by_minutes = (func(df, start=start, end=end, freq=freq, **kwargs)
+                            for freq in ['1H', '60min'])
+    for hours_arr, minutes_arr in zip(by_hours, by_minutes):
+        np.testing.assert_array_equal(hours_arr, minutes_arr)
+
+
+@pytest.mark.parametrize("starts, stops, length",
+                         [([0, 3, 5, -4, 8], [2, 6, 5, -1, 20], 12),
+                          ([-20, 11, 4], [3, 30, 2], 12),
+                          ([], [], 5)])
+def test_status_within_slices(starts, stops, length):
+    expected = np.zeros(length, dtype=np.int8)
+    for start, stop in zip(starts, stops):
+        expected[start:stop] = 1
+    status = ts._status_within_slices(np.array(starts, dtype=np.int64),
+                                      np.array(stops, dtype=np.int64), length)
+    assert (status == expected).all()
+
+
 @pytest.mark.parametrize("df_fixture, id, start, end, freq",
                          [(sensor_df_fixture(), SENSOR_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
                            dt.datetime(2011, 8, 4, 23, 0, 0), '1min30s'),
@@ -280,6 +744,33 @@ def test_temps_by_interval(df_fixture, id, start, end, freq):
 
 
 
+
+@pytest.mark.parametrize("agg, expected",
+                         [('mean', [70.5, 73., np.nan, 68.]),
+                          ('last', [71., 74., np.nan, 68.]),
+                          ('min', [70., 72., np.nan, 68.]),
+                          ('max', [71., 74., np.nan, 68.]),
+                          ('count', [2, 2, 0, 1]),
+                          ('time_weighted', [(69 * 10 + 70 * 30 + 71 * 20) / 60.,
+                                             (72 * 20 + 74 * 40) / 60., 74.,
+                                             68.])])
+def test_sensor_obs_arr_by_freq_agg(agg, expected):
+    times = pd.to_datetime(['2012-01-01 23:59:50', '2012-01-02 00:00:10',
+                            '2012-01-02 00:00:30', '2012-01-02 00:00:40',
+                            '2012-01-02 00:01:00', '2012-01-02 00:01:20',
+                            '2012-01-02 00:01:30', '2012-01-02 00:03:00'])
+    temps = [69., 70., np.nan, 71., 72., 74., np.nan, 68.]
+    index = pd.MultiIndex.from_arrays([[SENSOR_ID1] * len(times), times],
+                                      names=['id', 'time'])
+    df = pd.DataFrame({'temp': temps}, index=index)
+    index, obs = ts.sensor_obs_arr_by_freq(df, SENSOR_ID1,
+                                           dt.datetime(2012, 1, 2, 0, 0),
+                                           dt.datetime(2012, 1, 2, 0, 3),
+                                           freq='1min', agg=agg)
+    assert len(index) == 4
+    assert np.allclose(obs[:, 0], expected, equal_nan=True)
+
+
 @pytest.mark.parametrize("thermo_id, start, end, freq, cycle_df, inside_df, outside_df, thermo_file",
                          [(SENSOR_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
                            dt.datetime(2011, 8, 4, 23, 59, 0), '1min',
@@ -299,6 +790,64 @@ def test_single_day_cycling_and_temps(thermo_id, start, end, freq, cycle_df,
     assert single_day_arr[1].shape[1] == 3
 
 
+
+@pytest.mark.parametrize("thermo_id, start, end, freq, cycle_df, inside_df, outside_df, thermo_file",
+                         [(SENSOR_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
+                           dt.datetime(2011, 8, 4, 23, 59, 0), '1min',
+                           cycle_df_fixture(), sensor_df_fixture(),
+                           geospatial_df_fixture(), TEST_SENSORS_FILE)])
+def test_cycling_and_obs_arrays_as_datetime64(thermo_id, start, end, freq,
+                                              cycle_df, inside_df, outside_df,
+                                              thermo_file):
+    kwargs = {'cycling_id': thermo_id, 'start': start, 'end': end,
+              'sensors_df': inside_df, 'sensor_id': thermo_id,
+              'geospatial_df': outside_df, 'sensors_file': thermo_file,
+              'freq': freq}
+    times, cycles_and_obs = ts.cycling_and_obs_arrays(cycle_df, **kwargs)
+    times64, cycles_and_obs64 = ts.cycling_and_obs_arrays(cycle_df,
+                                                          as_datetime64=True,
+                                                          **kwargs)
+    assert times64.dtype == np.dtype('datetime64[ns]')
+    assert (times64 == pd.DatetimeIndex(times).values).all()
+    assert np.array_equal(cycles_and_obs, cycles_and_obs64, equal_nan=True)
+    x, _ = ts.plot_cycles_xy((times, cycles_and_obs), as_datetime64=True)
+    assert (x == times64).all()
+    index, _ = ts.sensor_obs_arr_by_freq(inside_df, thermo_id, start, end,
+                                         freq=freq, as_datetime64=True)
+    assert (index == times64).all()
+
+
+
+@pytest.mark.parametrize("tempdir, start, end, freq, cycle_df, inside_df, outside_df, thermo_file, workers",
+                         [(tmpdir(), dt.datetime(2011, 8, 4, 21, 0, 0),
+                           dt.datetime(2011, 8, 4, 23, 59, 0), '1min',
+                           cycle_df_fixture(), sensor_df_fixture(),
+                           geospatial_df_fixture(), TEST_SENSORS_FILE, 1),
+                          (tmpdir(), dt.datetime(2011, 8, 4, 21, 0, 0),
+                           dt.datetime(2011, 8, 4, 23, 59, 0), '1min',
+                           cycle_df_fixture(), sensor_df_fixture(),
+                           geospatial_df_fixture(), TEST_SENSORS_FILE, 2)])
+def test_fleet_cycling_and_obs_arrays(tempdir, start, end, freq, cycle_df,
+                                      inside_df, outside_df, thermo_file,
+                                      workers):
+    out_file = str(tempdir.join('fleet.npy'))
+    times, ids, fleet = ts.fleet_cycling_and_obs_arrays(
+        out_file, cycle_df, inside_df, geospatial_df=outside_df, start=start,
+        end=end, sensors_file=thermo_file, freq=freq, workers=workers)
+    assert isinstance(fleet, np.memmap)
+    assert fleet.shape == (len(ids), len(times), 3)
+    for row, id in enumerate(ids):
+        device_times, cycles_and_obs = ts.cycling_and_obs_arrays(
+            cycle_df, cycling_id=id, sensors_df=inside_df, sensor_id=id,
+            geospatial_df=outside_df, start=start, end=end,
+            sensors_file=thermo_file, freq=freq)
+        assert (device_times == times).all()
+        assert np.array_equal(cycles_and_obs, fleet[row], equal_nan=True)
+    loaded_times, loaded_ids, loaded = ts.fleet_arrays_from_file(out_file)
+    assert (loaded_times == times).all() and (loaded_ids == ids).all()
+    assert np.array_equal(loaded, fleet, equal_nan=True)
+
+
 @pytest.mark.parametrize("sensor_id, devices_file, cycles_df, sensors_df, geospatial_df, include_first_last_days",
                          [(92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(), geospatial_df_fixture(),
                            False)])
@@ -311,6 +860,187 @@ def test_consecutive_days_of_observations(sensor_id, devices_file, cycles_df, se
     assert len(obs) > 0
 
 
+@pytest.mark.parametrize("sensor_id, devices_file, cycles_df, sensors_df, geospatial_df, include_first_last_days",
+                         [(92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(), geospatial_df_fixture(),
+                           False),
+                          (92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(), geospatial_df_fixture(),
+                           True),
+                          (92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(), None,
+                           False)])
+def test_consecutive_days_of_observations_for_each_id(sensor_id, devices_file, cycles_df, sensors_df,
+                                                      geospatial_df, include_first_last_days):
+    kwargs = {'geospatial_df': geospatial_df,
+              'include_first_and_last_days': include_first_last_days}
+    streaks = hs.consecutive_days_of_observations_for_each_id(devices_file, cycles_df,
+                                                              sensors_df, **kwargs)
+    expected = hs.consecutive_days_of_observations(sensor_id, devices_file, cycles_df,
+                                                   sensors_df, **kwargs)
+    assert (streaks.values.tolist() ==
+            sorted(expected.values.tolist(), key=lambda streak: streak[1]))
+
+
+@pytest.mark.parametrize("sensor_id, devices_file, cycles_df, sensors_df, geospatial_df",
+                         [(92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(),
+                           geospatial_df_fixture()),
+                          (92, TEST_SENSORS_FILE, cycle_df_fixture(), sensor_df_fixture(),
+                           None)])
+def test_consecutive_days_of_observations_before_1970(sensor_id, devices_file, cycles_df,
+                                                      sensors_df, geospatial_df):
+    days_earlier = pd.Timedelta(days=365 * 50)
+
+    def earlier(df):
+        if df is None:
+            return None
+        time_level = df.index.nlevels - 1
+        return df.set_index(df.index.set_levels(
+            df.index.levels[time_level] - days_earlier, level=time_level))
+
+    streaks = hs.consecutive_days_of_observations_for_each_id(
+        devices_file, earlier(cycles_df), earlier(sensors_df),
+        geospatial_df=earlier(geospatial_df))
+    expected = hs.consecutive_days_of_observations_for_each_id(
+        devices_file, cycles_df, sensors_df, geospatial_df=geospatial_df)
+    assert len(streaks) > 0
+    assert (streaks['First day'] < dt.date(1970, 1, 1)).all()
+    assert streaks['ID'].tolist() == expected['ID'].tolist()
+    assert (streaks['Consecutive days'].tolist() ==
+            expected['Consecutive days'].tolist())
+    assert streaks['First day'].tolist() == [day - days_earlier for day
+                                             in expected['First day']]
+
+
+@pytest.mark.parametrize("df",
+                         [cycle_df_fixture(),
+                          sensor_df_fixture(),
+                          geospatial_df_fixture()])
+def test_daily_counts(df):
+    time_level = hs._get_time_level_of_df_multiindex(df)
+    daily_df = (df.groupby([df.index.get_level_values(level=0),
+                            pd.Grouper(freq='D', level=time_level)])
+                .count())
+    pd.util.testing.assert_frame_equal(hs.daily_data_points_by_id(df),
+                                       daily_df)
+    assert (hs.days_of_data_by_id(df)['Days'].values ==
+            daily_df.groupby(level=0).size().values).all()
+    assert np.allclose(hs.squared_avg_daily_data_points_per_id(df).values,
+                       np.square(daily_df.groupby(level=0).mean().values))
+    assert hs._daily_counts(df) is hs._daily_counts(df)
+    assert hs._daily_counts(df).counts.dtype == np.int32
+    assert hs.clear_daily_counts_cache() >= 1
+
+
+@pytest.mark.parametrize("pickle_file, df_creation_func",
+                         [(CYCLES_PICKLE_FILE, hi.create_cycles_df),
+                          (SENSOR_PICKLE_FILE, hi.create_sensors_df),
+                          (GEOSPATIAL_PICKLE_FILE, hi.create_geospatial_df)])
+def test_multi_index_df_from_unsorted_records(pickle_file, df_creation_func):
+    with open(pickle_file, 'rb') as fin:
+        container = pickle.load(fin)
+    records = list(container['records'].items())
+    shuffled = dict(records[1::2] + records[::2][::-1])
+    df = df_creation_func({'records': shuffled,
+                           'cols_meta': container['cols_meta']})
+    assert df.index.is_monotonic_increasing
+    pd.util.testing.assert_frame_equal(df, df_creation_func(pickle_file))
+
+
+@pytest.mark.parametrize("kwargs",
+                         [{'cycle': CYCLE_TYPE_COOL},
+                          {'cycle': CYCLE_TYPE_COOL, 'auto': 'cycles'}])
+def test_multi_index_df_keeps_time_stamps_of_keys(kwargs):
+    # With config.ini (no auto), the time stamps in the keys are strings
+    clean_dict = ct.dict_from_file(TEST_CYCLES_FILE, **kwargs)
+    df = hi.create_cycles_df(clean_dict)
+    records = clean_dict['records']
+    index = pd.MultiIndex.from_tuples([tuple(key) for key in records],
+                                      names=df.index.names)
+    expected_df = pd.DataFrame(list(records.values()), index=index,
+                               columns=df.columns).sort_index()
+    pd.util.testing.assert_frame_equal(df, expected_df)
+
+
+@pytest.mark.parametrize("tmpdir, pickle_file, df_from_bin_func",
+                         [(tmpdir(), CYCLES_PICKLE_FILE, hi.cycles_df_from_bin),
+                          (tmpdir(), SENSOR_PICKLE_FILE, hi.sensors_df_from_bin),
+                          (tmpdir(), GEOSPATIAL_PICKLE_FILE, hi.geospatial_df_from_bin)])
+def test_df_from_bin_cache(tmpdir, pickle_file, df_from_bin_func):
+    pickle_copy = str(tmpdir.join('copy.pickle'))
+    with open(pickle_file, 'rb') as fin, open(pickle_copy, 'wb') as fout:
+        fout.write(fin.read())
+    clear_df_cache()
+    df = df_from_bin_func(pickle_copy, cache=True)
+    cached_df = df_from_bin_func(pickle_copy, cache=True)
+    assert df_cache_info()[:3] == (1, 1, 1)
+    pd.util.testing.assert_frame_equal(cached_df, df_from_bin_func(pickle_file))
+    numeric_col = [col for col in cached_df.columns
+                   if cached_df[col].dtype.kind in 'iuf'][0]
+    values = cached_df[numeric_col].values
+    with pytest.raises(ValueError):
+        values[0] = values[0]
+    assert df is not cached_df
+    assert np.shares_memory(df[numeric_col].values, values)
+    copied_df = df_from_bin_func(pickle_copy, cache=True, copy=True)
+    copied_values = copied_df[numeric_col].values
+    copied_values[0] = copied_values[0]
+    assert df_cache_info().hits == 2
+    # A file that is modified is loaded again
+    os.utime(pickle_copy, (0, 0))
+    df_from_bin_func(pickle_copy, cache=True)
+    assert df_cache_info().misses == 2
+    assert clear_df_cache() == 2
+
+
+@pytest.mark.parametrize("df, id, start, end",
+                         [(cycle_df_fixture(), SENSOR_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
+                           dt.datetime(2011, 8, 5, 23, 0, 0)),
+                          (sensor_df_fixture(), SENSOR_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
+                           dt.datetime(2011, 8, 5, 23, 0, 0)),
+                          (geospatial_df_fixture(), LOCATION_ID1, dt.datetime(2011, 8, 4, 21, 0, 0),
+                           None)])
+def test_offset_index_slices(df, id, start, end):
+    assert hs._offset_index(df) is not None
+    idx = pd.IndexSlice
+    id_slice = idx[id, :, :] if len(df.index.names) == 3 else idx[id, :]
+    time_slice = ((slice(None),) * (len(df.index.names) - 1) +
+                  (slice(start, end),))
+    by_id = df.loc[id_slice, :]
+    by_time = df.loc[idx[time_slice], :].sort_index()
+    pd.util.testing.assert_frame_equal(hs.df_select_ids(df, id), by_id)
+    pd.util.testing.assert_frame_equal(hs.df_select_datetime_range(df, start, end),
+                                       by_time)
+    pd.util.testing.assert_frame_equal(
+        hs._sliced_by_id_or_ids_and_time_index(df, id, start, end),
+        by_time.loc[id_slice, :])
+    assert (hs.count_of_data_points_for_select_id(df, id) == by_id.count()).all()
+
+
+@pytest.mark.parametrize("tempdir, sensor_id, location_id, states, postal_file",
+                         [(tmpdir(), SENSOR_ID1, LOCATION_ID1, STATE,
+                           TEST_POSTAL_FILE)])
+def test_metadata_registry_reloads_modified_file(tempdir, sensor_id, location_id,
+                                                 states, postal_file):
+    sensors_file = str(tempdir.join(os.path.basename(TEST_SENSORS_FILE)))
+    with open(TEST_SENSORS_FILE) as fin:
+        lines = fin.readlines()
+    with open(sensors_file, 'w') as fout:
+        fout.writelines(lines)
+    kwargs = {'states': states, 'sensors_file': sensors_file,
+              'postal_file': postal_file}
+
+    for _ in range(2):
+        assert hs.location_id_of_sensor(sensor_id, sensors_file) == location_id
+        assert str(sensor_id) in ct._sensors_ids_in_states(**kwargs)
+
+    # Only the header remains, and the size of the file changes
+    with open(sensors_file, 'w') as fout:
+        fout.write(lines[0])
+    assert len(ct._sensors_ids_in_states(**kwargs)) == 0
+    with pytest.raises(KeyError):
+        hs.location_id_of_sensor(sensor_id, sensors_file)
+    assert clear_metadata_cache(sensors_file) > 0
+    assert clear_metadata_cache(sensors_file) == 0
+
+
 #
 # @slow
 # @pytest.mark.parametrize("df, id, minimum_records",